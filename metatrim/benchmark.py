@@ -0,0 +1,201 @@
+"""
+benchmark
+
+by M. R. Snyder 2018.
+Written for Python 3
+
+Throughput benchmarks for MetaTrim on synthetic reads from simfastq. One run simulates a sample and
+times:
+
+DegPrimers: building the primer matchers for 0 to --max-errors errors
+TrimPrimers: trimming every forward read in memory, in reads per second
+SpacerCount: counting spacers at the start of the forward file
+MetaTrim: trimming the sample end to end from fastq.gz to trimmed fastq, in read pairs per second
+
+Peak resident memory (of this process, and of worker processes with --workers) is recorded after
+each stage, along with md5 checksums of the decompressed trimmed files so that a faster version can
+be checked against the output of an older one. Results are written as JSON. --compare prints the
+speed of this run against an earlier results file.
+
+Usage:
+python benchmark.py [--reads N] [--primer-set NAME] [--length N] [--substitutions RATE]
+[--spacers Y/N] [--index-hops FRACTION] [--errors N] [--max-errors N] [--workers N] [--gzip LEVEL]
+[--seed N] [--keep DIR] [--out FILE] [--compare FILE]
+"""
+
+import io
+import os
+import sys
+import gzip
+import json
+import time
+import hashlib
+import platform
+import tempfile
+import contextlib
+import subprocess
+try:
+    import resource
+except ImportError:
+    resource = None
+from metatrim import DegPrimers, TrimPrimers, SpacerCount, MetaTrim, PrimerSetPrimers, MarkerLength, \
+    TrimCutoff
+from options import PopOption
+from fastqio import ReadFastq
+from simfastq import SimulateSample
+
+#Peak resident memory in kilobytes of this process and of its finished child processes, or None
+#without the resource module (Windows)
+def PeakRSS():
+    if resource is None:
+        return None, None
+    Scale = 1024 if sys.platform == 'darwin' else 1
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // Scale, \
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // Scale
+
+#Run Function with its printing silenced. Returns (seconds, result)
+def Timed(Function, *Args, **Kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        Start = time.perf_counter()
+        Result = Function(*Args, **Kwargs)
+        Seconds = time.perf_counter() - Start
+    return Seconds, Result
+
+def StageResult(Seconds, **Counts):
+    Result = {'Seconds': round(Seconds, 6)}
+    Result.update(Counts)
+    Result['PeakRSSKB'], Result['PeakChildRSSKB'] = PeakRSS()
+    return Result
+
+#md5 of a fastq or fastq.gz file's decompressed contents
+def Checksum(Path):
+    Opener = gzip.open if Path.endswith('.gz') else open
+    Digest = hashlib.md5()
+    with Opener(Path, 'rb') as infile:
+        for Block in iter(lambda: infile.read(1 << 20), b''):
+            Digest.update(Block)
+    return Digest.hexdigest()
+
+#Matcher build time for each number of allowed errors
+def BenchDegPrimers(PrimerDict, MaxErrors=4, Repeat=100):
+    Results = []
+    for Errors in range(MaxErrors + 1):
+        ErrorDict = {'pF': Errors, 'pR': Errors}
+        Seconds = Timed(lambda: [DegPrimers(PrimerDict, ErrorDict) for n in range(Repeat)])[0]
+        Results.append(StageResult(Seconds / Repeat, Errors=Errors))
+    return Results
+
+#Trimming speed of every forward read in Path, read into memory first
+def BenchTrimPrimers(Path, PrimerDict, Errors, Length):
+    Reads = [Read[1] for Batch in ReadFastq(Path, Decode=False) for Read in Batch]
+    Matchers = Timed(DegPrimers, PrimerDict, {'pF': Errors, 'pR': Errors})[1]
+    Seconds, Trimmed = Timed(lambda: sum(1 for Read in Reads \
+        if TrimPrimers(Read, Matchers['pF'], Matchers['pR'], Length) is not None))
+    return StageResult(Seconds, Reads=len(Reads), Trimmed=Trimmed, ReadsPerSec=round(len(Reads) / Seconds))
+
+def BenchSpacerCount(Path):
+    Seconds, Spacer = Timed(SpacerCount, Path)
+    return StageResult(Seconds, Spacer=Spacer)
+
+#Trim one sample end to end in Dir, as metatrim.py would from that parent directory
+def BenchMetaTrim(Dir, InForward, InReverse, PrimerSet, Errors, Length, Spacers, Cutoff, Workers=1, Compress=0):
+    Cwd = os.getcwd()
+    os.chdir(Dir)
+    try:
+        Seconds, Row = Timed(MetaTrim, os.path.relpath(InForward), os.path.relpath(InReverse), PrimerSet, '', '', \
+            Errors, Errors, Length, Spacers, Cutoff, Workers=Workers, Compress=Compress)
+        ResDirName = os.path.basename(os.getcwd())+'TrimmedFastqs'
+        Checksums = {}
+        for Name in sorted(os.listdir(ResDirName)):
+            Checksums[Name] = Checksum(os.path.join(ResDirName, Name))
+    finally:
+        os.chdir(Cwd)
+    Reads = int(Row.split('\t')[1])
+    return StageResult(Seconds, Reads=Reads, ReadsPerSec=round(Reads / Seconds), Summary=Row.rstrip('\n'), \
+        Checksums=Checksums)
+
+#Simulate a sample in Dir and run every benchmark on it
+def Benchmark(Dir, Reads=100000, PrimerSet='CYPPART', Length=0, Substitutions=0.01, Spacers=True, \
+    IndexHops=0.02, Errors=2, MaxErrors=4, Workers=1, Compress=0, Seed=0):
+    PrimerSet = PrimerSet.upper()
+    Settings = {'Reads': Reads, 'PrimerSet': PrimerSet, 'Length': Length, 'Substitutions': Substitutions, \
+        'Spacers': Spacers, 'IndexHops': IndexHops, 'Errors': Errors, 'MaxErrors': MaxErrors, 'Workers': Workers, \
+        'Compress': Compress, 'Seed': Seed}
+    Results = {'Settings': Settings, 'Python': platform.python_version(), 'Platform': platform.platform(), \
+        'Commit': GitCommit()}
+    Start = time.perf_counter()
+    InForward, InReverse = SimulateSample(Dir, 'sim01', Reads, PrimerSet, Length, \
+        Substitutions=Substitutions, Spacer='e' if Spacers else None, IndexHops=IndexHops, Seed=Seed)
+    Results['Simulate'] = StageResult(time.perf_counter() - Start)
+    PrimerDict = PrimerSetPrimers(PrimerSet, '', '')
+    Length = MarkerLength(PrimerSet, Length or PrimerSet)
+    Cutoff = TrimCutoff(Length) if Length else 50
+    print ('Timing DegPrimers.')
+    Results['DegPrimers'] = BenchDegPrimers(PrimerDict, MaxErrors)
+    print ('Timing TrimPrimers.')
+    Results['TrimPrimers'] = BenchTrimPrimers(InForward, PrimerDict, Errors, Length)
+    print ('Timing SpacerCount.')
+    Results['SpacerCount'] = BenchSpacerCount(InForward)
+    print ('Timing MetaTrim.')
+    Results['MetaTrim'] = BenchMetaTrim(Dir, InForward, InReverse, PrimerSet, Errors, Length, \
+        'Y' if Spacers else 'N', Cutoff, Workers, Compress)
+    return Results
+
+#Commit of the MetaTrim checkout being benchmarked, if it is a git checkout
+def GitCommit():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True, \
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+#Print the speed of New against an Old results file and whether the trimmed output is the same
+def Compare(Old, New):
+    print ('Stage\tOld\tNew\tSpeedup')
+    Stages = [('DegPrimers %d errors' % Old['DegPrimers'][n]['Errors'], Old['DegPrimers'][n], New['DegPrimers'][n]) \
+        for n in range(min(len(Old['DegPrimers']), len(New['DegPrimers'])))]
+    Stages += [(Stage, Old[Stage], New[Stage]) for Stage in ('TrimPrimers', 'SpacerCount', 'MetaTrim')]
+    for Stage, OldResult, NewResult in Stages:
+        print ('%s\t%.6gs\t%.6gs\t%.2fx' % (Stage, OldResult['Seconds'], NewResult['Seconds'], \
+            OldResult['Seconds'] / max(NewResult['Seconds'], 1e-9)))
+    #Workers, compression and the error range timed for DegPrimers do not change the trimmed reads
+    Same = [Setting for Setting in New['Settings'] if Setting not in ('Workers', 'Compress', 'MaxErrors')]
+    if [Old['Settings'].get(Setting) for Setting in Same] != [New['Settings'][Setting] for Setting in Same]:
+        print ('Settings differ, so the trimmed output cannot be compared.')
+    elif Old['MetaTrim']['Checksums'] == New['MetaTrim']['Checksums']:
+        print ('Trimmed output is identical.')
+    else:
+        print ('Trimmed output DIFFERS.')
+
+if __name__ == "__main__":
+    Settings = {'Reads': int(PopOption(sys.argv, '--reads', 100000)), \
+        'PrimerSet': PopOption(sys.argv, '--primer-set', 'CYPPART'), \
+        'Length': int(PopOption(sys.argv, '--length', 0)), \
+        'Substitutions': float(PopOption(sys.argv, '--substitutions', 0.01)), \
+        'Spacers': PopOption(sys.argv, '--spacers', 'Y').upper() == 'Y', \
+        'IndexHops': float(PopOption(sys.argv, '--index-hops', 0.02)), \
+        'Errors': int(PopOption(sys.argv, '--errors', 2)), \
+        'MaxErrors': int(PopOption(sys.argv, '--max-errors', 4)), \
+        'Workers': int(PopOption(sys.argv, '--workers', 1)), \
+        'Compress': int(PopOption(sys.argv, '--gzip', 0)), \
+        'Seed': int(PopOption(sys.argv, '--seed', 0))}
+    Keep = PopOption(sys.argv, '--keep')
+    OutFile = PopOption(sys.argv, '--out', 'metatrim_benchmark.json')
+    CompareFile = PopOption(sys.argv, '--compare')
+    if len(sys.argv) != 1:
+        print (__doc__)
+        exit()
+    if Keep:
+        os.makedirs(Keep, exist_ok=True)
+        Results = Benchmark(Keep, **Settings)
+    else:
+        with tempfile.TemporaryDirectory(prefix='metatrimbench') as Dir:
+            Results = Benchmark(Dir, **Settings)
+    with open(OutFile, 'w') as outfile:
+        json.dump(Results, outfile, indent=2)
+    print ('TrimPrimers:', Results['TrimPrimers']['ReadsPerSec'], 'reads/sec')
+    print ('MetaTrim:', Results['MetaTrim']['ReadsPerSec'], 'read pairs/sec')
+    print ('Results written to', OutFile)
+    if CompareFile:
+        with open(CompareFile) as infile:
+            Compare(json.load(infile), Results)
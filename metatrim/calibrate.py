@@ -0,0 +1,119 @@
+"""
+calibrate
+
+by M. R. Snyder 2018.
+Written for Python 3
+
+Primer error tolerance calibration for MetaTrim. Instead of guessing how many errors to allow in each
+primer, a sample of read pairs is drawn evenly from the whole of a sample's files by reservoir
+sampling, and the pairs MetaTrim would trim from it are counted at every combination of 0 to N
+forward and reverse primer errors. More allowed errors recover pairs with sequencing errors in their
+primers until the count levels off, after which they only add spurious hits. The recommended
+tolerance is the fewest errors, ErrF + ErrR, whose trimmed pairs are within Loss of the most trimmed
+at any tolerance tried, the measured primer search time breaking ties.
+
+A primer search returns the hit with the fewest errors in the read, so a read is found at every
+tolerance from its hit's errors up, at the same place. Each sampled read is therefore searched once,
+at the most errors tried, and the trimmed pairs of every combination are worked out from the errors
+of its hits. Each tolerance is then timed on its own over the sampled reads for the cost columns.
+
+Pairs are counted as in the 'Seqs F & R Trimmed' column of the trim summary, before spacer and
+quality filtering. Sampled pairs whose read names differ, from files that are not in the same
+order, count towards the trimmed reads of each direction only. If no sampled pair matches, the
+recommendation uses the trimmed reads instead.
+"""
+
+import math
+import random
+
+#Draw Size items evenly from batches of items, reading each batch once. Algorithm L (Li 1994) skips
+#straight to the next item taken, so most batches are passed over without drawing random numbers.
+def ReservoirSample(Batches, Size, Seed=None):
+    Random = random.Random(Seed)
+    Sample = []
+    Seen = 0
+    Weight = math.exp(-Random.expovariate(1.0) / Size)
+    Next = Size + Skip(Random, Weight)
+    for Batch in Batches:
+        if len(Sample) < Size:
+            Sample.extend(Batch[:Size - len(Sample)])
+        while Next < Seen + len(Batch):
+            Sample[Random.randrange(Size)] = Batch[Next - Seen]
+            Weight *= math.exp(-Random.expovariate(1.0) / Size)
+            Next += Skip(Random, Weight) + 1
+        Seen += len(Batch)
+    return Sample
+
+#Items to pass over before the next one a reservoir takes
+def Skip(Random, Weight):
+    if Weight >= 1.0:
+        return 0
+    return int(-Random.expovariate(1.0) / math.log1p(-Weight))
+
+#(primer set number, length) of the target MetaTrim would trim from a read with primer hit Hit when
+#Errors are allowed in its primer and OppErrors in the opposite primer, or None if it is not trimmed.
+#Hit is (primer set number, target start, errors, opposite primer target end or None, opposite
+#primer errors, read length, whether the target starts with one of MetaTrim's Bases).
+def TargetLength(Hit, Errors, OppErrors, Lengths):
+    if Hit is None or Hit[2] > Errors or not Hit[6]:
+        return None
+    Marker, Start = Hit[0], Hit[1]
+    if Lengths[Marker]:
+        End = min(Start + Lengths[Marker], Hit[5])
+    elif Hit[3] is not None and Hit[4] <= OppErrors:
+        End = Hit[3]
+    else:
+        End = Hit[5]
+    if End <= Start:
+        return None
+    return Marker, End - Start
+
+#Trimmed reads and pairs at each combination of forward and reverse primer errors up to MaxErrors.
+#FHits and RHits are the primer hits of the sampled forward and reverse reads, Paired whether each
+#sampled pair's read names match, and Seconds the (primer, opposite primer) search seconds of each
+#direction at each number of errors, as {'F': [...], 'R': [...]}.
+def CalibrationTable(FHits, RHits, Paired, Seconds, Lengths, Cutoffs, MaxErrors):
+    Rows = []
+    for ErrF in range(MaxErrors + 1):
+        for ErrR in range(MaxErrors + 1):
+            FTrimmed = 0
+            RTrimmed = 0
+            Pairs = 0
+            for FHit, RHit, Pair in zip(FHits, RHits, Paired):
+                F = TargetLength(FHit, ErrF, ErrR, Lengths)
+                R = TargetLength(RHit, ErrR, ErrF, Lengths)
+                FTrimmed += F is not None
+                RTrimmed += R is not None
+                if Pair and F is not None and R is not None and F[0] == R[0] \
+                    and F[1] > Cutoffs[F[0]] and R[1] > Cutoffs[F[0]]:
+                    Pairs += 1
+            Search = Seconds['F'][ErrF][0] + Seconds['R'][ErrR][0] + Seconds['F'][ErrR][1] + Seconds['R'][ErrF][1]
+            Rows.append({'ErrF': ErrF, 'ErrR': ErrR, 'Sampled': len(Paired), 'FTrimmed': FTrimmed, \
+                'RTrimmed': RTrimmed, 'Pairs': Pairs, \
+                'Microseconds': round(1e6 * Search / len(Paired), 2) if Paired else 0.0})
+    #Trimmed pairs are the yield when the sampled pairs could be paired at all
+    Field = 'Pairs' if any(Paired) else 'Reads'
+    Most = max([Row['Pairs'] if Field == 'Pairs' else Row['FTrimmed'] + Row['RTrimmed'] for Row in Rows] + [0])
+    for Row in Rows:
+        Yield = Row['Pairs'] if Field == 'Pairs' else Row['FTrimmed'] + Row['RTrimmed']
+        Row['Yield'] = Yield
+        Row['Share'] = Yield / Most if Most else 1.0
+    return Rows
+
+#The row of the fewest errors that trims at least 1 - Loss of the most pairs trimmed, the faster
+#primer search breaking ties
+def Recommend(Rows, Loss=0.005):
+    Enough = [Row for Row in Rows if Row['Share'] >= 1.0 - Loss]
+    return min(Enough, key=lambda Row: (Row['ErrF'] + Row['ErrR'], Row['Microseconds'], Row['ErrF']))
+
+#Write the calibration table of every sample, one row per combination of errors, with the
+#recommended row of each sample marked. Samples are (sample, rows, recommended row).
+def WriteCalibration(Path, Samples):
+    with open(Path, 'w') as outfile:
+        outfile.write('\t'.join(['Sample', 'F Errors', 'R Errors', 'Sampled Pairs', 'F Seqs Trimmed', \
+            'R Seqs Trimmed', 'Seqs F & R Trimmed', '% of Most Trimmed', 'Search us/Pair', 'Recommended']) + '\n')
+        for Sample, Rows, Best in Samples:
+            for Row in Rows:
+                outfile.write('\t'.join([Sample] + [str(Row[Field]) for Field in ('ErrF', 'ErrR', 'Sampled', \
+                    'FTrimmed', 'RTrimmed', 'Pairs')] + ['%.2f' % (100.0 * Row['Share']), \
+                    '%.2f' % Row['Microseconds'], 'Y' if Row is Best else '']) + '\n')
@@ -0,0 +1,177 @@
+"""
+derep
+
+by M. R. Snyder 2018.
+Written for Python 3
+
+Dereplication of trimmed read pairs. PairDereplicator counts each distinct (forward sequence, reverse
+sequence) pair that MetaTrim keeps and writes every distinct pair once, as a forward and a reverse
+fastq file, most abundant first. Both reads of a pair are named after the first read pair with that
+sequence, followed by ';size=' and the number of copies, which vsearch and usearch read as the
+abundance.
+
+Quality scores of the copies of a pair are combined, position by position, by:
+
+mean: the mean quality score (rounded)
+max: the highest quality score
+first: the quality scores of the first copy
+
+Quality scores of up to Fold copies are kept and combined together, so the scores of a common pair
+are not added up one copy at a time. Counts are kept in memory for at most MaxUnique distinct pairs.
+When there are more, the counts are spilled to disk in buckets by sequence and each bucket is
+combined on its own at the end, so the output is the same whatever MaxUnique is.
+"""
+
+import os
+import zlib
+import heapq
+import time
+
+Qualities = ('mean', 'max', 'first')
+
+class PairDereplicator:
+    """Abundance of every distinct trimmed read pair of a sample."""
+
+    def __init__(self, Dir, Quality='mean', MaxUnique=250000, Partitions=32, Fold=64):
+        if Quality not in Qualities:
+            raise ValueError('Unknown quality %s. Use one of %s' % (Quality, ', '.join(Qualities)))
+        self.Dir = Dir
+        self.Quality = Quality
+        self.MaxUnique = MaxUnique
+        self.Partitions = Partitions
+        self.Fold = Fold
+        self.Pairs = {}
+        self.TempDir = None
+        self.Files = None
+        self.Seconds = 0.0
+
+    #Count one (name line, sequence, quality) forward record and its reverse record
+    def add(self, FRecord, RRecord):
+        Start = time.perf_counter()
+        Key = (FRecord[1], RRecord[1])
+        Entry = self.Pairs.get(Key)
+        #Entries are [count, name, forward qualities, reverse qualities], each list of qualities
+        #holding the combined scores so far and the copies not yet combined
+        if Entry is None:
+            self.Pairs[Key] = [1, FRecord[0], [FRecord[2]], [RRecord[2]]]
+            if len(self.Pairs) >= self.MaxUnique:
+                self._spill()
+        else:
+            Entry[0] += 1
+            if self.Quality != 'first':
+                Entry[2].append(FRecord[2])
+                Entry[3].append(RRecord[2])
+                if len(Entry[2]) >= self.Fold:
+                    self._fold(Entry)
+        self.Seconds += time.perf_counter() - Start
+
+    #Combine the qualities of an entry into one
+    def _fold(self, Entry):
+        for n in (2, 3):
+            if len(Entry[n]) == 1:
+                continue
+            if self.Quality == 'mean':
+                Entry[n] = [list(map(sum, zip(*Entry[n])))]
+            else:
+                Entry[n] = [bytes(map(max, zip(*Entry[n])))]
+
+    def _encode(self, Qual):
+        if self.Quality == 'mean':
+            return b','.join(b'%d' % n for n in Qual)
+        return Qual
+
+    def _decode(self, Qual):
+        if self.Quality == 'mean':
+            return [int(n) for n in Qual.split(b',')]
+        return Qual
+
+    #Final quality line of a combined quality
+    def _quality(self, Qual, Count):
+        if self.Quality == 'mean' and Count > 1:
+            return bytes((n + Count // 2) // Count for n in Qual)
+        return bytes(Qual)
+
+    #Move the counts in memory to the bucket files
+    def _spill(self):
+        if self.Files is None:
+            import tempfile
+            self.TempDir = tempfile.TemporaryDirectory(prefix='metatrimderep', dir=self.Dir)
+            self.Files = [open(os.path.join(self.TempDir.name, 'D%d' % n), 'wb') for n in range(self.Partitions)]
+        for (FSeq, RSeq), Entry in self.Pairs.items():
+            self._fold(Entry)
+            Count, Name, (FQual,), (RQual,) = Entry
+            self.Files[zlib.crc32(FSeq + RSeq) % self.Partitions].write(b'\t'.join((FSeq, RSeq, b'%d' % Count, Name, \
+                self._encode(FQual), self._encode(RQual))) + b'\n')
+        self.Pairs = {}
+
+    #Distinct pairs of a bucket file, combined over every spill
+    def _bucket(self, Path):
+        Pairs = {}
+        with open(Path, 'rb') as infile:
+            for line in infile:
+                FSeq, RSeq, Count, Name, FQual, RQual = line.rstrip(b'\n').split(b'\t')
+                Entry = Pairs.get((FSeq, RSeq))
+                if Entry is None:
+                    Pairs[(FSeq, RSeq)] = [int(Count), Name, [self._decode(FQual)], [self._decode(RQual)]]
+                elif self.Quality == 'first':
+                    Entry[0] += int(Count)
+                else:
+                    Entry[0] += int(Count)
+                    Entry[2].append(self._decode(FQual))
+                    Entry[3].append(self._decode(RQual))
+                    if len(Entry[2]) >= self.Fold:
+                        self._fold(Entry)
+        return Pairs
+
+    #Distinct pairs as (count, forward sequence, reverse sequence, name, forward quality, reverse
+    #quality), most abundant first and then in sequence order
+    def _sorted(self, Pairs):
+        Entries = []
+        for (FSeq, RSeq), Entry in Pairs.items():
+            self._fold(Entry)
+            Count, Name, (FQual,), (RQual,) = Entry
+            Entries.append((Count, FSeq, RSeq, Name, self._quality(FQual, Count), self._quality(RQual, Count)))
+        Entries.sort(key=lambda Entry: (-Entry[0], Entry[1], Entry[2]))
+        return Entries
+
+    def _entries(self):
+        if self.Files is None:
+            yield from self._sorted(self.Pairs)
+            return
+        self._spill()
+        Sorted = []
+        for outfile in self.Files:
+            outfile.close()
+            with open(outfile.name + 'sorted', 'wb') as sortfile:
+                for Entry in self._sorted(self._bucket(outfile.name)):
+                    sortfile.write(b'\t'.join((b'%d' % Entry[0],) + Entry[1:]) + b'\n')
+            os.remove(outfile.name)
+            Sorted.append(open(outfile.name + 'sorted', 'rb'))
+        try:
+            for line in heapq.merge(*[(tuple(line.rstrip(b'\n').split(b'\t')) for line in infile) \
+                for infile in Sorted], key=lambda Fields: (-int(Fields[0]), Fields[1], Fields[2])):
+                yield (int(line[0]),) + line[1:]
+        finally:
+            for infile in Sorted:
+                infile.close()
+
+    #Write every distinct pair to the forward and reverse FastqWriters. Returns the number of pairs, of
+    #distinct pairs, of pairs seen once and the abundance of the most common pair.
+    def write(self, Foutfile, Routfile):
+        Start = time.perf_counter()
+        Stats = [0, 0, 0, 0]
+        try:
+            for Count, FSeq, RSeq, Name, FQual, RQual in self._entries():
+                Name = Name.split(None, 1)[0] + b';size=%d' % Count
+                Foutfile.write((Name, FSeq, FQual))
+                Routfile.write((Name, RSeq, RQual))
+                Stats[0] += Count
+                Stats[1] += 1
+                Stats[2] += Count == 1
+                Stats[3] = max(Stats[3], Count)
+        finally:
+            self.Pairs = {}
+            if self.TempDir is not None:
+                self.TempDir.cleanup()
+        self.Seconds += time.perf_counter() - Start
+        return Stats
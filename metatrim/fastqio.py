@@ -0,0 +1,665 @@
+"""
+fastqio
+
+by M. R. Snyder 2018.
+Written for Python 3
+
+Fastq reading for MetaTrim. ReadFastq reads large blocks of decompressed data and splits them
+into records in bulk, so there is no per line decoding or list building. Plain .fastq files and
+gzipped .fastq.gz files are both accepted. Gzipped files can be decompressed by:
+
+auto: pigz or igzip if one is installed, otherwise zlib
+pigz: a multithreaded pigz subprocess
+igzip: an Intel ISA-L igzip subprocess
+zlib: zlib in this process with large input buffers
+gzip: the Python gzip module
+
+FastqWriter writes trimmed records in large batches, as plain fastq or as fastq.gz. Gzipped output
+is compressed by a pigz subprocess if one is installed, or as independent gzip members by a pool of
+threads (zlib releases the GIL while it compresses). Any gzip reader, including the one DADA2 uses,
+reads multi-member files as one stream.
+
+With the bgzf compressor, fastq.gz output is written as BGZF, the blocked gzip of samtools and
+htslib: gzip members of at most 65280 decompressed bytes, so a reader can start at any member. Next
+to each file, FastqWriter writes an index of where every IndexEvery-th record starts (<file>.idx) and
+of where each read starts by name (<file>.names.gz). FastqIndex reads the index, ReadRange reads a
+range of records without decompressing the file before it, and FetchReads finds reads by name.
+
+For streaming, '-' reads stdin, plain or gzipped, ReadInterleaved splits an interleaved file into
+forward and reverse batches, and FastqWriter also writes to an open file such as stdout.
+
+SampleFastq reads runs of records from places spread through a file, for previews that should not
+read a whole file. Plain files are read at any place, and gzip files of many members, such as BGZF,
+from the first member after it, found by trying each gzip header it could start with.
+"""
+
+import os
+import sys
+import gzip
+import time
+import zlib
+import shutil
+import struct
+import subprocess
+import collections
+
+Decompressors = ('auto', 'pigz', 'igzip', 'zlib', 'gzip')
+
+#Commands that write a decompressed gzip file to stdout
+DecompressCommands = {'pigz': ['pigz', '-dc'],
+                      'igzip': ['igzip', '-dc']
+                      }
+
+Compressors = ('auto', 'pigz', 'threads', 'bgzf')
+
+#Size of decompressed blocks split into records at a time
+BlockSize = 1 << 22
+
+#Size of output batches written or compressed at a time
+WriteSize = 1 << 22
+
+#Decompressed bytes in each BGZF block, which leaves room for incompressible data in the 64 KB limit
+BgzfBlockSize = 0xff00
+
+#Gzip header of a BGZF block up to its block size field, and the empty block that ends a BGZF file
+BgzfHeader = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+BgzfEOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+#A gzip file starts with these two bytes whatever its name is
+def IsGzipped(Path):
+    with open(Path, 'rb') as infile:
+        return infile.read(2) == b'\x1f\x8b'
+
+#Pick the decompressor 'auto' stands for and check that a requested tool is installed
+def FindDecompressor(Decompress='auto'):
+    if Decompress in DecompressCommands and not shutil.which(DecompressCommands[Decompress][0]):
+        raise OSError(Decompress+' is not installed')
+    if Decompress != 'auto':
+        return Decompress
+    for Tool in ('pigz', 'igzip'):
+        if shutil.which(Tool):
+            return Tool
+    return 'zlib'
+
+#Decompressed output of a pigz or igzip subprocess
+class ProcessReader:
+    def __init__(self, Command, Path):
+        self.Command = Command
+        self.Process = subprocess.Popen(Command + [Path], stdout=subprocess.PIPE, bufsize=BlockSize)
+        self.Finished = False
+
+    def read(self, Size=-1):
+        Data = self.Process.stdout.read(Size)
+        if not Data:
+            self.Finished = True
+        return Data
+
+    def close(self):
+        self.Process.stdout.close()
+        if self.Finished:
+            if self.Process.wait() != 0:
+                raise OSError('%s failed with exit code %d' % (' '.join(self.Command), self.Process.returncode))
+        elif self.Process.poll() is None:
+            self.Process.terminate()
+            self.Process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *Error):
+        self.close()
+
+#Streaming zlib decompression of a (possibly multi-member) gzip file, or an open binary file, with
+#large input reads
+class ZlibReader:
+    def __init__(self, Path, ChunkSize=1 << 20):
+        self.File = open(Path, 'rb') if isinstance(Path, str) else Path
+        self.ChunkSize = ChunkSize
+        self.Decompressor = zlib.decompressobj(31)
+
+    #Start reading again from a gzip member at Offset in the file
+    def seek(self, Offset):
+        self.File.seek(Offset)
+        self.Decompressor = zlib.decompressobj(31)
+
+    #Returns the next decompressed chunk, which may be longer or shorter than Size
+    def read(self, Size=-1):
+        while True:
+            Chunk = self.File.read(self.ChunkSize)
+            if not Chunk:
+                return self.Decompressor.flush()
+            Data = self.Decompressor.decompress(Chunk)
+            while self.Decompressor.eof and self.Decompressor.unused_data:
+                Rest = self.Decompressor.unused_data
+                self.Decompressor = zlib.decompressobj(31)
+                Data += self.Decompressor.decompress(Rest)
+            if Data:
+                return Data
+
+    def close(self):
+        self.File.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *Error):
+        self.close()
+
+#Open a fastq or fastq.gz file, or stdin for '-', for reading decompressed bytes
+def OpenFastq(Path, Decompress='auto'):
+    if Path == '-':
+        return OpenStream(sys.stdin.buffer, Decompress)
+    if not IsGzipped(Path):
+        return open(Path, 'rb', buffering=BlockSize)
+    Decompress = FindDecompressor(Decompress)
+    if Decompress in DecompressCommands:
+        return ProcessReader(DecompressCommands[Decompress], Path)
+    elif Decompress == 'zlib':
+        return ZlibReader(Path)
+    elif Decompress == 'gzip':
+        return gzip.open(Path, 'rb')
+    raise ValueError('Unknown decompressor %s. Use one of %s' % (Decompress, ', '.join(Decompressors)))
+
+#Read decompressed bytes from an open binary stream such as stdin, plain or gzipped. Bytes already
+#taken from a pipe cannot be handed to a pigz or igzip subprocess, so gzipped streams are
+#decompressed with zlib, or the gzip module if asked for.
+def OpenStream(File, Decompress='auto'):
+    if File.peek(2)[:2] != b'\x1f\x8b':
+        return File
+    if Decompress == 'gzip':
+        return gzip.GzipFile(fileobj=File, mode='rb')
+    return ZlibReader(File)
+
+#Split complete fastq lines into (name line, sequence, quality) records
+def SplitRecords(Lines, Decode):
+    if Decode:
+        Lines = b'\n'.join(Lines).decode('ascii').split('\n')
+    return list(zip(Lines[0::4], Lines[1::4], Lines[3::4]))
+
+#Yield batches of (name line, sequence, quality) records from a fastq or fastq.gz file.
+#Records are str, or bytes with Decode=False.
+def ReadFastq(Path, BatchSize=10000, Decompress='auto', Decode=True):
+    with OpenFastq(Path, Decompress) as infile:
+        yield from ReadRecords(infile, BatchSize, Decode)
+
+#Yield batches of records from an open file of decompressed fastq
+def ReadRecords(infile, BatchSize=10000, Decode=True):
+    Batch = []
+    Carry = b''
+    while True:
+        Block = infile.read(BlockSize)
+        if not Block:
+            break
+        if Carry:
+            Block = Carry + Block
+        if b'\r' in Block:
+            Block = Block.replace(b'\r', b'')
+        #Split the complete lines and carry any unfinished record into the next block
+        Cut = Block.rfind(b'\n')
+        if Cut < 0:
+            Carry = Block
+            continue
+        Lines = Block[:Cut].split(b'\n')
+        Extra = len(Lines) % 4
+        Carry = Block[Cut + 1:]
+        if Extra:
+            Carry = b'\n'.join(Lines[-Extra:]) + b'\n' + Carry
+            del Lines[-Extra:]
+        Batch.extend(SplitRecords(Lines, Decode))
+        if len(Batch) >= BatchSize:
+            Full = len(Batch) // BatchSize * BatchSize
+            for n in range(0, Full, BatchSize):
+                yield Batch[n:n + BatchSize]
+            Batch = Batch[Full:]
+    Lines = Carry.rstrip(b'\n').split(b'\n')
+    Batch.extend(SplitRecords(Lines[:len(Lines) // 4 * 4], Decode))
+    for n in range(0, len(Batch), BatchSize):
+        yield Batch[n:n + BatchSize]
+
+#Offset of the first whole fastq record in Data, which can start anywhere in a file, or -1. A record
+#starts with an @ line, and its third line starts with + and its fourth is as long as its second,
+#which quality lines starting with @ are not.
+def FirstRecord(Data):
+    Pos = -1
+    while True:
+        Pos = Data.find(b'@', Pos + 1)
+        if Pos < 0:
+            return -1
+        if Pos and Data[Pos - 1] != 10:
+            continue
+        Lines = Data[Pos:Pos + 65536].split(b'\n', 4)
+        if len(Lines) < 5:
+            return -1
+        if Lines[2][:1] == b'+' and len(Lines[1]) == len(Lines[3]):
+            return Pos
+
+#At least Size decompressed bytes of a gzip file of many gzip members, from the first member starting
+#at or after Offset. Returns the data, the offset of the member and the compressed bytes read from it,
+#or None if no member starts in the next Search bytes, as in a gzip file of one member.
+def GzipMemberData(infile, Offset, Size, Search=1 << 20):
+    infile.seek(Offset)
+    Window = infile.read(Search)
+    Pos = Window.find(b'\x1f\x8b\x08')
+    while Pos >= 0:
+        infile.seek(Offset + Pos)
+        Decompressor = zlib.decompressobj(31)
+        Data = []
+        Length = 0
+        Used = 0
+        try:
+            while Length < Size:
+                Chunk = infile.read(1 << 14)
+                if not Chunk:
+                    break
+                Used += len(Chunk)
+                Chunk = Decompressor.decompress(Chunk)
+                while Decompressor.eof and Decompressor.unused_data:
+                    Rest = Decompressor.unused_data
+                    Decompressor = zlib.decompressobj(31)
+                    Chunk += Decompressor.decompress(Rest)
+                Data.append(Chunk)
+                Length += len(Chunk)
+        except zlib.error:
+            #Bytes inside compressed data that only look like a gzip header
+            Pos = Window.find(b'\x1f\x8b\x08', Pos + 1)
+            continue
+        Data = b''.join(Data)
+        if FirstRecord(Data) >= 0:
+            return Data, Offset + Pos, Used
+        Pos = Window.find(b'\x1f\x8b\x08', Pos + 1)
+    return None
+
+#Up to Count records from places spread through a fastq or fastq.gz file, for a preview without
+#reading all of it. Place n starts at the first whole record after fraction Fractions[n] of the file.
+#Plain files are read there, and gzip files of many members, such as BGZF, from the first member after
+#it, and places in a gzip file's last member are left empty. With Distinct, places that would start in
+#bytes already read for another place, as several places do in a file of a few large gzip members, are
+#left empty too, so no record is returned twice. Returns the records read at each place and an estimate
+#of the records in the whole file, or None if most places are empty, as in a gzip file of one member,
+#which can only be read from its start.
+def SampleFastq(Path, Fractions, Count, RecordSize=1024, Distinct=True):
+    Size = os.path.getsize(Path)
+    Gzipped = IsGzipped(Path)
+    Places = []
+    Bytes = 0
+    Records = 0
+    Ratio = [0, 0]
+    Missed = 0
+    #(first, last) file bytes read for each place
+    Read = []
+    with open(Path, 'rb') as infile:
+        for Fraction in Fractions:
+            Offset = int(Fraction * Size)
+            if Gzipped:
+                Member = GzipMemberData(infile, Offset, Count * RecordSize)
+                if Member is None:
+                    Missed += 1
+                    Places.append([])
+                    continue
+                Data = Member[0]
+            else:
+                infile.seek(Offset)
+                Data = infile.read(Count * RecordSize)
+            Start = FirstRecord(Data)
+            if Start < 0:
+                Places.append([])
+                continue
+            Lines = Data[Start:Data.rfind(b'\n')].split(b'\n')
+            Lines = Lines[:len(Lines) // 4 * 4][:4 * Count]
+            Length = sum(len(Line) + 1 for Line in Lines)
+            Span = (Member[1], Member[1] + Member[2]) if Gzipped else (Offset + Start, Offset + Start + Length)
+            if Distinct and any(Span[0] < Last and First < Span[1] for First, Last in Read):
+                Missed += 1
+                Places.append([])
+                continue
+            if Gzipped:
+                Ratio[0] += len(Data)
+                Ratio[1] += Member[2]
+            Read.append(Span)
+            Places.append(SplitRecords(Lines, False))
+            Bytes += Length
+            Records += len(Lines) // 4
+    if 2 * Missed > len(Fractions):
+        return None
+    if not Records:
+        return Places, 0
+    #Decompressed bytes of a gzip file are estimated from the compression of the places read
+    Decompressed = Size * Ratio[0] / Ratio[1] if Gzipped and Ratio[1] else Size
+    return Places, int(round(Decompressed * Records / Bytes))
+
+#Batches of forward reads and batches of reverse reads from an interleaved fastq or fastq.gz file
+#('-' for stdin), where each forward read is followed by its reverse read. Either side can be read
+#ahead of the other, also from another thread, and the file is read once.
+def ReadInterleaved(Path, BatchSize=10000, Decompress='auto', Decode=False):
+    import threading
+    Batches = ReadFastq(Path, 2 * BatchSize, Decompress, Decode)
+    Lock = threading.Lock()
+    Waiting = (collections.deque(), collections.deque())
+    def Side(n):
+        while True:
+            with Lock:
+                if not Waiting[n]:
+                    Batch = next(Batches, None)
+                    if Batch is None:
+                        return
+                    if len(Batch) % 2:
+                        raise ValueError('%s ends with a forward read without its reverse read' % Path)
+                    Waiting[0].append(Batch[0::2])
+                    Waiting[1].append(Batch[1::2])
+                Batch = Waiting[n].popleft()
+            yield Batch
+    return Side(0), Side(1)
+
+#Pick the compressor 'auto' stands for and check that pigz is installed if it was asked for
+def FindCompressor(Compressor='auto'):
+    if Compressor == 'pigz' and not shutil.which('pigz'):
+        raise OSError('pigz is not installed')
+    if Compressor != 'auto':
+        return Compressor
+    if shutil.which('pigz'):
+        return 'pigz'
+    return 'threads'
+
+#BGZF blocks of Data, each holding at most BgzfBlockSize bytes of it
+def BgzfCompress(Data, Level):
+    Blocks = []
+    for n in range(0, len(Data), BgzfBlockSize):
+        Chunk = Data[n:n + BgzfBlockSize]
+        Compressor = zlib.compressobj(Level, zlib.DEFLATED, -15)
+        Deflated = Compressor.compress(Chunk) + Compressor.flush()
+        Blocks.append(BgzfHeader + struct.pack('<H', len(Deflated) + 25) + Deflated + \
+            struct.pack('<II', zlib.crc32(Chunk), len(Chunk)))
+    return Blocks
+
+#Index files written next to a BGZF fastq.gz file
+def IndexPaths(Path):
+    return [Path+'.idx', Path+'.names.gz']
+
+#Buffered fastq output. Level 0 writes plain fastq, levels 1-9 write fastq.gz using Threads
+#compression threads (or pigz processes). With the bgzf compressor the file is BGZF and is indexed
+#every IndexEvery records and by read name. With a Depth, batches are joined, compressed and written
+#by a thread of their own, with at most Depth batches waiting for it. Seconds adds up the time spent
+#joining, compressing and writing batches, and Waited the time the caller spent waiting for that thread.
+#Path can also be an open binary file such as stdout, which is flushed but left open by close.
+class FastqWriter:
+    def __init__(self, Path, Level=0, Threads=None, Compressor='auto', IndexEvery=10000, Depth=0):
+        self.Path = Path
+        self.Level = int(Level)
+        self.Threads = Threads or os.cpu_count() or 1
+        self.Buffer = []
+        self.Buffered = 0
+        self.Names = []
+        self.Records = 0
+        self.Seconds = 0.0
+        self.Waited = 0.0
+        self.Closed = False
+        self.Owned = isinstance(Path, str)
+        if self.Owned:
+            self.File = open(Path, 'wb')
+        else:
+            self.File = Path
+            self.Path = str(getattr(Path, 'name', 'stream'))
+        self.Process = None
+        self.Pool = None
+        self.Pending = collections.deque()
+        self.Queue = None
+        self.Error = None
+        self.Bgzf = bool(self.Level) and Compressor == 'bgzf'
+        if self.Bgzf:
+            #Decompressed offset of the next record and of every IndexEvery-th record, and the file
+            #offset of each block
+            self.Offset = 0
+            self.IndexEvery = IndexEvery
+            self.Starts = []
+            self.Blocks = []
+            self.Compressed = 0
+            self.Carry = b''
+            self.NameFile = gzip.open(IndexPaths(Path)[1], 'wb', compresslevel=1)
+            if self.Threads > 1:
+                from concurrent.futures import ThreadPoolExecutor
+                self.Pool = ThreadPoolExecutor(self.Threads)
+        elif self.Level:
+            Compressor = FindCompressor(Compressor)
+            if Compressor == 'pigz':
+                self.File.flush()
+                self.Process = subprocess.Popen(['pigz', '-c', '-%d' % self.Level, '-p', str(self.Threads)], \
+                    stdin=subprocess.PIPE, stdout=self.File)
+            elif self.Threads > 1:
+                from concurrent.futures import ThreadPoolExecutor
+                self.Pool = ThreadPoolExecutor(self.Threads)
+        if Depth:
+            import threading
+            from pipeline import StageQueue
+            self.Queue = StageQueue(os.path.basename(self.Path).replace('.part', ''), Depth, 'trimming', 'writer')
+            self.Thread = threading.Thread(target=self._writer, daemon=True)
+            self.Thread.start()
+
+    #Add one (name line, sequence, quality) record of bytes or bytes-like slices. The pieces are
+    #only joined once per batch.
+    def write(self, Record):
+        Name, Seq, Qual = Record
+        if self.Bgzf:
+            if self.Records % self.IndexEvery == 0:
+                self.Starts.append((self.Records, self.Offset))
+            self.Names += (Name[1:].split(None, 1)[0], b'\t%d\n' % self.Offset)
+            self.Offset += len(Name) + len(Seq) + len(Qual) + 5
+        self.Buffer += (Name, b'\n', Seq, b'\n+\n', Qual, b'\n')
+        self.Buffered += len(Name) + len(Seq) + len(Qual) + 6
+        self.Records += 1
+        if self.Buffered >= WriteSize:
+            self.flush()
+
+    #Write BGZF blocks, keeping the file offset of each
+    def _blocks(self, Blocks):
+        for Block in Blocks:
+            self.Blocks.append(self.Compressed)
+            self.Compressed += len(Block)
+            self.File.write(Block)
+
+    #Compress the whole BGZF blocks of Data and carry the rest to the next flush, unless Last
+    def _bgzf(self, Data, Names, Last=False):
+        Data = self.Carry + Data
+        Full = len(Data) if Last else len(Data) // BgzfBlockSize * BgzfBlockSize
+        self.Carry = Data[Full:]
+        if self.Pool is not None:
+            self.Pending.append(self.Pool.submit(BgzfCompress, Data[:Full], self.Level))
+            while len(self.Pending) > 2 * self.Threads:
+                self._blocks(self.Pending.popleft().result())
+        else:
+            self._blocks(BgzfCompress(Data[:Full], self.Level))
+        self.NameFile.write(b''.join(Names))
+
+    def flush(self):
+        if not self.Buffer:
+            return
+        Buffer, Names = self.Buffer, self.Names
+        self.Buffer = []
+        self.Names = []
+        self.Buffered = 0
+        if self.Queue is None:
+            self._write(Buffer, Names)
+        elif self.Error is not None:
+            raise self.Error
+        else:
+            self.Queue.put((Buffer, Names))
+
+    #Write queued batches until close. After an error, batches are taken and dropped so that the
+    #trimming thread is never left waiting, and the error is raised there.
+    def _writer(self):
+        while True:
+            Batch = self.Queue.get()
+            if Batch is None:
+                return
+            if self.Error is None:
+                try:
+                    self._write(*Batch)
+                except BaseException as Error:
+                    self.Error = Error
+
+    def _write(self, Buffer, Names):
+        Start = time.perf_counter()
+        Data = b''.join(Buffer)
+        if self.Bgzf:
+            self._bgzf(Data, Names)
+        elif not self.Level:
+            self.File.write(Data)
+        elif self.Process is not None:
+            self.Process.stdin.write(Data)
+        elif self.Pool is not None:
+            #Members are written in order, with at most two per thread waiting
+            self.Pending.append(self.Pool.submit(gzip.compress, Data, self.Level, mtime=0))
+            while len(self.Pending) > 2 * self.Threads:
+                self.File.write(self.Pending.popleft().result())
+        else:
+            self.File.write(gzip.compress(Data, self.Level, mtime=0))
+        self.Seconds += time.perf_counter() - Start
+
+    def close(self):
+        if self.Closed:
+            return
+        try:
+            self.flush()
+            if self.Queue is not None:
+                Start = time.perf_counter()
+                self.Queue.put(None)
+                self.Thread.join()
+                self.Waited = self.Queue.PutSeconds + time.perf_counter() - Start
+                if self.Error is not None:
+                    raise self.Error
+            Start = time.perf_counter()
+            if self.Bgzf:
+                self._bgzf(b'', [], True)
+                while self.Pending:
+                    self._blocks(self.Pending.popleft().result())
+                self.File.write(BgzfEOF)
+                self.NameFile.close()
+                self._index()
+            while self.Pending:
+                self.File.write(self.Pending.popleft().result())
+            if self.Process is not None:
+                self.Process.stdin.close()
+                if self.Process.wait() != 0:
+                    raise OSError('pigz failed writing %s' % self.Path)
+            self.Seconds += time.perf_counter() - Start
+        finally:
+            self.Closed = True
+            if self.Pool is not None:
+                self.Pool.shutdown()
+            if self.Owned:
+                self.File.close()
+            else:
+                self.File.flush()
+
+    #Write the record and block index of a BGZF file
+    def _index(self):
+        with open(IndexPaths(self.Path)[0], 'w') as outfile:
+            outfile.write('#BGZF\t%d\t%d\t%d\t%d\n' % (BgzfBlockSize, self.IndexEvery, self.Records, self.Offset))
+            outfile.write(''.join('R\t%d\t%d\n' % Start for Start in self.Starts))
+            outfile.write(''.join('B\t%d\n' % Block for Block in self.Blocks))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *Error):
+        self.close()
+
+class FastqIndex:
+    """Record and block index of a BGZF fastq.gz file written by FastqWriter."""
+
+    def __init__(self, Path):
+        self.Path = Path
+        self.Starts = []
+        self.Blocks = []
+        with open(IndexPaths(Path)[0]) as infile:
+            Header = infile.readline().rstrip('\n').split('\t')
+            if Header[0] != '#BGZF':
+                raise ValueError('%s is not a fastq index' % IndexPaths(Path)[0])
+            self.BlockSize, self.Every, self.Records, self.Length = [int(n) for n in Header[1:]]
+            for line in infile:
+                Fields = line.split('\t')
+                if Fields[0] == 'R':
+                    self.Starts.append((int(Fields[1]), int(Fields[2])))
+                else:
+                    self.Blocks.append(int(Fields[1]))
+
+    #File offset of the block holding a decompressed offset, and how far into the block it is
+    def locate(self, Offset):
+        return self.Blocks[Offset // self.BlockSize], Offset % self.BlockSize
+
+    #The nearest indexed record at or before Record, as (record, decompressed offset)
+    def start(self, Record):
+        return self.Starts[min(Record // self.Every, len(self.Starts) - 1)]
+
+    #Split the records into at most Count (start, stop) ranges of whole indexed chunks, for reading
+    #in parallel with ReadRange
+    def ranges(self, Count):
+        Chunks = len(self.Starts)
+        Bounds = sorted(set(self.Starts[Chunks * n // Count][0] for n in range(min(Count, Chunks))))
+        return list(zip(Bounds, Bounds[1:] + [self.Records]))
+
+    #Decompressed offsets of the reads named in Names (without '@'), from the read name index
+    def find(self, Names):
+        Wanted = set(Name.encode('ascii') if isinstance(Name, str) else Name for Name in Names)
+        Found = {}
+        with gzip.open(IndexPaths(self.Path)[1], 'rb') as infile:
+            for line in infile:
+                Name, Offset = line.rstrip(b'\n').rsplit(b'\t', 1)
+                if Name in Wanted:
+                    Found[Name] = int(Offset)
+        return Found
+
+#Decompressed data of an indexed BGZF file from any decompressed offset
+class BgzfReader(ZlibReader):
+    def __init__(self, Path, Index, Offset=0):
+        ZlibReader.__init__(self, Path, 1 << 16)
+        self.Index = Index
+        self.goto(Offset)
+
+    def goto(self, Offset):
+        Block, self.Skip = self.Index.locate(Offset)
+        self.seek(Block)
+
+    def read(self, Size=-1):
+        while self.Skip:
+            Data = ZlibReader.read(self, Size)
+            Cut = min(self.Skip, len(Data))
+            self.Skip -= Cut
+            if not Data or Data[Cut:]:
+                return Data[Cut:]
+        return ZlibReader.read(self, Size)
+
+#Yield batches of the records from Start up to Stop of an indexed BGZF fastq.gz file, decompressing
+#from the indexed record at or before Start
+def ReadRange(Path, Start=0, Stop=None, BatchSize=10000, Decode=True, Index=None):
+    Index = Index or FastqIndex(Path)
+    Stop = Index.Records if Stop is None else min(Stop, Index.Records)
+    if Start >= Stop:
+        return
+    Record, Offset = Index.start(Start)
+    with BgzfReader(Path, Index, Offset) as infile:
+        for Batch in ReadRecords(infile, BatchSize, Decode):
+            First = Record
+            Record += len(Batch)
+            Batch = Batch[max(0, Start - First):Stop - First]
+            if Batch:
+                yield Batch
+            if Record >= Stop:
+                return
+
+#Yield the records of the named reads of an indexed BGZF fastq.gz file in file order, decompressing
+#only the blocks they are in
+def FetchReads(Path, Names, Decode=True, Index=None):
+    Index = Index or FastqIndex(Path)
+    Offsets = sorted(Index.find(Names).values())
+    if not Offsets:
+        return
+    with BgzfReader(Path, Index, Offsets[0]) as infile:
+        for Offset in Offsets:
+            infile.goto(Offset)
+            Data = b''
+            while Data.count(b'\n') < 4:
+                Chunk = infile.read()
+                if not Chunk:
+                    break
+                Data += Chunk
+            yield SplitRecords(Data.replace(b'\r', b'').split(b'\n', 4)[:4], Decode)[0]
@@ -0,0 +1,87 @@
+"""
+manifest
+
+by M. R. Snyder 2018.
+Written for Python 3
+
+Run manifest for incremental MetaTrim runs. For every sample it trims, MetaTrimAll records the
+sample's input files (by size and modification time, or by content hash), the trim parameters, the
+trimmed files with their sizes, the sample's trim summary rows and its spacer counts. A later run with the same
+parameters skips a sample whose inputs and trimmed files are unchanged and reuses its rows.
+
+An entry is only written after the sample's trimmed files have been closed and renamed into place,
+and the manifest itself is replaced in one step after each sample, so an interrupted run resumes
+with the first sample that had not finished.
+"""
+
+import os
+import json
+import hashlib
+
+#Size and modification time of a file, or its size and md5 with Hash
+def FileSignature(Path, Hash=False):
+    Stat = os.stat(Path)
+    if not Hash:
+        return [Stat.st_size, Stat.st_mtime_ns]
+    Digest = hashlib.md5()
+    with open(Path, 'rb') as infile:
+        for Block in iter(lambda: infile.read(1 << 20), b''):
+            Digest.update(Block)
+    return [Stat.st_size, Digest.hexdigest()]
+
+class RunManifest:
+    """Finished samples of a parent directory, saved as JSON."""
+
+    def __init__(self, Path, Hash=False):
+        self.Path = Path
+        self.Hash = Hash
+        self.Samples = {}
+        try:
+            with open(Path) as infile:
+                self.Samples = json.load(infile).get('Samples', {})
+        except (OSError, ValueError):
+            pass
+
+    def _inputs(self, Inputs):
+        return [[Path, FileSignature(Path, self.Hash)] for Path in Inputs]
+
+    #Summary rows of a finished sample, or None if its inputs, parameters or trimmed files changed
+    def rows(self, Key, Inputs, Parameters):
+        Entry = self.Samples.get(Key)
+        #Compare the parameters as they come back from JSON, where tuples are lists
+        Parameters = json.loads(json.dumps(Parameters))
+        if Entry is None or Entry['Parameters'] != Parameters or Entry.get('Hash', False) != self.Hash:
+            return None
+        try:
+            if Entry['Inputs'] != self._inputs(Inputs):
+                return None
+            for Path, Size in Entry['Outputs']:
+                if os.path.getsize(Path) != Size:
+                    return None
+        except OSError:
+            return None
+        return Entry['Rows']
+
+    #Spacer counts recorded for a finished sample, or None
+    def spacers(self, Key):
+        return self.Samples.get(Key, {}).get('Spacers')
+
+    #Record a finished sample and save the manifest
+    def add(self, Key, Inputs, Parameters, Outputs, Rows, Spacers=None):
+        self.Samples[Key] = {'Inputs': self._inputs(Inputs), 'Parameters': Parameters, 'Hash': self.Hash, \
+            'Outputs': [[Path, os.path.getsize(Path)] for Path in Outputs], 'Rows': Rows}
+        if Spacers:
+            self.Samples[Key]['Spacers'] = Spacers
+        self.save()
+
+    #Forget samples that are no longer in the parent directory
+    def keep(self, Keys):
+        for Key in list(self.Samples):
+            if Key not in Keys:
+                del self.Samples[Key]
+        self.save()
+
+    def save(self):
+        with open(self.Path + '.tmp', 'w') as outfile:
+            json.dump({'Samples': self.Samples}, outfile, indent=1)
+        os.replace(self.Path + '.tmp', self.Path)
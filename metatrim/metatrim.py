@@ -26,70 +26,76 @@ https://github.com/msnyder424/HTS-eDNA-Bioinformatics/tree/master/metatrim
 """
 
 import re
-import pip
 import sys
-import gzip
 import os
+import json
 import operator
+import collections
+import itertools
+import zlib
+import time
+import array
+import random
+import contextlib
 from datetime import datetime
-try:
-    from sympy.utilities.iterables import multiset_permutations
-except ImportError:
-    print ('Installing dependency: sympy')
-    os.system('pip install sympy')
-    from sympy.utilities.iterables import multiset_permutations
-
-if __name__ != '__main__':
-    print("MetaTrim takes the following variables:\n\
-1. primer set name or 'other' if it is not in the \
-common primer set list. If a primer set name is entered, argument variables 2 & 3 will be ignored, \
-but a value must be entered.\n\
-2. Last N bases of forward primer (recomended >= 8)\n\
-3. Last N bases of reverse primer (recomended >= 8)\n\
-4. N errors allowed in forward primer (recomended >=1)\n\
-5. N errors allowed in reverse primer (recomended >=1)\n\
-6. Length of marker. If you wish to use the length associated with a primer set, input the primer \
-set name. If length is variable, enter 0 and MetaTrim will search for the opposite primer in each \
-forward and reverse read. If the primer is not found it will take the remainder of the sequence \
-after the first primer is found. \
-WARNING: if your marker is much shorter than the read length, you should ensure that the oposite primer \
-sequence is not found in the Illumina sequencing primer or in any region after it's intended \
-location.\n\
-7. Are you using spacer inserts as published in Klymus et al. 2018, Plos One?: Y/N\n\n\
-To add a new primer set to the primer set list use AddPrimer and input the following vaiables: \n\
-1. Primer_Set Name, \n\
-2. Forward sequence, \n\
-3. Reverse sequence, \n\
-4. Length of the marker, primer set name (to use the stored length), or input 0 if you want MetaTrim \
-to always search for the opposite primer in each read. If the primer is not found it will take the \
-remainder of the sequence after the first primer is found. \n\
-WARNING: if you choose to have MetaTrim search for the oposite primer in each read, you should \
-ensure it is never found at any other location than is intended. This is most problematic when \
-your target can be very short and the oposite primer is found within the Illumina sequencing primer.\n\n\
-To remove a primer set from the list use RemovePrimer and imput the following variables: \n\
-1. Primer_Set_Name")
+from primermatch import PrimerMatcher, PrimerIndex, WindowSearch, LearnWindow
+from spacers import FSpacers, RSpacers, SpacerClassifier, WriteSpacerCounts
+from fastqio import ReadFastq, FastqWriter, Decompressors, Compressors, FindDecompressor, FindCompressor, \
+    IndexPaths, ReadInterleaved, SampleFastq, ReadRecords, ZlibReader, IsGzipped
+from manifest import RunManifest
+from shard import ShardClaims, ReadSampleSheet, WriteSampleSheet
+from derep import PairDereplicator, Qualities
+from quality import QualityFilter, Rejections
+from calibrate import ReservoirSample, CalibrationTable, Recommend, WriteCalibration
+from preview import PreviewCounts, PreviewHistograms, Wilson, WritePreview, WriteHistograms, TextHistogram
+from options import PopOption, PopFlag
+from metrics import StageTimes, TimedSearch, TimedBatches, ResetPeakMemory, PeakMemory, WriteMetrics
+#multiprocessing, tempfile, heapq and cProfile are imported where they are used, so that importing
+#MetaTrim or listing primer sets starts quickly
+
 """
 PrimerSets: this dictionary contains commonly used primer sets. Each key is the primer set name.
 The value is a list with structure ['ForwardSequence', 'ReverseSequence', 'MarkerLength']. See MetaTrimREADME for more info.
-Primers in the list that comes with MetaTrim.py are from Snyder et al. 2019 
+Primers in the list that comes with MetaTrim are from Snyder et al. 2019 
 "Invasive species in bait and pond stores: metabarcoding environmental DNA assays and angler, 
 retailer, and manager implications"
+
+The list that comes with MetaTrim is read from primersets.json next to metatrim.py. Primer sets added
+or removed with AddPrimer and RemovePrimer are saved to a user primer set file instead, which is
+~/.metatrim_primersets.json or the file named by the METATRIM_PRIMERSETS environment variable. A user
+primer set replaces a listed one of the same name, and a name set to null removes it.
 """
-PrimerSets = {
-	'ACTSPART-2': ['TNACNTTCCGN','CNCCAATTCAN','53'],
-    'MIFISHPART-2': ['TCGTGCCAGCN','TCCCAGTTTGN','0'],
-    'ACTLPART-2': ['CTHCGMTCHATYCCN','CNCCAATTCAN','150'],
-    'GOBIPART-2': ['TWAAAATYGCN','ACRTCWCGRCN','165'],
-    'CYPPART-2': ['CYCTHCTAGGN','CYCCRTTRGCN','134'],
-    'CYPCOMPLETE': ['TGATGAAAYTTYGGMTCYCTHCTAGG','AARAAGAATGATGCYCCRTTRGC','136'],
-    'GOBICOMPLETE': ['AACVCAYCCVCTVCTWAAAATYGC','AGYCANCCRAARTTWACRTCWCGRC','165'],
-    'MIFISHPART': ['TCGTGCCAGC','TCCCAGTTTG','0'],
-    'ACTLPART': ['CTHCGMTCHATYCC','CNCCAATTCA','152'],
-    'GOBIPART': ['TWAAAATYGC','ACRTCWCGRC','167'],
-    'CYPPART': ['CYCTHCTAGG','CYCCRTTRGC','136'],
-    'CYPCOMPLETE': ['TGATGAAAYTTYGGMTCYCTHCTAGG','AARAAGAATGATGCYCCRTTRGC','136'],
-    'GOBICOMPLETE': ['AACVCAYCCVCTVCTWAAAATYGC','AGYCANCCRAARTTWACRTCWCGRC','165']
-    }
+PrimerSetsFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'primersets.json')
+
+def UserPrimerSetsFile():
+    return os.environ.get('METATRIM_PRIMERSETS') or os.path.expanduser('~/.metatrim_primersets.json')
+
+#Primer sets in a primer set file, or none if there is no such file
+def ReadPrimerSets(Path):
+    try:
+        with open(Path) as infile:
+            return json.load(infile)
+    except FileNotFoundError:
+        return {}
+
+#The listed primer sets with the user's primer sets applied
+def LoadPrimerSets():
+    Sets = ReadPrimerSets(PrimerSetsFile)
+    for Name, Value in ReadPrimerSets(UserPrimerSetsFile()).items():
+        if Value is None:
+            Sets.pop(Name, None)
+        else:
+            Sets[Name] = Value
+    return Sets
+
+def SaveUserPrimerSets(UserSets):
+    Path = UserPrimerSetsFile()
+    with open(Path + '.tmp', 'w') as outfile:
+        json.dump(UserSets, outfile, indent=2)
+    os.replace(Path + '.tmp', Path)
+    return Path
+
+PrimerSets = LoadPrimerSets()
 
 #Finction to print primer sets in the primer set list
 def PrintPrimerSets():
@@ -97,389 +103,1594 @@ def PrintPrimerSets():
     for keys in PrimerSets:
         print ('%s\t%s\t%s\t%s' % (keys, PrimerSets[keys][0], PrimerSets[keys][1], PrimerSets[keys][2]))
 
-#Add a new primer to the primer set list
+#Add a new primer to the user primer set list
 def AddPrimer(PrimerName, PF, PR, LenMarker):
+    PrimerName = PrimerName.upper()
     if PrimerName in PrimerSets:
         print (PrimerName, "is already in the primer set list!")
         exit()
-    else:
-        NewOrNot = input("Would you like to rename this version of MetaTrim? Yes(Y), No(N), or Cancel (X)").upper()
-        if NewOrNot == 'Y':
-            NewPyFileName = input("Name the new MetaTrim program file. Don't forget .py!")
-        elif NewOrNot == 'N':
-            NewPyFileName = 'metatrim.py'
-        elif NewOrNot == 'X':
-            exit()
-        print ('Adding primer set:', PrimerName, 'F seq:', PF, 'R seq:', PR, 'Target length:', \
-            LenMarker, 'to python file', NewPyFileName)
-        with open('metatrim.py', 'r') as pyfileOld:
-            lines = pyfileOld.readlines()
-        for indx, val in enumerate(lines):
-            if re.search('PrimerSets \= \{', val):
-                NewPLineIndx = indx + 1
-                lines.insert(NewPLineIndx, "\t'"+PrimerName.upper()+"': ['"+PF+"','"+PR+"','"+str(LenMarker)+"'],\n")
-                break
-        with open(NewPyFileName, 'w') as pyfileNew:
-            for i in lines:
-                pyfileNew.write(i)
+    UserSets = ReadPrimerSets(UserPrimerSetsFile())
+    UserSets[PrimerName] = [PF, PR, str(LenMarker)]
+    Path = SaveUserPrimerSets(UserSets)
+    PrimerSets[PrimerName] = UserSets[PrimerName]
+    print ('Added primer set:', PrimerName, 'F seq:', PF, 'R seq:', PR, 'Target length:', \
+        LenMarker, 'to', Path)
 
-#Remove a primer from the primer set list
+#Remove a primer from the primer set list. Listed primer sets are hidden in the user primer set list
 def RemovePrimer(PrimerName):
-    if not PrimerName.upper() in PrimerSets:
-        print (PrimerName.upper(), "is not in the primer set list!")
+    PrimerName = PrimerName.upper()
+    if not PrimerName in PrimerSets:
+        print (PrimerName, "is not in the primer set list!")
         exit()
+    UserSets = ReadPrimerSets(UserPrimerSetsFile())
+    if PrimerName in ReadPrimerSets(PrimerSetsFile):
+        UserSets[PrimerName] = None
     else:
-        NewOrNot = input("Would you like to rename this version of MetaTrim?(Y/N)").upper()
-        if NewOrNot == 'Y':
-            NewPyFileName = input("Name the new MetaTrim program file. Don't forget .py!")
-        else:
-            NewPyFileName = 'metatrim.py'
-        PrimerToRemove = "\t'"+PrimerName.upper()+"':"
-        print ('Removing primer set', PrimerName.upper(), 'from python file', NewPyFileName)
-        with open('metatrim.py', 'r') as pyfileOld:
-            lines = pyfileOld.readlines()
-            for i in lines:
-                if re.match(PrimerToRemove, i):
-                    lines.remove(i)
-                if re.match('#EndPrimerSetList', i):
-                    break
-        with open(NewPyFileName, 'w') as pyfileNew:
-            for i in lines:
-                pyfileNew.write(i)
+        UserSets.pop(PrimerName, None)
+    Path = SaveUserPrimerSets(UserSets)
+    del PrimerSets[PrimerName]
+    print ('Removed primer set', PrimerName, 'in', Path)
 
-#Function for counting correct spacer insert
-FSpacers = {'e': '(TCCT|[ATCGN]CCT|T[ATCGN]CT|TC[ATCGN]T|TCC[ATCGN])', 
-            'f': '(ATGC|[ATCGN]TGC|A[ATCGN]GC|AT[ATCGN]C|ATG[ATCGN])', 
-            'g': '(CGAG|[ATCGN]GAG|C[ATCGN]AG|CG[ATCGN]G|CGA[ATCGN])', 
-            'h': '(GATA|[ATCGN]ATA|G[ATCGN]TA|GA[ATCGN]A|GAT[ATCGN])'
-            }
-RSpacers = {'e': '(CGTA|[ATCGN]GTA|C[ATCGN]TA|CG[ATCGN]A|CGT[ATCGN])', 
-            'f': '(TCAC|[ATCGN]CAC|T[ATCGN]AC|TC[ATCGN]C|TCA[ATCGN])', 
-            'g': '(GAGT|[ATCGN]AGT|G[ATCGN]GT|GA[ATCGN]T|GAG[ATCGN])', 
-            'h': '(ATCG|[ATCGN]TCG|A[ATCGN]CG|AT[ATCGN]G|ATC[ATCGN])'
-            }
-
-def SpacerCount(InFastq):
-    Count = {'e': 0, 'f': 0, 'g': 0, 'h': 0}
-    readbuffer = []
-    global reads
-    global MaxS
-    reads = 0
-    if re.search('R1_001\.fastq\.gz', InFastq):
-        ReadDirection = 'forward'
-        Spacer = FSpacers
-    elif re.search('R2_001\.fastq\.gz', InFastq):
-        ReadDirection = 'reverse'
-        Spacer = RSpacers
-    print ('Removing index hops based on incorrect spacer insert in sample', \
-        InFastq[0:re.search('_', InFastq).start()], ReadDirection)
-    with gzip.open(InFastq) as infile:
-        for line in infile:
-            readbuffer.append(line.strip().decode('ascii'))
-            if len(readbuffer) == 4:
-                reads += 1
-                for keys in Spacer:
-                    if re.match(Spacer[keys], readbuffer[1]):
-                        Count[keys] += 1
-                readbuffer = []
-            if reads == 1000:
-                break
+#Reads the sample's spacer is chosen from, at the start of each file
+SpacerReads = 1000
+
+#Spacer inserts of a read file's direction and the direction's name
+def SpacerDirection(InFastq):
+    if re.search('R2_001\.fastq', InFastq):
+        return RSpacers, 'reverse'
+    return FSpacers, 'forward'
+
+#Spacer label most of the first SpacerReads reads of Batches start with, and the count of each spacer
+def DominantSpacer(Batches, Spacers):
+    Reads = itertools.islice(itertools.chain.from_iterable(Batches), SpacerReads)
+    Count = SpacerClassifier(Spacers).tally([Read[1] for Read in Reads])
+    return max(Count.items(), key=operator.itemgetter(1))[0], Count
+
+def SpacerReport(sample, ReadDirection, Count, MaxS):
+    print ('Removing index hops based on incorrect spacer insert in sample', sample, ReadDirection)
     print ('Spacer counts in first 1K sequences:')
     for keys in Count:
         print (keys, ':', Count[keys])
-    MaxS = max(Count.items(), key=operator.itemgetter(1))[0]
-    print (InFastq[0:re.search('_', InFastq).start()], ReadDirection, 'has spacer', MaxS)
+    print (sample, ReadDirection, 'has spacer', MaxS)
+
+#Function for counting correct spacer insert
+def SpacerCount(InFastq, Decompress='auto'):
+    Spacers, ReadDirection = SpacerDirection(InFastq)
+    Batch = next(ReadFastq(InFastq, SpacerReads, Decompress, Decode=False), [])
+    MaxS, Count = DominantSpacer([Batch], Spacers)
+    SpacerReport(SampleName(InFastq), ReadDirection, Count, MaxS)
+    return MaxS
+
+#Take batches from the start of Batches until they hold at least Size reads. Returns the batches
+#taken and all the batches, the taken ones first, so no read is read twice.
+def LeadingBatches(Batches, Size):
+    Taken = []
+    Count = 0
+    for Batch in Batches:
+        Taken.append(Batch)
+        Count += len(Batch)
+        if Count >= Size:
+            break
+    return Taken, itertools.chain(Taken, Batches)
 
-#Reverse compliment a sequence
+#Reverse compliment a sequence (str or bytes)
+RevCompTable = str.maketrans('ATGCN', 'TACGN')
+RevCompBytes = bytes.maketrans(b'ATGCN', b'TACGN')
 def RevComp(Seq):
-    global SeqRC
-    trans = str.maketrans('ATGCN', 'TACGN')
-    SeqRC = Seq[::-1].translate(trans)
-
-
-#Create degenerate primer regexes
-IUPACAmb = {'R' : '[AG]', 
-            'Y' : '[CT]', 
-            'S' : '[GC]', 
-            'W' : '[AT]', 
-            'K' : '[GT]', 
-            'M' : '[AC]', 
-            'B' : '[CGT]', 
-            'D' : '[AGT]', 
-            'H' : '[ACT]', 
-            'V' : '[ACG]', 
-            'N' : '[ATCG]'
-            }
+    if isinstance(Seq, str):
+        return Seq[::-1].translate(RevCompTable)
+    return Seq[::-1].translate(RevCompBytes)
+
+
+#Create degenerate primer matchers
 def DegPrimers (PrimDict, ErrDict):
-    global DegPrimerDict
+    print ('Making degenerate primer matchers.')
     DegPrimerDict = {}
-    print ('Making degenerate primer regex.')
     for keys in PrimDict:
-        DegPrimers = []
-        PrimCurr = list(PrimDict[keys])
-        PrimDegDict = {}
-        Perms = []
-        if ErrDict[keys] > 0:
-            DegPrimerDict[keys] = []
-            for err in range(0, ErrDict[keys]+1):
-                PrimDeg = []
-                for bp in range(len(PrimDict[keys])):
-                    if bp < err:
-                        PrimDeg.append(0)
-                    else:
-                        PrimDeg.append(1)
-                PermsTemp = list(multiset_permutations(PrimDeg))
-                Perms.extend(PermsTemp)
-                for i in Perms:
-                    for n in range(len(i)):
-                        if i[n] == 0:
-                            i[n] = '[ACTGN]'
-                        else:
-                            if PrimCurr[n] in IUPACAmb:  
-                                i[n] = IUPACAmb[PrimCurr[n]]
-                            else:
-                                i[n] = PrimCurr[n]
-                    DegPrimers.append(''.join(i))
-                DegPrimerDict[keys].append('('+'|'.join(DegPrimers)+')')
+        DegPrimerDict[keys] = PrimerMatcher(PrimDict[keys], ErrDict[keys])
+    return DegPrimerDict
+
+#Primer matchers for one primer set, or primer indexes over every primer set when several markers
+#are demultiplexed at once
+def MarkerMatchers(PrimerDicts, ErrDict):
+    Sets = []
+    for PrimerDict in PrimerDicts:
+        Sets.append({keys: PrimerMatcher(PrimerDict[keys], ErrDict[keys]) for keys in PrimerDict})
+    if len(Sets) == 1:
+        return Sets[0]
+    return {keys: PrimerIndex([Matchers[keys] for Matchers in Sets]) for keys in Sets[0]}
+
+#Function to trim primers. Returns the start and end of the target in Read, or None if Primer1 is not found.
+#With Windows = (primer window, opposite primer window) each search tries its window first, and
+#Stats = [primer searches, primer fallbacks, opposite searches, opposite fallbacks] counts full scans.
+def TrimPrimers (Read, Primer1, Primer2, Length, Windows=None, Stats=None):
+    if Windows is None:
+        Hit = Primer1.search(Read)
+    else:
+        Hit, Fallback = WindowSearch(Primer1, Read, Windows[0])
+        Stats[0] += 1
+        Stats[1] += Fallback
+    if Hit is None:
+        return None
+    TargetStart = Hit[1]
+    if Length == 0:
+        if Windows is None:
+            OppHit = Primer2.search(RevComp(Read))
         else:
-            DegCurr = []
-            for n in PrimCurr:
-                if n in IUPACAmb:  
-                    DegCurr.append(IUPACAmb[n])
-                else:
-                    DegCurr.append(n)
-            DegPrimerDict[keys] = ''.join(DegCurr)
-
-#Function to trim primers
-def TrimPrimers (Primer1,Primer2):
-    global name
-    global TargetStart
-    global TargetEnd
-    global TrimmedSeq
-    global Seq
-    global Qual
-    for prim1 in DegPrimerDict[Primer1]:
-        if re.search(prim1, readbuffer[1]):
-            name = readbuffer[0].split()
-            TargetStart = re.search(prim1, readbuffer[1]).end()
-            if Length == 0:
-                RevComp(readbuffer[1])
-                for prim2 in DegPrimerDict[Primer2]:
-                    if re.search(prim2, SeqRC):
-                        TargetEnd = len(readbuffer[1])-re.search(prim2, SeqRC).end()
-                        break
-                    else:
-                        TargetEnd = len(readbuffer[1])
-            else:
-                TargetEnd = TargetStart + int(Length)
-            Seq = readbuffer[1][TargetStart:TargetEnd]
-            Qual = readbuffer[3][TargetStart:TargetEnd]
-            break
+            OppHit, Fallback = WindowSearch(Primer2, RevComp(Read), Windows[1])
+            Stats[2] += 1
+            Stats[3] += Fallback
+        if OppHit is not None:
+            TargetEnd = len(Read)-OppHit[1]
         else:
-            Seq = 'X'
-            name = readbuffer[0].split()
+            TargetEnd = len(Read)
+    else:
+        TargetEnd = TargetStart + int(Length)
+    return TargetStart, TargetEnd
 
-def MetaTrim(InForward, InReverse, PrimerSet, PF, PR, ErrF, ErrR, TargetLen, Spacers):
-    PrimerSet = PrimerSet.upper()
-    global Length
-    global PrimerDict
-    global ErrorDict
-    global cutoff
-    if type(TargetLen) == int:
-        Length = int(TargetLen)   
+#Function to trim the primers of whichever primer set's Primer1 index hit is best in Read. Returns the
+#start and end of the target and the primer set number, or None if no primer set's Primer1 is found
+def TrimMarkers (Read, Primer1, Primer2, Lengths):
+    Found = Primer1.search(Read)
+    if Found is None:
+        return None
+    Marker, Hit = Found
+    TargetStart = Hit[1]
+    if Lengths[Marker] == 0:
+        OppHit = Primer2.Matchers[Marker].search(RevComp(Read))
+        if OppHit is not None:
+            TargetEnd = len(Read)-OppHit[1]
+        else:
+            TargetEnd = len(Read)
     else:
-        Length = TargetLen.upper()      
+        TargetEnd = TargetStart + int(Lengths[Marker])
+    return TargetStart, TargetEnd, Marker
 
-    #Define the primer set if not in the list
+#Learn (primer window, opposite primer window) from the primer hits in a batch of reads
+def LearnWindows(Batch, Primer1, Primer2, Length):
+    Starts = []
+    OppStarts = []
+    for Read in Batch:
+        Hit = Primer1.search(Read[1])
+        if Hit is not None:
+            Starts.append(Hit[0])
+            if Length == 0:
+                OppHit = Primer2.search(RevComp(Read[1]))
+                if OppHit is not None:
+                    OppStarts.append(OppHit[0])
+    return LearnWindow(Starts), LearnWindow(OppStarts)
+
+#Print how often the adaptive windows had to fall back to searching the whole read
+def WindowReport(sample, Direction, Windows, Stats):
+    for Name, Window, Searches, Fallbacks in (('primer', Windows[0], Stats[0], Stats[1]), \
+        ('opposite primer', Windows[1], Stats[2], Stats[3])):
+        if Searches:
+            if Window is None:
+                print (sample, Direction, Name, 'had too few hits to learn a window; searched whole reads.')
+            else:
+                print (sample, Direction, Name, 'window starts %d-%d: fell back to the whole read for' % Window, \
+                    Fallbacks, 'of', Searches, 'searches (%.2f%%).' % (100.0 * Fallbacks / Searches))
+
+#Primer hits of each read for CalibrationTable, found allowing as many errors as Primer1 and Primer2 do:
+#(primer set number, target start, errors, opposite primer target end or None, opposite primer errors,
+#read length, whether the target starts with one of Bases), or None if Primer1 is not found
+def CalibrationHits(Reads, Primer1, Primer2, Lengths):
+    Markers = isinstance(Primer1, PrimerIndex)
+    Hits = []
+    for Read in Reads:
+        Marker = 0
+        Hit = Primer1.search(Read)
+        if Markers and Hit is not None:
+            Marker, Hit = Hit
+        if Hit is None:
+            Hits.append(None)
+            continue
+        OppEnd = None
+        OppErrors = 0
+        if Lengths[Marker] == 0:
+            OppHit = (Primer2.Matchers[Marker] if Markers else Primer2).search(RevComp(Read))
+            if OppHit is not None:
+                OppEnd = len(Read) - OppHit[1]
+                OppErrors = OppHit[2]
+        Hits.append((Marker, Hit[1], Hit[2], OppEnd, OppErrors, len(Read), \
+            Hit[1] < len(Read) and Read[Hit[1]] in Bases))
+    return Hits
+
+#Seconds searching Reads for their primer, and the reads with hits for the opposite primer, take with
+#each set of Matchers: a (primer, opposite primer) pair for each number of allowed errors
+def CalibrationSeconds(Reads, Hits, Matchers, Primer1, Primer2, Lengths):
+    Opposite = [(RevComp(Read), Hit[0]) for Read, Hit in zip(Reads, Hits) if Hit is not None and Lengths[Hit[0]] == 0]
+    Seconds = []
+    for Matcher in Matchers:
+        Start = time.perf_counter()
+        for Read in Reads:
+            Matcher[Primer1].search(Read)
+        Middle = time.perf_counter()
+        Markers = isinstance(Matcher[Primer2], PrimerIndex)
+        for Seq, Marker in Opposite:
+            (Matcher[Primer2].Matchers[Marker] if Markers else Matcher[Primer2]).search(Seq)
+        Seconds.append((Middle - Start, time.perf_counter() - Middle))
+    return Seconds
+
+#Calibrate the primer errors of one sample on Reads read pairs drawn from the whole of both files.
+#Returns the trimmed reads and pairs at each combination of 0 to MaxErrors forward and reverse primer
+#errors, with the primer search time of each, and the recommended combination, as in calibrate.py.
+def CalibrateErrors(InForward, InReverse, PrimerDicts, Lengths, Cutoffs, MaxErrors=3, Reads=10000, \
+    Decompress='auto', Loss=0.005):
+    Lengths = [int(Length) for Length in Lengths]
+    #Seeded by the sample name, so the same reads are drawn every time
+    Batches = zip(ReadFastq(InForward, 10000, Decompress, False), ReadFastq(InReverse, 10000, Decompress, False))
+    Pairs = ReservoirSample((list(zip(FBatch, RBatch)) for FBatch, RBatch in Batches), Reads, SampleName(InForward))
+    FReads = [Pair[0][1] for Pair in Pairs]
+    RReads = [Pair[1][1] for Pair in Pairs]
+    Paired = [ReadName(Pair[0][0]) == ReadName(Pair[1][0]) for Pair in Pairs]
+    Matchers = [MarkerMatchers(PrimerDicts, {'pF': n, 'pR': n}) for n in range(MaxErrors + 1)]
+    FHits = CalibrationHits(FReads, Matchers[-1]['pF'], Matchers[-1]['pR'], Lengths)
+    RHits = CalibrationHits(RReads, Matchers[-1]['pR'], Matchers[-1]['pF'], Lengths)
+    Seconds = {'F': CalibrationSeconds(FReads, FHits, Matchers, 'pF', 'pR', Lengths), \
+        'R': CalibrationSeconds(RReads, RHits, Matchers, 'pR', 'pF', Lengths)}
+    Rows = CalibrationTable(FHits, RHits, Paired, Seconds, Lengths, Cutoffs, MaxErrors)
+    return Rows, Recommend(Rows, Loss)
+
+#Calibrate one sample in a worker process
+def CalibrateSample(Task):
+    Args, Kwargs = Task
+    Rows, Best = CalibrateErrors(*Args, **Kwargs)
+    print (SampleName(Args[0]), 'trims %.2f%% of the most sampled pairs with' % (100.0 * Best['Share']), \
+        Best['ErrF'], 'forward and', Best['ErrR'], 'reverse primer errors.')
+    return SampleName(Args[0]), Rows, Best
+
+#Split a comma separated list of primer sets such as 'CYPPART,GOBIPART' into primer set names
+def PrimerSetList(PrimerSet):
+    if isinstance(PrimerSet, str):
+        PrimerSet = PrimerSet.split(',')
+    return [Name.strip().upper() for Name in PrimerSet if Name.strip()]
+
+#Name stem of the results directory and trim summary of each primer set. One primer set uses the
+#parent directory name, several add each primer set name to it
+def MarkerNames(basenm, Markers):
+    if len(Markers) == 1:
+        return [basenm]
+    return [basenm+Marker for Marker in Markers]
+
+#Work out the primers for a primer set. Returns None if the primer set is not in the list
+def PrimerSetPrimers(PrimerSet, PF, PR):
+    PrimerSet = PrimerSet.upper()
     if PrimerSet == 'OTHER':
-        print ('Primer set is ', PrimerSet,'. F: ', PF.upper(), 'R: ', PR.upper())
-        PrimerDict = {'pF': PF.upper(), 'pR': PR.upper()}
-        ErrorDict = {'pF': int(ErrF), 'pR': int(ErrR)}
+        return {'pF': PF.upper(), 'pR': PR.upper()}
     elif PrimerSet in PrimerSets:
-        print ('Primer set is ', PrimerSet)
-        PrimerDict = {'pF': PrimerSets[PrimerSet][0], 'pR': PrimerSets[PrimerSet][1]}
-        ErrorDict = {'pF': int(ErrF), 'pR': int(ErrR)}
-        if Length in PrimerSets:
-            Length = int(PrimerSets[PrimerSet][2])
-    elif PrimerSet not in PrimerSets:
-        print (PrimerSet.upper(),"is not in the Primer Sets List!")
-        if __name__ == '__main__':
-            exit()
+        return {'pF': PrimerSets[PrimerSet][0], 'pR': PrimerSets[PrimerSet][1]}
+    return None
 
-    #Determine length of sequences to remove
-    try:
-        cutoff
-    except NameError:
-        if Length > 125:
-            cutoff = 100
-        elif Length != 0:
-            cutoff = Length * 0.75
-        elif Length == 0:
-            cutoff = int(input('Sequences less than how many basepairs should be considered \
-primer dimer and removed?'))
+#Work out the marker length. A primer set name as the length uses the stored length of PrimerSet
+def MarkerLength(PrimerSet, TargetLen):
+    if type(TargetLen) == int:
+        return TargetLen
+    Length = str(TargetLen).upper()
+    if Length.isnumeric():
+        return int(Length)
+    if Length in PrimerSets and PrimerSet.upper() in PrimerSets:
+        return int(PrimerSets[PrimerSet.upper()][2])
+    return Length
 
-    #Create Ddegenerate primer regex if it does not already exist
-    try:
-        DegPrimerDict
-    except NameError:
-        DegPrimers (PrimerDict, ErrorDict)
+#Determine length of sequences to remove
+def TrimCutoff(Length):
+    if Length > 125:
+        return 100
+    elif Length != 0:
+        return Length * 0.75
+    return int(input('Sequences less than how many basepairs should be considered \
+primer dimer and removed?'))
 
-    cwd = os.getcwd()
-    basenm = os.path.basename(cwd)
-    outsumname = basenm+'TrimSummary.txt'
+#Header and rows of the trim summary file. Dereplicated runs add the dereplication counts.
+def SummaryHeader(Spacers, Derep=None, Quality=False):
+    Header = 'Sample\tReads\tF Seqs Trimmed\tR Seqs Trimmed\tSeqs F & R Trimmed\tShort Seqs'
+    if Spacers.upper() == 'Y':
+        Header += '\tSeqs w/ Correct Spacer Combo\tSeqs w/o Correct Spacer Combo'
+    if Quality:
+        Header += '\tMax N Rejects\tMin Qual Rejects\tMax EE Rejects'
+    if Derep:
+        Header += '\tUnique Pairs\tSingleton Pairs\tTop Pair Abundance'
+    return Header + '\n'
 
-    #Create summary files
+def SummaryRow(*Counts):
+    return '\t'.join(str(i) for i in Counts)+'\n'
 
-    if __name__ != '__main__':
-        outsum = open(outsumname, "w")
-        if Spacers == 'Y':
-            outsum.write('Sample\tReads\tF Seqs Trimmed\tR Seqs Trimmed\tSeqs F & R Trimmed\tShort Seqs\t\
-Seqs w/ Correct Spacer Combo\tSeqs w/o Correct Spacer Combo\n')
+#Trim a batch of reads. Each result is the (start, end) of the target, None if the primer was not
+#found, or False if the read does not start with the sample's spacer. Spacer is (SpacerClassifier of
+#the read direction, the sample's spacer label). With PrimerIndex primers and a list of lengths, results
+#are (start, end, primer set number) from TrimMarkers. With a QualityFilter, every target found is
+#(start, end, primer set number or 0, end after truncation, rejection number). Times adds up the
+#seconds spent in each stage. Returns the results and, with a Spacer, the spacer number each read
+#starts with (-1 for none).
+def TrimBatch(Batch, Primer1, Primer2, Length, Spacer=None, Windows=None, Stats=None, Times=None, Filter=None):
+    Results = []
+    Labels = None
+    Markers = isinstance(Primer1, PrimerIndex)
+    if Times is not None:
+        Primer1 = TimedSearch(Primer1, Times, 'primer match')
+        Primer2 = TimedSearch(Primer2, Times, 'opposite primer search')
+        Start = time.perf_counter()
+    if Spacer:
+        #Every spacer of the direction is told apart, for the spacer counts of the sample
+        Labels = Spacer[0].classify([Read[1] for Read in Batch])
+        Keep = Spacer[0].Labels.index(Spacer[1])
+    if Times is not None:
+        Times['spacer check'] += time.perf_counter() - Start
+    for n, Read in enumerate(Batch):
+        if Spacer and Labels[n] != Keep:
+            Results.append(False)
+        elif Markers:
+            Results.append(TrimMarkers(Read[1], Primer1, Primer2, Length))
         else:
-            outsum.write('Sample\tReads\tF Seqs Trimmed\tR Seqs Trimmed\tSeqs F & R Trimmed\tShort Seqs\n')
-    else:
-        outsum = open(outsumname, "a")
+            Results.append(TrimPrimers(Read[1], Primer1, Primer2, Length, Windows, Stats))
+    if Filter is not None:
+        if Times is not None:
+            Start = time.perf_counter()
+        Found = [n for n, Trim in enumerate(Results) if Trim]
+        Ends, Fails = Filter.check([Batch[n][1][Results[n][0]:Results[n][1]] for n in Found], \
+            [Batch[n][2][Results[n][0]:Results[n][1]] for n in Found])
+        for n, End, Fail in zip(Found, Ends, Fails):
+            Trim = Results[n]
+            Results[n] = (Trim[0], Trim[1], Trim[2] if Markers else 0, Trim[0] + End, Fail)
+        if Times is not None:
+            Times['quality filter'] += time.perf_counter() - Start
+    return Results, Labels
 
-    #Create results directory
-    ResDirName = basenm+'TrimmedFastqs'
-    try:
-        os.mkdir(ResDirName)
-        print("Directory " , ResDirName ,  " Created ") 
-    except FileExistsError:
-        pass
-
-    nFSeqs = 0
-    FNames = {}
-    FSeqs = {}
-    FQuals = {}
-    CorSpacer = {}
-    RSeqs = 0
-    FinalSeqs = 0
-    Shorts = 0
-    sample = InForward[0:re.search('_', InForward).start()]
-    if re.search('R1_001\.fastq\.gz', InForward):
-        reads = 0
-        Foutfilenameandpath = ResDirName+'/'+sample+'_R1_001.fastq'
-        Foutfile = open(Foutfilenameandpath, "w")
-        global readbuffer
-        readbuffer = []
-        print ('Processing:', InForward)
-        if Spacers.upper() == 'Y':
-            #count spacer inserts in firs 1K sequences
-            SpacerCount(InForward)
-            FMax = MaxS
-            print ('Trimming primers sample', sample, 'forward.')
-            with gzip.open(InForward) as infile:
+#Primer matchers and marker length for each process of an intra-sample worker pool
+TrimWorkerSettings = {}
+
+def InitTrimWorker(PrimerDicts, ErrorDict, Length):
+    TrimWorkerSettings['Matchers'] = MarkerMatchers(PrimerDicts, ErrorDict)
+    TrimWorkerSettings['Length'] = Length
+
+def TrimWorkerBatch(Job):
+    Primer1, Primer2, Spacer, Windows, Timed, Filter, Batch = Job
+    Matchers = TrimWorkerSettings['Matchers']
+    Stats = [0, 0, 0, 0]
+    Times = StageTimes() if Timed else None
+    Results, Labels = TrimBatch(Batch, Matchers[Primer1], Matchers[Primer2], TrimWorkerSettings['Length'], \
+        Spacer, Windows, Stats, Times, Filter)
+    return Results, Labels, Stats, Times
+
+#Yield (batch, results, spacer labels) in file order. With a worker pool, at most InFlight batches are
+#out at once. Window fallback counts from every batch are added to Stats, and stage times to Times.
+def TrimBatches(Batches, Primer1, Primer2, Spacer, Matchers, Length, Workers=None, InFlight=0, \
+    Windows=None, Stats=None, Times=None, Filter=None):
+    if Workers is None:
+        for Batch in Batches:
+            yield (Batch,) + TrimBatch(Batch, Matchers[Primer1], Matchers[Primer2], Length, Spacer, Windows, \
+                Stats, Times, Filter)
+        return
+    Pending = collections.deque()
+    def Collect():
+        Batch, Job = Pending.popleft()
+        if Times is not None:
+            Start = time.perf_counter()
+        Results, Labels, BatchStats, BatchTimes = Job.get()
+        if Times is not None:
+            Times['worker wait'] += time.perf_counter() - Start
+            for Stage in BatchTimes:
+                Times[Stage] += BatchTimes[Stage]
+        if Stats is not None:
+            for n in range(4):
+                Stats[n] += BatchStats[n]
+        return Batch, Results, Labels
+    for Batch in Batches:
+        Pending.append((Batch, Workers.apply_async(TrimWorkerBatch, ((Primer1, Primer2, Spacer, Windows, \
+            Times is not None, Filter, Batch),))))
+        if len(Pending) >= InFlight:
+            yield Collect()
+    while Pending:
+        yield Collect()
+
+#Bases a trimmed target may start with
+Bases = b'ATCGN'
+
+#Flatten trimmed batches into (read, trim, spacer label) records
+def TrimmedRecords(Batches):
+    for Batch, Results, Labels in Batches:
+        yield from zip(Batch, Results, itertools.repeat(-1) if Labels is None else Labels)
+
+#Read name used to pair forward and reverse reads
+def ReadName(NameLine):
+    return NameLine.split(None, 1)[0]
+
+#Bounded memory pairing for forward and reverse files that are not in the same read order.
+#Trimmed reads are spilled to disk in Partitions buckets by read name, each bucket is paired
+#in memory on its own, and the pairs are merged back into reverse file order.
+class PairSpill:
+    def __init__(self, Dir, Partitions=32):
+        import tempfile
+        self.TempDir = tempfile.TemporaryDirectory(prefix='metatrimspill', dir=Dir)
+        self.Partitions = Partitions
+        self.FFiles = [open(os.path.join(self.TempDir.name, 'F%d' % n), 'wb') for n in range(Partitions)]
+        self.RFiles = [open(os.path.join(self.TempDir.name, 'R%d' % n), 'wb') for n in range(Partitions)]
+        self.SFiles = None
+
+    def _bucket(self, Name):
+        return zlib.crc32(Name) % self.Partitions
+
+    #Forward reads that were trimmed and are long enough to keep, with the primer set they were
+    #trimmed for and their quality rejection number
+    def add_forward(self, Name, Record, Marker=0, Fail=0):
+        self.FFiles[self._bucket(Name)].write(b'\t'.join((Name, b'%d' % Marker, b'%d' % Fail) + Record) + b'\n')
+
+    #Reverse reads with the correct spacer. Record is None if the primer was not trimmed
+    def add_reverse(self, Index, Name, Record, Marker=0, Fail=0):
+        if Record is None:
+            Record = (b'', b'', b'')
+        self.RFiles[self._bucket(Name)].write(b'\t'.join((b'%d' % Index, Name, b'%d' % Marker, b'%d' % Fail) + \
+            Record) + b'\n')
+
+    #Spacer number every read starts with, for the spacer combination of each pair
+    def add_spacer(self, Name, Label, Reverse=False):
+        if self.SFiles is None:
+            self.SFiles = [open(os.path.join(self.TempDir.name, 'S%d' % n), 'wb') for n in range(self.Partitions)]
+        self.SFiles[self._bucket(Name)].write(b'%d\t%d\t%s\n' % (Reverse, Label, Name))
+
+    #Add each pair of spacers added with add_spacer to the forward by reverse spacer counts in Pairs
+    def count_spacers(self, Pairs):
+        for outfile in self.SFiles or []:
+            outfile.close()
+            FLabels = {}
+            RLabels = []
+            with open(outfile.name, 'rb') as infile:
                 for line in infile:
-                    readbuffer.append(line.strip().decode('ascii'))
-                    if len(readbuffer) == 4:
-                        reads += 1
-                        if reads % 10000 == 0:
-                            print ('Read:', reads, end='\r')
-                        if re.match(FSpacers[FMax], readbuffer[1]):
-                            TrimPrimers('pF','pR')
-                            if re.match('[ATCGN]', Seq):
-                                nFSeqs += 1
-                                if len(Seq) > cutoff:
-                                    FNames[name[0]] = readbuffer[0]
-                                    FSeqs[name[0]] = Seq
-                                    FQuals[name[0]] = Qual
-                                    CorSpacer[name[0]] = 1
-                        readbuffer = []
-            print(reads, 'total raw reads.')
-        else:
-            with gzip.open(InForward) as infile:
-                print ('Trimming primers sample', sample, 'forward.')
+                    Reverse, Label, Name = line.rstrip(b'\n').split(b'\t', 2)
+                    if Reverse == b'0':
+                        FLabels[Name] = int(Label)
+                    else:
+                        RLabels.append((Name, int(Label)))
+            for Name, Label in RLabels:
+                if Name in FLabels:
+                    Pairs[FLabels[Name]][Label] += 1
+
+    #Pair each bucket, write the pairs in reverse file order to the output files of their primer set and
+    #return lists of (pairs written, short pairs, pairs with both spacers correct) for each primer set,
+    #the number of pairs trimmed for different primer sets and the pairs of each primer set rejected
+    #for each quality filter. Written pairs are also counted by the primer set's PairDereplicator in
+    #Dereps.
+    def join(self, Foutfiles, Routfiles, Cutoffs, Dereps=None):
+        FinalSeqs = [0] * len(Cutoffs)
+        Shorts = [0] * len(Cutoffs)
+        CorrSpacers = [0] * len(Cutoffs)
+        Rejects = [[0] * len(Rejections) for Cutoff in Cutoffs]
+        Mixed = 0
+        Paired = []
+        for n in range(self.Partitions):
+            self.FFiles[n].close()
+            self.RFiles[n].close()
+            FRecs = {}
+            with open(self.FFiles[n].name, 'rb') as infile:
                 for line in infile:
-                    LineCurr = line.strip().decode('ascii')
-                    readbuffer.append(LineCurr)
-                    if len(readbuffer) == 4:
-                        reads += 1
-                        if reads % 10000 == 0:
-                            print ('Read:', reads, end='\r')
-                        TrimPrimers('pF','pR')
-                        if re.match('[ATCGN]', Seq):
-                            nFSeqs += 1
-                            if len(Seq) > cutoff:
-                                FNames[name[0]] = readbuffer[0]
-                                FSeqs[name[0]] = Seq
-                                FQuals[name[0]] = Qual
-                        readbuffer = []
-                print(reads, 'total raw reads.')
-    else:
-        print ("MetaTrim only works on paired zipped fastq files!")
-    if re.search('R2_001\.fastq\.gz', InReverse):
-        Routfilenameandpath = ResDirName+'/'+sample+'_R2_001.fastq'
-        Routfile = open(Routfilenameandpath, "w")
-        readbuffer = []
-        reads = 0
-        print ('Processing:', InReverse)
-        if Spacers.upper() == 'Y':
-            #count spacer inserts in firs 1K sequences
-            SpacerCount(InReverse)
-            RMax = MaxS
-            print ('Trimming primers sample', sample, 'forward.')
-            with gzip.open(InReverse) as infile:
+                    Fields = line.rstrip(b'\n').split(b'\t')
+                    FRecs[Fields[0]] = (int(Fields[1]), int(Fields[2]), Fields[3:])
+            Paired.append(open(self.FFiles[n].name + 'pairs', 'wb'))
+            with open(self.RFiles[n].name, 'rb') as infile:
                 for line in infile:
-                    LineCurr = line.strip().decode('ascii')
-                    readbuffer.append(LineCurr)
-                    if len(readbuffer) == 4:
-                        reads += 1
-                        if reads % 10000 == 0:
-                            print ('Read:', reads, end='\r')
-                        if re.match(RSpacers[RMax], readbuffer[1]):
-                            TrimPrimers('pR','pF')
-                            if re.match('[ATCGN]', Seq):
-                                RSeqs += 1
-                                if name[0] in FSeqs:
-                                    if len(Seq) > cutoff:
-                                        Foutfile.write("%s\n%s\n+\n%s\n" % (FNames[name[0]],FSeqs[name[0]],FQuals[name[0]]))
-                                        Routfile.write("%s\n%s\n+\n%s\n" % (readbuffer[0],Seq,Qual))
-                                        FinalSeqs += 1
-                                    else:
-                                        Shorts += 1
-                        else:
-                            CorSpacer[name[0]] = 0
-                        readbuffer = []
-                print(reads, 'total raw reads.')
+                    Index, Name, RMarker, RFail, RName, RSeq, RQual = line.rstrip(b'\n').split(b'\t')
+                    if Name in FRecs:
+                        Marker, FFail, FRec = FRecs[Name]
+                        CorrSpacers[Marker] += 1
+                        Fail = FFail or int(RFail)
+                        if RName and int(RMarker) != Marker:
+                            Mixed += 1
+                        elif RName:
+                            if len(RSeq) > Cutoffs[Marker] and Fail:
+                                Rejects[Marker][Fail - 1] += 1
+                            elif len(RSeq) > Cutoffs[Marker]:
+                                Paired[n].write(b'\t'.join([Index, b'%d' % Marker] + FRec + [RName, RSeq, RQual]) \
+                                    + b'\n')
+                                FinalSeqs[Marker] += 1
+                            else:
+                                Shorts[Marker] += 1
+            Paired[n].close()
+        import heapq
+        Streams = [open(f.name, 'rb') for f in Paired]
+        try:
+            for line in heapq.merge(*Streams, key=lambda l: int(l.split(b'\t', 1)[0])):
+                Fields = line.rstrip(b'\n').split(b'\t')
+                Marker = int(Fields[1])
+                Foutfiles[Marker].write(Fields[2:5])
+                Routfiles[Marker].write(Fields[5:8])
+                if Dereps:
+                    Dereps[Marker].add(Fields[2:5], Fields[5:8])
+        finally:
+            for f in Streams:
+                f.close()
+        self.TempDir.cleanup()
+        return FinalSeqs, Shorts, CorrSpacers, Mixed, Rejects
+
+#Metrics of each sample trimmed by this process, kept when MetaTrim is run with Metrics=True
+SampleMetrics = {}
+
+#Spacer counts of each sample trimmed by this process, kept when MetaTrim is run with Spacers Y
+SampleSpacers = {}
+
+#Status of each read trimmed by Trimmer.trim_batch, by number. Reads are trimmed if their primer is
+#found, they start with the sample's spacer and their target starts with one of Bases. Trimmed reads
+#can still be short (no longer than the cutoff of their primer set) or fail a quality filter.
+ReadStatuses = ('trimmed', 'no primer', 'wrong spacer', 'no target', 'short', 'max N', 'min quality', 'max EE')
+
+#Status of each read pair trimmed by Trimmer.trim_pair, by number. A pair is kept, and written by
+#MetaTrim, only if both reads are trimmed with the same primer set, neither is short and neither fails
+#a quality filter.
+PairStatuses = ('kept', 'forward not trimmed', 'reverse not trimmed', 'mixed primer sets', 'short', 'max N', \
+    'min quality', 'max EE')
+
+class Trimmer:
+    """Trimming of read pairs with one set of primers, errors, marker lengths, spacers and filters.
+
+    The primer matchers, spacer classifiers and quality filter are built once, and every method only
+    reads them, so one Trimmer can trim any number of samples, in turn or from several threads, and
+    Trimmers with other settings can be used alongside it. Raises ValueError if a primer set is not
+    in the primer set list. A Trimmer never asks for anything: without a Cutoff, each primer set's
+    cutoff is worked out from its marker length, and a marker length of 0 raises ValueError.
+    """
+
+    def __init__(self, PrimerSet, PF, PR, ErrF, ErrR, TargetLen, Spacers='N', Cutoff=None, MaxEE=None, \
+        MinQual=None, TruncQ=None, MaxN=None):
+        #Several comma separated primer sets are demultiplexed in one pass, each to its own output
+        self.Markers = PrimerSetList(PrimerSet)
+        self.Multi = len(self.Markers) > 1
+        self.Spacers = Spacers.upper()
+        self.Lengths = [MarkerLength(Marker, TargetLen) for Marker in self.Markers]
+        self.PrimerDicts = []
+        for Marker in self.Markers:
+            PrimerDict = PrimerSetPrimers(Marker, PF, PR)
+            if PrimerDict is None:
+                raise ValueError(Marker + ' is not in the Primer Sets List!')
+            self.PrimerDicts.append(PrimerDict)
+        self.ErrorDict = {'pF': int(ErrF), 'pR': int(ErrR)}
+        self.Length = self.Lengths if self.Multi else self.Lengths[0]
+        if Cutoff is None:
+            if 0 in self.Lengths:
+                raise ValueError('A length cutoff is needed for a marker length of 0.')
+            self.Cutoffs = [TrimCutoff(n) for n in self.Lengths]
+        elif isinstance(Cutoff, list):
+            self.Cutoffs = Cutoff
         else:
-            with gzip.open(InReverse) as infile:
-                print ('Trimming primers sample', sample, 'reverse.')
-                for line in infile:
-                    LineCurr = line.strip().decode('ascii')
-                    readbuffer.append(LineCurr)
-                    if len(readbuffer) == 4:
-                        reads += 1
-                        if reads % 10000 == 0:
-                            print ('Read:', reads, end='\r')
-                        TrimPrimers('pR','pF')
-                        if re.match('[ATCGN]', Seq):
-                            RSeqs += 1
-                            if name[0] in FSeqs:
-                                if len(Seq) > cutoff:
-                                    Foutfile.write("%s\n%s\n+\n%s\n" % (FNames[name[0]],FSeqs[name[0]],FQuals[name[0]]))
-                                    Routfile.write("%s\n%s\n+\n%s\n" % (readbuffer[0],Seq,Qual))
-                                    FinalSeqs += 1
-                                else:
-                                    Shorts += 1
-                        readbuffer = []
-                print(reads, 'total raw reads.')
-        Foutfile.close()
-        Routfile.close()
+            self.Cutoffs = [Cutoff] * len(self.Markers)
+        self.Matchers = MarkerMatchers(self.PrimerDicts, self.ErrorDict)
+        self.Classifiers = {}
+        if self.Spacers == 'Y':
+            self.Classifiers = {'pF': SpacerClassifier(FSpacers), 'pR': SpacerClassifier(RSpacers)}
+        #Trimmed reads are quality filtered in the same pass when any quality filter is set
+        self.Filter = None
+        if (MaxEE, MinQual, TruncQ, MaxN) != (None, None, None, None):
+            self.Filter = QualityFilter(MaxEE, MinQual, TruncQ, MaxN)
+
+    def __repr__(self):
+        return 'Trimmer(%r, errors %r, lengths %r, spacers %r)' % (self.Markers, self.ErrorDict, self.Lengths, \
+            self.Spacers)
+
+    #Spacer label most of Records (forward reads, or reverse reads if Reverse) start with, and the count
+    #of each spacer
+    def spacer(self, Records, Reverse=False):
+        return DominantSpacer([Records], RSpacers if Reverse else FSpacers)
+
+    def trim_batch(self, Records, Reverse=False, Spacer=None):
+        """Trim a batch of (name, sequence, quality) records from forward files, or reverse files if
+        Reverse, without copying any sequence. Returns arrays of the target start, the target end,
+        the primer set number, the status (a number from ReadStatuses) and the spacer number (-1 for
+        none) of every record. Records are bytes, as read by ReadFastq with Decode=False; str records
+        are encoded first. With spacers, Spacer is the sample's spacer label and reads starting with
+        another spacer are not trimmed.
+        """
+        if Records and isinstance(Records[0][1], str):
+            Records = [tuple(Field.encode('ascii') for Field in Record) for Record in Records]
+        Primer1, Primer2 = ('pR', 'pF') if Reverse else ('pF', 'pR')
+        if Spacer is not None and self.Classifiers:
+            Spacer = (self.Classifiers[Primer1], Spacer)
+        else:
+            Spacer = None
+        Results, Labels = TrimBatch(Records, self.Matchers[Primer1], self.Matchers[Primer2], self.Length, Spacer, \
+            Filter=self.Filter)
+        Starts = array.array('q', [0]) * len(Records)
+        Ends = array.array('q', [0]) * len(Records)
+        Markers = array.array('b', [0]) * len(Records)
+        Status = array.array('b', [0]) * len(Records)
+        Spacers = array.array('b', [-1] * len(Records) if Labels is None else Labels)
+        for n, (Read, Trim) in enumerate(zip(Records, Results)):
+            if not Trim:
+                Status[n] = 1 if Trim is None else 2
+                continue
+            #Targets end at the read's end or, quality filtered, before their first low quality base
+            Start = Trim[0]
+            End = min(Trim[3] if self.Filter is not None else Trim[1], len(Read[1]))
+            Marker = Trim[2] if len(Trim) > 2 else 0
+            Starts[n] = Start
+            Ends[n] = max(End, Start)
+            Markers[n] = Marker
+            if Start >= min(Trim[1], len(Read[1])) or Read[1][Start] not in Bases:
+                Status[n] = 3
+            elif End - Start <= self.Cutoffs[Marker]:
+                Status[n] = 4
+            elif self.Filter is not None and Trim[4]:
+                Status[n] = 4 + Trim[4]
+        return Starts, Ends, Markers, Status, Spacers
+
+    def trim_pair(self, Forward, Reverse, Spacers=None):
+        """Trim one read pair of (name, sequence, quality) records. Returns the status (a number from
+        PairStatuses), the primer set number and the forward and reverse target starts and ends. With
+        spacers, Spacers is the sample's (forward, reverse) spacer labels.
+        """
+        F = self.trim_batch([Forward], False, Spacers[0] if Spacers else None)
+        R = self.trim_batch([Reverse], True, Spacers[1] if Spacers else None)
+        FStatus = F[3][0]
+        RStatus = R[3][0]
+        if FStatus in (1, 2, 3):
+            Status = 1
+        elif RStatus in (1, 2, 3):
+            Status = 2
+        elif F[2][0] != R[2][0]:
+            Status = 3
+        else:
+            #Short before quality filtered, and the forward read's quality filter first
+            Status = 4 if 4 in (FStatus, RStatus) else FStatus or RStatus
+        return Status, F[2][0], F[0][0], F[1][0], R[0][0], R[1][0]
+
+    #(primer set number, target record, quality filter failure) of a read trimmed by TrimBatch, or None
+    #if no target starting with one of Bases was found
+    def _target(self, Read, Trim):
+        if not Trim:
+            return None
+        Seq = Read[1][Trim[0]:Trim[1]]
+        if not Seq or Seq[0] not in Bases:
+            return None
+        End = Trim[1]
+        Fail = 0
+        if self.Filter is not None:
+            #Quality filtered targets end before their first low quality base
+            End = Trim[3]
+            Fail = Trim[4]
+            Seq = Seq[:End - Trim[0]]
+        return Trim[2] if self.Multi else 0, (Read[0], Seq, Read[2][Trim[0]:End]), Fail
+
+    def trim_sample(self, InForward, InReverse, Workers=1, BatchSize=10000, Decompress='auto', Compress=0, \
+        CompressThreads=None, Compressor='auto', Windows=False, Metrics=False, Derep=None, DerepMax=250000, \
+        IndexEvery=10000, Pipeline=False, QueueDepth=4, Batches=None, Writer=None, Sample=None):
+        """Trim a pair of fastq or fastq.gz files into the results directories of the current directory,
+        as MetaTrim does. Returns the sample's summary row for each primer set, its metrics (with
+        Metrics) and its spacer counts (with spacers), or None for those not kept.
+
+        Batches, a pair of (forward, reverse) batch iterables, are trimmed instead of the files. With a
+        FastqWriter as Writer, the kept pairs of a single primer set are written to it, each forward
+        read followed by its reverse read, instead of to TrimmedFastqs, and it is left open. Sample
+        names the sample instead of InForward.
+        """
+        Clock = time.perf_counter()
+        if Metrics:
+            ResetPeakMemory()
+        Markers, Multi, Spacers, Length, Cutoffs, Matchers, Filter = self.Markers, self.Multi, self.Spacers, \
+            self.Length, self.Cutoffs, self.Matchers, self.Filter
+        if Windows and Multi:
+            print ('Adaptive windows are only used with a single primer set.')
+            Windows = False
+        Metric = None
+        SpacerCounts = None
+        Names = MarkerNames(os.path.basename(os.getcwd()), Markers)
+
+        #Create results directories
+        for ResDirName in ResultDirs(Names, Derep) if Writer is None else []:
+            try:
+                os.mkdir(ResDirName)
+                print("Directory " , ResDirName ,  " Created ") 
+            except FileExistsError:
+                pass
+
+        sample = Sample or SampleName(InForward)
+        print ('Processing:', InForward)
+        print ('Processing:', InReverse)
+        FSpacer = None
+        RSpacer = None
+
+        #Batches of reads are trimmed in worker processes and handed back in file order
+        TrimPool = None
+        if Workers > 1:
+            import multiprocessing
+            TrimPool = multiprocessing.Pool(Workers, InitTrimWorker, (self.PrimerDicts, self.ErrorDict, Length))
+
+        #Counts for each primer set
+        nFSeqs = [0] * len(Markers)
+        RSeqs = [0] * len(Markers)
+        FinalSeqs = [0] * len(Markers)
+        Shorts = [0] * len(Markers)
+        CorrSpacerCount = [0] * len(Markers)
+        #Pairs assigned to each primer set by a forward target long enough to keep
+        Assigned = [0] * len(Markers)
+        Rejects = [[0] * len(Rejections) for Marker in Markers]
+        Mixed = 0
+        Freads = 0
+        reads = 0
+        #Reads starting with each spacer in each direction and pairs with each forward and reverse spacer.
+        #Reads without a spacer are labelled -1, so they are counted in the last place.
+        FSpacerCounts = [0] * (len(FSpacers) + 1)
+        RSpacerCounts = [0] * (len(RSpacers) + 1)
+        SpacerPairs = [[0] * (len(RSpacers) + 1) for n in range(len(FSpacers) + 1)]
+        Spill = None
+        #Every reverse read is counted and its target kept, whether it is paired in lockstep or on disk
+        def CountReverse(Read, Trim, RLabel):
+            nonlocal reads
+            reads += 1
+            RSpacerCounts[RLabel] += 1
+            if reads % 10000 == 0:
+                print ('Read:', reads, end='\r')
+            Target = self._target(Read, Trim)
+            if Target is None:
+                return None, 0, 0
+            RSeqs[Target[0]] += 1
+            return Target[1], Target[0], Target[2]
+        def SpillReverse(Read, Trim, RLabel, RStored, RMarker, RFail):
+            if Spacers == 'Y':
+                Spill.add_spacer(ReadName(Read[0]), RLabel, True)
+            if Trim is not False:
+                Spill.add_reverse(reads, ReadName(Read[0]), RStored, RMarker, RFail)
+        Outputs = TrimmedPaths(Names, sample, Compress) if Writer is None else []
+        Foutfiles = [] if Writer is None else [Writer]
+        Routfiles = [] if Writer is None else [Writer]
+        Times = StageTimes() if Metrics else None
+        #Written pairs are also counted by sequence and written once each to DerepFastqs
+        Dereps = []
+        DerepOutputs = []
+        DerepStats = []
+        if Derep:
+            Dereps = [PairDereplicator(Name+'TrimmedFastqs', Derep, DerepMax) for Name in Names]
+            DerepOutputs = DerepPaths(Names, sample, Compress)
+        #Pipelined, each input file is read and each output file written by a thread of its own, through
+        #queues of at most QueueDepth batches
+        Depth = QueueDepth if Pipeline else 0
+        Prefetches = []
+        try:
+            #Reads are written to .part files, which are only renamed once the whole sample is trimmed
+            for FPath, RPath in Outputs:
+                Foutfiles.append(FastqWriter(FPath+'.part', Compress, CompressThreads, Compressor, IndexEvery, Depth))
+                Routfiles.append(FastqWriter(RPath+'.part', Compress, CompressThreads, Compressor, IndexEvery, Depth))
+            print ('Trimming primers sample', sample, 'forward and reverse.')
+            TrimStart = time.perf_counter()
+            if Batches is None:
+                FBatches = ReadFastq(InForward, BatchSize, Decompress, False)
+                RBatches = ReadFastq(InReverse, BatchSize, Decompress, False)
+            else:
+                FBatches, RBatches = Batches
+            if Pipeline:
+                from pipeline import Prefetch
+                FBatches = Prefetch(FBatches, 'forward reads', QueueDepth)
+                Prefetches.append(FBatches)
+                RBatches = Prefetch(RBatches, 'reverse reads', QueueDepth)
+                Prefetches.append(RBatches)
+            if Metrics:
+                FBatches = TimedBatches(FBatches, Times, 'decompression')
+                RBatches = TimedBatches(RBatches, Times, 'decompression')
+            FWindows = None
+            RWindows = None
+            if Windows or Spacers == 'Y':
+                #The sample's spacers and the primer windows are learnt from the first reads of each file,
+                #which are then trimmed with the rest without being read again
+                FLead, FBatches = LeadingBatches(FBatches, SpacerReads if Spacers == 'Y' else 1)
+                RLead, RBatches = LeadingBatches(RBatches, SpacerReads if Spacers == 'Y' else 1)
+            if Spacers == 'Y':
+                FMaxS, Count = DominantSpacer(FLead, FSpacers)
+                SpacerReport(sample, 'forward', Count, FMaxS)
+                RMaxS, Count = DominantSpacer(RLead, RSpacers)
+                SpacerReport(sample, 'reverse', Count, RMaxS)
+                FSpacer = (self.Classifiers['pF'], FMaxS)
+                RSpacer = (self.Classifiers['pR'], RMaxS)
+            if Windows:
+                FWindows = LearnWindows(FLead[0] if FLead else [], Matchers['pF'], Matchers['pR'], Length)
+                RWindows = LearnWindows(RLead[0] if RLead else [], Matchers['pR'], Matchers['pF'], Length)
+            FStats = [0, 0, 0, 0]
+            RStats = [0, 0, 0, 0]
+            FRecords = TrimmedRecords(TrimBatches(FBatches, 'pF', 'pR', FSpacer, Matchers, Length, TrimPool, \
+                2*Workers, FWindows, FStats, Times, Filter))
+            RRecords = TrimmedRecords(TrimBatches(RBatches, 'pR', 'pF', RSpacer, Matchers, Length, TrimPool, \
+                2*Workers, RWindows, RStats, Times, Filter))
+            #Forward and reverse reads are read in lockstep and each pair is decided as it is read.
+            #If the read names stop matching, the rest of both files is paired through a PairSpill.
+            while True:
+                FRec = next(FRecords, None)
+                RRec = None
+                if Spill is None:
+                    RRec = next(RRecords, None)
+                if FRec is None and RRec is None:
+                    break
+                FStored = None
+                FMarker = 0
+                FFail = 0
+                if FRec is not None:
+                    Read, Trim, FLabel = FRec
+                    Freads += 1
+                    FSpacerCounts[FLabel] += 1
+                    Target = self._target(Read, Trim)
+                    if Target is not None:
+                        FMarker, Stored, FFail = Target
+                        nFSeqs[FMarker] += 1
+                        if len(Stored[1]) > Cutoffs[FMarker]:
+                            FStored = Stored
+                            Assigned[FMarker] += 1
+                RStored = None
+                RMarker = 0
+                RFail = 0
+                if RRec is not None:
+                    RLabel = RRec[2]
+                    RStored, RMarker, RFail = CountReverse(*RRec)
+                RSeq = RStored[1] if RStored is not None else None
+                if Spill is None and FRec is not None and RRec is not None \
+                    and ReadName(FRec[0][0]) == ReadName(RRec[0][0]):
+                    SpacerPairs[FLabel][RLabel] += 1
+                    if FStored is not None:
+                        if RRec[1] is not False:
+                            CorrSpacerCount[FMarker] += 1
+                        if RStored is not None and RMarker != FMarker:
+                            Mixed += 1
+                        elif RStored is not None:
+                            if len(RSeq) > Cutoffs[FMarker] and (FFail or RFail):
+                                Rejects[FMarker][(FFail or RFail) - 1] += 1
+                            elif len(RSeq) > Cutoffs[FMarker]:
+                                Foutfiles[FMarker].write(FStored)
+                                Routfiles[FMarker].write(RStored)
+                                if Dereps:
+                                    Dereps[FMarker].add(FStored, RStored)
+                                FinalSeqs[FMarker] += 1
+                            else:
+                                Shorts[FMarker] += 1
+                    continue
+                if Spill is None:
+                    print ('Forward and reverse reads are not in the same order. Pairing the rest of', \
+                        sample, 'on disk.')
+                    Spill = PairSpill(Names[0]+'TrimmedFastqs' if Writer is None else None)
+                if Spacers == 'Y' and FRec is not None:
+                    Spill.add_spacer(ReadName(FRec[0][0]), FLabel)
+                if FStored is not None:
+                    Spill.add_forward(ReadName(FStored[0]), FStored, FMarker, FFail)
+                if RRec is not None:
+                    SpillReverse(*RRec, RStored, RMarker, RFail)
+            if Spill is not None:
+                for RRec in RRecords:
+                    SpillReverse(*RRec, *CountReverse(*RRec))
+                Spill.count_spacers(SpacerPairs)
+                Counts = Spill.join(Foutfiles, Routfiles, Cutoffs, Dereps)
+                for n in range(len(Markers)):
+                    FinalSeqs[n] += Counts[0][n]
+                    Shorts[n] += Counts[1][n]
+                    CorrSpacerCount[n] += Counts[2][n]
+                    for Reason in range(len(Rejections)):
+                        Rejects[n][Reason] += Counts[4][n][Reason]
+                Mixed += Counts[3]
+            for Dereplicator, (FPath, RPath) in zip(Dereps, DerepOutputs):
+                with FastqWriter(FPath+'.part', Compress, CompressThreads, Compressor, IndexEvery) as Fderep, \
+                    FastqWriter(RPath+'.part', Compress, CompressThreads, Compressor, IndexEvery) as Rderep:
+                    DerepStats.append(Dereplicator.write(Fderep, Rderep))
+                print (DerepStats[-1][0], 'trimmed pairs in', sample, 'are', DerepStats[-1][1], 'unique pairs.')
+            print(Freads, 'forward and', reads, 'reverse total raw reads.')
+            if Multi:
+                print (Mixed, 'read pairs in', sample, 'had forward and reverse primers from different primer sets.')
+            if Windows:
+                WindowReport(sample, 'forward', FWindows, FStats)
+                WindowReport(sample, 'reverse', RWindows, RStats)
+        finally:
+            for Reader in Prefetches:
+                Reader.close()
+            for outfile in Foutfiles + Routfiles:
+                if outfile is not Writer:
+                    outfile.close()
+            if TrimPool is not None:
+                TrimPool.terminate()
+        if Pipeline:
+            from pipeline import QueueReport
+            Queues = [Reader.Queue.stats() for Reader in Prefetches] + \
+                [outfile.Queue.stats() for outfile in (Foutfiles + Routfiles if Writer is None else [Writer]) \
+                if outfile.Queue is not None]
+            for Line in QueueReport(Queues):
+                print (sample, Line)
+        for Path in OutputFiles(Outputs + DerepOutputs):
+            os.replace(Path+'.part', Path)
+            if Compress and Compressor == 'bgzf':
+                for Part, Index in zip(IndexPaths(Path+'.part'), IndexPaths(Path)):
+                    os.replace(Part, Index)
+        if Metrics:
+            #Pairing is whatever trimming time the other stages of this process do not account for.
+            #Pipelined, reading and writing only count for as long as trimming waited for them.
+            Times['write'] = sum(outfile.Waited if Pipeline else outfile.Seconds for outfile in Foutfiles + Routfiles)
+            Times['dereplication'] = sum(Dereplicator.Seconds for Dereplicator in Dereps)
+            Measured = ['decompression', 'worker wait', 'write', 'dereplication']
+            if TrimPool is None:
+                Measured += ['spacer check', 'primer match', 'opposite primer search', 'quality filter']
+            Times['pairing'] = max(0.0, time.perf_counter() - TrimStart - sum(Times[Stage] for Stage in Measured))
+            Seconds = time.perf_counter() - Clock
+            Metric = {'Sample': sample, 'Reads': reads, 'ForwardReads': Freads, \
+                'Seconds': round(Seconds, 3), 'ReadsPerSec': round(reads / Seconds) if Seconds else 0, \
+                'PeakMemoryKB': PeakMemory(), 'Workers': Workers, \
+                'Stages': {Stage: round(Times[Stage], 3) for Stage in Times}}
+            if Pipeline:
+                Metric['Queues'] = Queues
         if Spacers == 'Y':
-            CorrSpacerCount = sum(CorSpacer.values())
-            IncorrSpacerCount = reads - CorrSpacerCount
-            outsum.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (sample, reads, nFSeqs, RSeqs, \
-                FinalSeqs, Shorts, CorrSpacerCount, IncorrSpacerCount))
+            SpacerCounts = {'Sample': sample, 'Forward': FMaxS, 'Reverse': RMaxS, \
+                'ForwardReads': FSpacerCounts, 'ReverseReads': RSpacerCounts, 'Pairs': SpacerPairs}
+        Rows = []
+        for n in range(len(Markers)):
+            Counts = [sample, reads, nFSeqs[n], RSeqs[n], FinalSeqs[n], Shorts[n]]
+            if Spacers == 'Y':
+                #With several primer sets, a pair without a forward target belongs to none of them, so each
+                #primer set only counts the pairs assigned to it
+                IncorrSpacerCount = (Assigned[n] if Multi else reads) - CorrSpacerCount[n]
+                Counts += [CorrSpacerCount[n], IncorrSpacerCount]
+            if Filter is not None:
+                Counts += Rejects[n]
+            if Derep:
+                Counts += DerepStats[n][1:]
+            Rows.append(SummaryRow(*Counts))
+        return Rows, Metric, SpacerCounts
+
+#Trim the primers from one sample's pair of fastq or fastq.gz files with a Trimmer and write its trim
+#summary. Returns the sample's summary row, or a list of rows in primer set order when demultiplexing
+#several primer sets.
+def MetaTrim(InForward, InReverse, PrimerSet, PF, PR, ErrF, ErrR, TargetLen, Spacers, Cutoff=None, \
+    WriteSummary=True, Workers=1, BatchSize=10000, Decompress='auto', Compress=0, CompressThreads=None, \
+    Compressor='auto', Windows=False, Metrics=False, Derep=None, DerepMax=250000, IndexEvery=10000, \
+    Pipeline=False, QueueDepth=4, MaxEE=None, MinQual=None, TruncQ=None, MaxN=None):
+    start = datetime.now().time()
+    #Define the primer set if not in the list
+    for Marker in PrimerSetList(PrimerSet):
+        if PrimerSetPrimers(Marker, PF, PR) is None:
+            print (Marker,"is not in the Primer Sets List!")
+            if __name__ == '__main__':
+                exit()
+            return None
+        elif Marker == 'OTHER':
+            print ('Primer set is ', Marker,'. F: ', PF.upper(), 'R: ', PR.upper())
         else:
-            outsum.write("%s\t%s\t%s\t%s\t%s\t%s\n" % (sample, reads, nFSeqs, RSeqs, FinalSeqs, Shorts))
-    else:
-        print ("MetaTrim only works on paired zipped fastq files!")
+            print ('Primer set is ', Marker)
+    if not re.search('R1_001\.fastq', InForward) or not re.search('R2_001\.fastq', InReverse):
+        print ("MetaTrim only works on paired fastq or fastq.gz files!")
+        return None
+
+    #Create degenerate primer matchers
+    print ('Making degenerate primer matchers.')
+    if Cutoff is None:
+        #MetaTrim asks for the cutoff of a marker length of 0, as it always has
+        Cutoff = [TrimCutoff(MarkerLength(Marker, TargetLen)) for Marker in PrimerSetList(PrimerSet)]
+    SampleTrimmer = Trimmer(PrimerSet, PF, PR, ErrF, ErrR, TargetLen, Spacers, Cutoff, MaxEE, MinQual, TruncQ, MaxN)
+    Rows, Metric, SpacerCounts = SampleTrimmer.trim_sample(InForward, InReverse, Workers, BatchSize, Decompress, \
+        Compress, CompressThreads, Compressor, Windows, Metrics, Derep, DerepMax, IndexEvery, Pipeline, QueueDepth)
+    sample = SampleName(InForward)
+    if Metric is not None:
+        SampleMetrics[sample] = Metric
+    if SpacerCounts is not None:
+        SampleSpacers[sample] = SpacerCounts
     end = datetime.now().time()
-    if __name__ != '__main__':
+    if WriteSummary:
+        basenm = os.path.basename(os.getcwd())
+        for Name, Row in zip(MarkerNames(basenm, SampleTrimmer.Markers), Rows):
+            outsumname = Name+'TrimSummary.txt'
+            with open(outsumname, "w") as outsum:
+                outsum.write(SummaryHeader(Spacers, Derep, SampleTrimmer.Filter is not None))
+                outsum.write(Row)
+        if Metrics:
+            WriteMetrics(basenm, [Metric])
+        if SpacerCounts is not None:
+            WriteSpacerCounts(basenm+'SpacerCounts.txt', [SpacerCounts])
         print ('MetaTrim start:', start, '\n', 'MetaTrim end:', end) 
-        outsum.close()
+    #One summary row, or a list of rows in primer set order when demultiplexing several primer sets
+    if SampleTrimmer.Multi:
+        return Rows
+    return Rows[0]
 
+#Trim one sample streamed from a pair of fastq or fastq.gz files, or from one interleaved file when
+#InReverse is None, where '-' is stdin. Kept pairs are written to Output ('-' for stdout) as
+#interleaved fastq, each forward read followed by its reverse read, for piping straight into a merger
+#without writing TrimmedFastqs. Everything MetaTrim prints goes to stderr instead, ending with the
+#trim summary, which is also written to SummaryFile. Sample names the sample in the summary. Returns
+#the summary row, or None if the sample could not be trimmed.
+def MetaTrimStream(InForward, InReverse, PrimerSet, PF, PR, ErrF, ErrR, TargetLen, Spacers, Cutoff=None, \
+    Output='-', SummaryFile=None, Sample=None, Workers=1, BatchSize=10000, Decompress='auto', Compress=0, \
+    CompressThreads=None, Compressor='auto', Windows=False, Pipeline=False, QueueDepth=4, MaxEE=None, \
+    MinQual=None, TruncQ=None, MaxN=None):
+    Out = sys.stdout.buffer if Output == '-' else Output
+    with contextlib.redirect_stdout(sys.stderr):
+        if len(PrimerSetList(PrimerSet)) > 1:
+            print ('Streaming trims one primer set at a time.')
+            return None
+        if InForward == '-' and InReverse == '-':
+            print ('Only one of the forward and reverse reads can be read from stdin. Interleave them instead.')
+            return None
+        if Compress and Compressor == 'bgzf':
+            print ('Streamed output cannot be indexed, so it cannot be written as BGZF.')
+            return None
+        if Cutoff is None and MarkerLength(PrimerSet, TargetLen) == 0:
+            print ('With a marker length of 0, give the length cutoff.')
+            return None
+        try:
+            StreamTrimmer = Trimmer(PrimerSet, PF, PR, ErrF, ErrR, TargetLen, Spacers, Cutoff, MaxEE, MinQual, \
+                TruncQ, MaxN)
+        except ValueError as Error:
+            print (Error)
+            return None
+        if Sample is None:
+            Sample = 'stdin' if InForward == '-' else os.path.basename(InForward).split('_')[0]
+        if InReverse is None:
+            Batches = ReadInterleaved(InForward, BatchSize, Decompress)
+        else:
+            Batches = (ReadFastq(InForward, BatchSize, Decompress, False), \
+                ReadFastq(InReverse, BatchSize, Decompress, False))
+        with FastqWriter(Out, Compress, CompressThreads, Compressor, Depth=QueueDepth if Pipeline else 0) as Writer:
+            Rows, Metric, SpacerCounts = StreamTrimmer.trim_sample(InForward, InReverse or InForward, Workers, \
+                BatchSize, Decompress, Windows=Windows, Pipeline=Pipeline, QueueDepth=QueueDepth, Batches=Batches, \
+                Writer=Writer, Sample=Sample)
+        Summary = SummaryHeader(Spacers, None, StreamTrimmer.Filter is not None) + Rows[0]
+        print (Summary, end='')
+        if SummaryFile:
+            with open(SummaryFile, 'w') as outsum:
+                outsum.write(Summary)
+    return Rows[0]
+
+#Find the R1/R2 fastq or fastq.gz pairs in each subdirectory of Dir
+def FindSamplePairs(Dir='.'):
+    Pairs = []
+    for x in sorted(os.listdir(Dir)):
+        #Open all subdirectories in parent directory
+        SubDir = os.path.join(Dir, x) if Dir != '.' else x
+        #Trimmed and dereplicated reads from an earlier run are not samples
+        if os.path.isdir(SubDir) and not x.endswith(('TrimmedFastqs', 'DerepFastqs')):
+            InF = None
+            #Find fastq files
+            for y in sorted(os.listdir(SubDir)):
+                if re.search('\.fastq(\.gz)?$', y):
+                    #Find forward fastq file
+                    if re.search('R1_001\.fastq', y):
+                        InF = SubDir+'/'+y
+                    elif re.search('R2_001\.fastq', y) and InF:
+                        Pairs.append((InF, SubDir+'/'+y))
+    return Pairs
+
+#Trimmed (forward, reverse) files of a sample for each primer set's results name
+def TrimmedPaths(Names, sample, Compress=0):
+    OutExt = '.fastq.gz' if Compress else '.fastq'
+    return [(Name+'TrimmedFastqs/'+sample+'_R1_001'+OutExt, Name+'TrimmedFastqs/'+sample+'_R2_001'+OutExt) \
+        for Name in Names]
+
+#Dereplicated (forward, reverse) files of a sample for each primer set's results name
+def DerepPaths(Names, sample, Compress=0):
+    OutExt = '.fastq.gz' if Compress else '.fastq'
+    return [(Name+'DerepFastqs/'+sample+'_R1_001'+OutExt, Name+'DerepFastqs/'+sample+'_R2_001'+OutExt) \
+        for Name in Names]
+
+#Every file written for (forward, reverse) output paths, with the index files of BGZF output
+def OutputFiles(Paths, Compress=0, Compressor='auto'):
+    Files = [Path for Pair in Paths for Path in Pair]
+    if Compress and Compressor == 'bgzf':
+        Files = [Index for Path in Files for Index in [Path] + IndexPaths(Path)]
+    return Files
+
+#Result directories for each primer set's results name
+def ResultDirs(Names, Derep=None):
+    Dirs = [Name+'TrimmedFastqs' for Name in Names]
+    if Derep:
+        Dirs += [Name+'DerepFastqs' for Name in Names]
+    return Dirs
+
+#Sample name of a forward read file: everything before the first underscore
+def SampleName(InForward):
+    return InForward[0:re.search('_', InForward).start()]
+
+#Trim one sample pair in a worker process and hand back its summary row, its metrics and its spacer
+#counts. With a Profile file name the sample is trimmed under cProfile and the profile is saved there.
+def TrimSample(Task):
+    Args, Kwargs, Profile = Task
+    SampleMetrics.clear()
+    SampleSpacers.clear()
+    if Profile:
+        import cProfile
+        Profiler = cProfile.Profile()
+        Row = Profiler.runcall(MetaTrim, *Args, WriteSummary=False, **Kwargs)
+        Profiler.dump_stats(Profile)
+        print ('Profile of', SampleName(Args[0]), 'written to', Profile)
+    else:
+        Row = MetaTrim(*Args, WriteSummary=False, **Kwargs)
+    return Row, list(SampleMetrics.values()), list(SampleSpacers.values())
+
+#Add a sample's summary row (or one row per primer set) to the open trim summaries
+def WriteRows(outsums, Row):
+    if not Row:
+        return
+    if isinstance(Row, str):
+        Row = [Row]
+    for outsum, MarkerRow in zip(outsums, Row):
+        outsum.write(MarkerRow)
+        outsum.flush()
+
+#Trim every sample pair below the parent directory and write the run summary. Jobs samples are
+#trimmed at a time. With one job at a time, each sample's reads are split across Workers processes.
+#PrimerSet may list several comma separated primer sets, which are demultiplexed in one pass.
+#With Metrics, stage times of every sample are written to <dir>TrimMetrics.json and .tsv. The sample
+#named Profile is trimmed under cProfile and its profile saved to <dir><sample>.prof.
+#Samples recorded in <dir>TrimManifest.json as trimmed with the same settings, whose input and
+#trimmed files have not changed since, are skipped unless Force is set. Hash compares inputs by
+#content instead of by size and modification time. With Spacers Y, the reads starting with each
+#spacer and the pairs with each spacer combination are written to <dir>SpacerCounts.txt. With Derep,
+#every sample's unique read pairs are also written to <dir>DerepFastqs with their abundances,
+#combining quality scores by Derep. With Pipeline, reading, trimming and writing each sample overlap
+#in threads joined by queues of QueueDepth batches. MaxEE, MinQual, TruncQ and MaxN quality filter
+#the trimmed pairs, as in quality.py.
+#Samples are listed in SampleSheet if it exists, and otherwise found in Dir and saved to SampleSheet.
+#With Shard, this process is one node of a sharded run: it trims only the samples it claims in
+#<dir>Shards, as in shard.py, and the run summary is written by whichever node finishes last, or by
+#Merge once every sample is finished.
+#With Calibrate, the trimmed pairs of CalibrateReads read pairs drawn from each sample are counted at
+#0 to Calibrate errors in each primer and written to <dir>ErrorCalibration.txt, as in calibrate.py. With
+#AutoErrors every sample is then trimmed with the most errors recommended for any sample, instead of
+#ErrF and ErrR, and otherwise nothing is trimmed.
+#With Preview, nothing is trimmed either: the trim summary of every sample is estimated from about
+#PreviewReads of its read pairs, as in preview.py, taking at most PreviewSeconds for gzip files that
+#cannot be read from their middle.
+def MetaTrimAll(PrimerSet, PF, PR, ErrF, ErrR, TargetLen, Spacers, Jobs=1, Dir='.', Workers=1, \
+    Decompress='auto', Compress=0, CompressThreads=None, Compressor='auto', Windows=False, Metrics=False, \
+    Profile=None, Force=False, Hash=False, Derep=None, DerepMax=250000, IndexEvery=10000, Pipeline=False, \
+    QueueDepth=4, MaxEE=None, MinQual=None, TruncQ=None, MaxN=None, SampleSheet=None, Shard=False, Node=None, \
+    ClaimTimeout=0, Merge=False, Calibrate=None, CalibrateReads=10000, CalibrateLoss=0.005, AutoErrors=False, \
+    Preview=False, PreviewReads=2000, PreviewSeconds=5.0):
+    start = datetime.now()
+    Markers = PrimerSetList(PrimerSet)
+    for Marker in Markers:
+        if PrimerSetPrimers(Marker, PF, PR) is None:
+            print (Marker,"is not in the Primer Sets List!")
+            return
+    Cutoffs = [TrimCutoff(MarkerLength(Marker, TargetLen)) for Marker in Markers]
+    Cutoff = Cutoffs if len(Markers) > 1 else Cutoffs[0]
+    basenm = os.path.basename(os.path.abspath(Dir))
+    Names = MarkerNames(basenm, Markers)
+
+    #Create results directories
+    for ResDirName in ResultDirs(Names, Derep):
+        try:
+            os.mkdir(ResDirName)
+            print("Directory " , ResDirName ,  " Created ") 
+        except FileExistsError:
+            pass
+
+    if SampleSheet and os.path.exists(SampleSheet):
+        Pairs = ReadSampleSheet(SampleSheet)
+    else:
+        Pairs = FindSamplePairs(Dir)
+        if SampleSheet:
+            WriteSampleSheet(SampleSheet, Pairs)
+            print ('Samples listed in', SampleSheet)
+    if Preview:
+        PreviewAll(Pairs, Markers, PF, PR, ErrF, ErrR, TargetLen, Spacers, Cutoffs, Jobs, PreviewReads, \
+            PreviewSeconds, basenm, MaxEE, MinQual, TruncQ, MaxN)
+        return
+    if Calibrate is not None:
+        #Every sample is calibrated, and with AutoErrors trimmed with the most errors any sample needs
+        Best = CalibrateAll(Pairs, Markers, PF, PR, TargetLen, Cutoffs, Calibrate, Jobs, Decompress, \
+            CalibrateReads, CalibrateLoss, basenm)
+        if not AutoErrors or Best is None:
+            return
+        ErrF, ErrR = Best
+        print ('Trimming every sample with', ErrF, 'forward and', ErrR, 'reverse primer errors.')
+
+    #Everything that changes the trimmed reads or the summary rows
+    Parameters = {'PrimerSets': [[Marker, PrimerSetPrimers(Marker, PF, PR), MarkerLength(Marker, TargetLen)] \
+        for Marker in Markers], 'ErrF': int(ErrF), 'ErrR': int(ErrR), 'Spacers': Spacers.upper(), \
+        'Cutoffs': Cutoffs, 'Compress': bool(Compress), 'Windows': Windows, 'Derep': Derep, \
+        'Index': IndexEvery if Compress and Compressor == 'bgzf' else None, \
+        'Quality': {'MaxEE': MaxEE, 'MinQual': MinQual, 'TruncQ': TruncQ, 'MaxN': MaxN}}
+    Quality = (MaxEE, MinQual, TruncQ, MaxN) != (None, None, None, None)
+    Header = SummaryHeader(Spacers, Derep, Quality)
+    if Shard or Merge:
+        #Nodes of a sharded run share claims and results through <dir>Shards instead of the manifest
+        Claims = ShardClaims(basenm+'Shards', Parameters, Node, ClaimTimeout)
+        if not Merge:
+            print ('Trimming the samples claimed by node', Claims.Node)
+    if Merge:
+        MergeShards(Claims, Pairs, Names, Header, basenm)
+        return
+    Manifest = RunManifest(basenm+'TrimManifest.json', Hash)
+    Finished = {}
+    ToTrim = []
+    for InF, InR in Pairs:
+        Rows = None if Force or Shard else Manifest.rows(InF, [InF, InR], Parameters)
+        if Rows is None:
+            ToTrim.append((InF, InR))
+        else:
+            Finished[InF] = Rows
+    if Finished:
+        print ('Skipping', len(Finished), 'samples already trimmed with the same settings.')
+
+    SamplePool = Jobs > 1 and len(ToTrim) > 1
+    if SamplePool and Workers > 1:
+        print ('Trimming', min(Jobs, len(ToTrim)), 'samples at a time, so each sample uses one process.')
+        Workers = 1
+    #Samples trimmed at the same time share the cores compressing their output files
+    if SamplePool and CompressThreads is None:
+        CompressThreads = max(1, (os.cpu_count() or 1) // min(Jobs, len(ToTrim)))
+    Tasks = []
+    for InF, InR in ToTrim:
+        ProfileName = None
+        if Profile and os.path.basename(SampleName(InF)) == Profile:
+            ProfileName = basenm+Profile+'.prof'
+        Tasks.append(((InF, InR, Markers, PF, PR, ErrF, ErrR, TargetLen, Spacers, Cutoff), {'Workers': Workers, \
+            'Decompress': Decompress, 'Compress': Compress, 'CompressThreads': CompressThreads, \
+            'Compressor': Compressor, 'Windows': Windows, 'Metrics': Metrics, 'Derep': Derep, \
+            'DerepMax': DerepMax, 'IndexEvery': IndexEvery, 'Pipeline': Pipeline, 'QueueDepth': QueueDepth, \
+            'MaxEE': MaxEE, 'MinQual': MinQual, 'TruncQ': TruncQ, 'MaxN': MaxN}, ProfileName))
+    if Profile and not any(Task[2] for Task in Tasks):
+        print ('There is no sample', Profile, 'to trim and profile.')
+    if Shard:
+        try:
+            TrimShard(Claims, Tasks, Jobs)
+        finally:
+            Claims.close()
+        MergeShards(Claims, Pairs, Names, Header, basenm)
+        return
+
+    #Rows are written in sample order whichever worker finishes first. Each trimmed sample is added to
+    #the manifest as soon as it is finished.
+    Samples = []
+    SpacerSamples = []
+    def WriteSamples(Results):
+        for InF, InR in Pairs:
+            if InF in Finished:
+                WriteRows(outsums, Finished[InF])
+                SpacerSamples.extend(Manifest.spacers(InF) or [])
+                continue
+            Row, Metric, SpacerCounts = next(Results)
+            WriteRows(outsums, Row)
+            Samples.extend(Metric)
+            SpacerSamples.extend(SpacerCounts)
+            if Row:
+                Outputs = TrimmedPaths(Names, SampleName(InF), Compress)
+                if Derep:
+                    Outputs += DerepPaths(Names, SampleName(InF), Compress)
+                Outputs = OutputFiles(Outputs, Compress, Compressor)
+                Manifest.add(InF, [InF, InR], Parameters, Outputs, [Row] if isinstance(Row, str) else Row, \
+                    SpacerCounts)
+
+    outsums = [open(Name+'TrimSummary.txt', "w") for Name in Names]
+    try:
+        for outsum in outsums:
+            outsum.write(Header)
+        if SamplePool:
+            import multiprocessing
+            with multiprocessing.Pool(min(Jobs, len(Tasks))) as SampleWorkers:
+                WriteSamples(SampleWorkers.imap(TrimSample, Tasks))
+        else:
+            WriteSamples(map(TrimSample, Tasks))
+    finally:
+        for outsum in outsums:
+            outsum.close()
+    Manifest.keep([InF for InF, InR in Pairs])
+    if SpacerSamples:
+        WriteSpacerCounts(basenm+'SpacerCounts.txt', SpacerSamples)
+        print ('Spacer counts of every sample written to', basenm+'SpacerCounts.txt')
+    if Metrics:
+        end = datetime.now()
+        Seconds = (end - start).total_seconds()
+        Reads = sum(Sample['Reads'] for Sample in Samples)
+        WriteMetrics(basenm, Samples, {'Start': str(start), 'End': str(end), 'Seconds': round(Seconds, 3), \
+            'Samples': len(Samples), 'Skipped': len(Finished), 'Reads': Reads, \
+            'ReadsPerSec': round(Reads / Seconds) if Seconds else 0, 'PrimerSets': Markers, 'Jobs': Jobs, \
+            'Workers': Workers, 'Pipeline': Pipeline})
+        print ('Metrics written to', basenm+'TrimMetrics.json', 'and', basenm+'TrimMetrics.tsv')
+
+#Calibrate the primer errors of every sample pair, Jobs samples at a time, and write the calibration
+#tables to <dir>ErrorCalibration.txt. Returns the most forward and the most reverse primer errors
+#recommended for any sample, or None if there are no samples.
+def CalibrateAll(Pairs, Markers, PF, PR, TargetLen, Cutoffs, MaxErrors, Jobs=1, Decompress='auto', Reads=10000, \
+    Loss=0.005, basenm=''):
+    if not Pairs:
+        print ('There are no samples to calibrate.')
+        return None
+    PrimerDicts = [PrimerSetPrimers(Marker, PF, PR) for Marker in Markers]
+    Lengths = [MarkerLength(Marker, TargetLen) for Marker in Markers]
+    print ('Calibrating primer errors from 0 to', MaxErrors, 'on', Reads, 'read pairs of each sample.')
+    Tasks = [((InF, InR, PrimerDicts, Lengths, Cutoffs, MaxErrors), {'Reads': Reads, 'Decompress': Decompress, \
+        'Loss': Loss}) for InF, InR in Pairs]
+    if Jobs > 1 and len(Tasks) > 1:
+        import multiprocessing
+        with multiprocessing.Pool(min(Jobs, len(Tasks))) as CalibrationWorkers:
+            Samples = CalibrationWorkers.map(CalibrateSample, Tasks)
+    else:
+        Samples = list(map(CalibrateSample, Tasks))
+    WriteCalibration(basenm+'ErrorCalibration.txt', Samples)
+    ErrF = max(Best['ErrF'] for Sample, Rows, Best in Samples)
+    ErrR = max(Best['ErrR'] for Sample, Rows, Best in Samples)
+    print ('Calibration of every sample written to', basenm+'ErrorCalibration.txt')
+    print ('Recommended primer errors for every sample: forward', ErrF, 'reverse', ErrR)
+    return ErrF, ErrR
+
+#Reads read at each place in a file by a preview
+PreviewChunk = 100
+
+#Read pairs for a preview of a sample: about Reads pairs from places spread evenly through its files,
+#or, from gzip files of one member that can only be read from their start, a reservoir sample of the
+#pairs read from the start in Seconds. No read name is returned twice, so every estimate counts each
+#pair sampled once. Returns the forward and reverse records of the pairs, the estimated reads of the
+#sample and the share of its files read.
+def PreviewPairs(InForward, InReverse, Reads=2000, Seconds=5.0, Seed=None):
+    Random = random.Random(Seed)
+    Places = max(1, -(-Reads // PreviewChunk))
+    Fractions = [(n + Random.random()) / Places for n in range(Places)]
+    Forward = SampleFastq(InForward, Fractions, PreviewChunk)
+    if Forward is not None and Forward[1]:
+        #Reverse reads are read from before each place and well past it, so they hold the mates of
+        #the forward reads even where the two files are compressed or laid out differently. Their
+        #places may overlap, as only the forward reads are counted. Where a gzip member boundary
+        #leaves most mates outside, the place is read again from further back.
+        Mates = [{} for Place in Forward[0]]
+        Missing = [n for n, Place in enumerate(Forward[0]) if Place]
+        Back = 2
+        while Missing and Back <= 128:
+            Reverse = SampleFastq(InReverse, [max(0.0, Fractions[n] - Back * PreviewChunk / Forward[1]) \
+                for n in Missing], int(2.5 * Back) * PreviewChunk, Distinct=False)
+            if Reverse is None:
+                break
+            for n, RPlace in zip(Missing, Reverse[0]):
+                Mates[n].update((ReadName(Read[0]), Read) for Read in RPlace)
+            Missing = [n for n in Missing if 2 * sum(ReadName(Read[0]) in Mates[n] for Read in Forward[0][n]) \
+                < len(Forward[0][n])]
+            Back *= 4
+        F = []
+        R = []
+        Seen = set()
+        for FPlace, RMates in zip(Forward[0], Mates):
+            for Read in FPlace:
+                Name = ReadName(Read[0])
+                Mate = RMates.get(Name)
+                if Mate is not None and Name not in Seen:
+                    Seen.add(Name)
+                    F.append(Read)
+                    R.append(Mate)
+        if F:
+            return F, R, Forward[1], min(1.0, len(Seen) / Forward[1])
+    Clock = time.perf_counter()
+    Files = [ZlibReader(Path) if IsGzipped(Path) else open(Path, 'rb') for Path in (InForward, InReverse)]
+    Seen = [0, True]
+    def Batches():
+        for FBatch, RBatch in zip(ReadRecords(Files[0], 10000, False), ReadRecords(Files[1], 10000, False)):
+            Seen[0] += len(FBatch)
+            yield list(zip(FBatch, RBatch))
+            if time.perf_counter() - Clock > Seconds:
+                Seen[1] = False
+                break
+    try:
+        Pairs = ReservoirSample(Batches(), Reads, Seed)
+        Position = (Files[0].File if isinstance(Files[0], ZlibReader) else Files[0]).tell()
+    finally:
+        for File in Files:
+            File.close()
+    F = []
+    R = []
+    Names = set()
+    for FRead, RRead in Pairs:
+        Name = ReadName(FRead[0])
+        if Name == ReadName(RRead[0]) and Name not in Names:
+            Names.add(Name)
+            F.append(FRead)
+            R.append(RRead)
+    Share = 1.0 if Seen[1] else Position / max(1, os.path.getsize(InForward))
+    return F, R, int(round(Seen[0] / max(Share, 1e-9))), Share
+
+#Preview one sample in a worker process. Returns the sample name, its primer sets, estimated reads,
+#sampled pairs, share of its files read, summary column counts of each primer set and histograms.
+def PreviewSample(Task):
+    Args, Kwargs = Task
+    InF, InR = Args[:2]
+    Reads = Kwargs.pop('Reads')
+    Seconds = Kwargs.pop('Seconds')
+    Preview = Trimmer(*Args[2:], **Kwargs)
+    F, R, Total, Read = PreviewPairs(InF, InR, Reads, Seconds, SampleName(InF))
+    Spacers = (None, None)
+    if Preview.Classifiers and F:
+        Spacers = (Preview.spacer(F)[0], Preview.spacer(R, True)[0])
+    FResult = Preview.trim_batch(F, False, Spacers[0])
+    RResult = Preview.trim_batch(R, True, Spacers[1])
+    Counts = PreviewCounts(FResult, RResult, len(Preview.Markers), bool(Preview.Classifiers), \
+        Preview.Filter is not None)
+    Histograms = {}
+    for Direction, Result, Primer in (('F', FResult, 'pF'), ('R', RResult, 'pR')):
+        Positions, Lengths = PreviewHistograms(Result, [len(Primers[Primer]) for Primers in Preview.PrimerDicts])
+        Histograms[(Direction, 'primer start')] = Positions
+        Histograms[(Direction, 'trimmed length')] = Lengths
+    Kept = []
+    for Marker, MarkerCounts in zip(Preview.Markers, Counts):
+        Low, High = Wilson(MarkerCounts[2], len(F))
+        Kept.append('%.1f%% (%.1f-%.1f%%) kept' % (100 * MarkerCounts[2] / max(1, len(F)), 100 * Low, 100 * High) \
+            + (' for ' + Marker if Preview.Multi else ''))
+    print (SampleName(InF), '~%d reads, %d pairs from %.1f%% of its files:' % (Total, len(F), 100 * Read), \
+        ', '.join(Kept))
+    return SampleName(InF), Preview.Markers, Total, len(F), Read, Counts, Histograms
+
+#Preview every sample pair, Jobs samples at a time: estimate each one's trim summary from about Reads
+#of its read pairs and write it to <dir>TrimPreview.txt, with the primer start and trimmed length
+#histograms in <dir>TrimPreviewHistograms.txt. Histograms of all samples together are printed.
+def PreviewAll(Pairs, Markers, PF, PR, ErrF, ErrR, TargetLen, Spacers, Cutoffs, Jobs=1, Reads=2000, Seconds=5.0, \
+    basenm='', MaxEE=None, MinQual=None, TruncQ=None, MaxN=None):
+    if not Pairs:
+        print ('There are no samples to preview.')
+        return None
+    print ('Previewing', len(Pairs), 'samples from about', Reads, 'read pairs each.')
+    Tasks = [((InF, InR, Markers, PF, PR, ErrF, ErrR, TargetLen, Spacers, Cutoffs), {'Reads': Reads, \
+        'Seconds': Seconds, 'MaxEE': MaxEE, 'MinQual': MinQual, 'TruncQ': TruncQ, 'MaxN': MaxN}) \
+        for InF, InR in Pairs]
+    if Jobs > 1 and len(Tasks) > 1:
+        import multiprocessing
+        with multiprocessing.Pool(min(Jobs, len(Tasks))) as PreviewWorkers:
+            Samples = PreviewWorkers.map(PreviewSample, Tasks)
+    else:
+        Samples = list(map(PreviewSample, Tasks))
+    Quality = (MaxEE, MinQual, TruncQ, MaxN) != (None, None, None, None)
+    Columns = SummaryHeader(Spacers, None, Quality).rstrip('\n').split('\t')[2:]
+    Rows = []
+    Pooled = collections.defaultdict(collections.Counter)
+    for Sample, SampleMarkers, Total, Sampled, Read, Counts, Histograms in Samples:
+        for Marker, MarkerCounts in zip(SampleMarkers, Counts):
+            Rows.append((Sample, Marker, Total, Sampled, Read, MarkerCounts))
+        for Key, Histogram in Histograms.items():
+            Pooled[Key].update(Histogram)
+    WritePreview(basenm+'TrimPreview.txt', Columns, Rows)
+    WriteHistograms(basenm+'TrimPreviewHistograms.txt', [(Sample[0], Sample[6]) for Sample in Samples])
+    for Direction, Measure in (('F', 'primer start'), ('R', 'primer start'), ('F', 'trimmed length'), \
+        ('R', 'trimmed length')):
+        print (Direction, 'read', Measure, 'of every sample:')
+        print ('\n'.join(TextHistogram(Pooled[(Direction, Measure)])))
+    print ('Estimated trim summary of every sample written to', basenm+'TrimPreview.txt')
+    return Rows
+
+#Name a sample's claim and fragment are saved under in a sharded run
+def ShardSample(InF):
+    return os.path.basename(SampleName(InF))
+
+#Trim every sample of Tasks this node can claim, Jobs at a time, saving each one's results as a
+#fragment. A sample that fails is given up so that another node can trim it, and this node goes on
+#with the next sample.
+def TrimShard(Claims, Tasks, Jobs=1):
+    Pool = None
+    if Jobs > 1 and len(Tasks) > 1:
+        import multiprocessing
+        Pool = multiprocessing.Pool(min(Jobs, len(Tasks)))
+    Pending = collections.deque()
+    Trimmed = 0
+    #Trim is called for the sample's result, which raises whatever its trim raised
+    def Finish(Sample, Trim):
+        try:
+            Row, Metric, SpacerCounts = Trim()
+        except Exception as Error:
+            print ('Node', Claims.Node, 'could not trim', Sample + ':', repr(Error))
+            Row = None
+        if not Row:
+            Claims.release(Sample)
+            return 0
+        Claims.finish(Sample, {'Rows': [Row] if isinstance(Row, str) else Row, 'Metrics': Metric, \
+            'Spacers': SpacerCounts})
+        return 1
+    try:
+        for Task in Tasks:
+            Sample = ShardSample(Task[0][0])
+            #A sample is only claimed when this node has a process free to trim it
+            while Pool is not None and len(Pending) >= Jobs:
+                Trimmed += Finish(Pending[0][0], Pending[0][1].get)
+                Pending.popleft()
+            if Claims.done(Sample) or not Claims.claim(Sample):
+                continue
+            print ('Node', Claims.Node, 'claimed', Sample)
+            if Pool is None:
+                Pending.append((Sample, None))
+                Trimmed += Finish(Sample, lambda: TrimSample(Task))
+                Pending.popleft()
+            else:
+                Pending.append((Sample, Pool.apply_async(TrimSample, (Task,))))
+        while Pending:
+            Trimmed += Finish(Pending[0][0], Pending[0][1].get)
+            Pending.popleft()
+    finally:
+        for Sample, Job in Pending:
+            Claims.release(Sample)
+        if Pool is not None:
+            Pool.terminate()
+    print ('Node', Claims.Node, 'trimmed', Trimmed, 'samples.')
+
+#Write the run summary, spacer counts and metrics of a sharded run from the fragments of every
+#sample. Returns False, writing nothing, while any sample is unfinished.
+def MergeShards(Claims, Pairs, Names, Header, basenm):
+    Fragments = []
+    Missing = []
+    for InF, InR in Pairs:
+        Fragment = Claims.fragment(ShardSample(InF))
+        if Fragment is None:
+            Missing.append(ShardSample(InF))
+        else:
+            Fragments.append(Fragment)
+    if Missing:
+        print (len(Missing), 'of', len(Pairs), 'samples are not finished yet, so the run summary is not written:', \
+            ' '.join(Missing[:10]) + (' ...' if len(Missing) > 10 else ''))
+        return False
+    #Each summary is written to a temporary file and renamed, in case two nodes merge at once
+    Temp = '.%s.tmp' % Claims.Node
+    outsums = [open(Name+'TrimSummary.txt'+Temp, "w") for Name in Names]
+    try:
+        for outsum in outsums:
+            outsum.write(Header)
+        for Fragment in Fragments:
+            WriteRows(outsums, Fragment['Rows'])
+    finally:
+        for outsum in outsums:
+            outsum.close()
+    for Name in Names:
+        os.replace(Name+'TrimSummary.txt'+Temp, Name+'TrimSummary.txt')
+    SpacerSamples = [Sample for Fragment in Fragments for Sample in Fragment['Spacers']]
+    if SpacerSamples:
+        WriteSpacerCounts(basenm+'SpacerCounts.txt', SpacerSamples)
+    Samples = [Sample for Fragment in Fragments for Sample in Fragment['Metrics']]
+    if Samples:
+        WriteMetrics(basenm, Samples, {'Samples': len(Samples), 'Reads': sum(Sample['Reads'] for Sample in Samples), \
+            'Nodes': sorted(set(Fragment['Node'] for Fragment in Fragments))})
+    print ('All', len(Pairs), 'samples are finished. Run summary written to', \
+        ', '.join(Name+'TrimSummary.txt' for Name in Names))
+    return True
+
+#Options for trimming a parent directory. They can go anywhere after the script name
+OptionsHelp = "Options:\n\
+--jobs N: trim N samples at a time in separate processes (default 1)\n\
+--workers N: when trimming one sample at a time, split each sample's reads across N processes (default 1)\n\
+--decompress auto|pigz|igzip|zlib|gzip: how fastq.gz files are decompressed (default auto: pigz or igzip \
+if installed, otherwise zlib)\n\
+--gzip LEVEL: write trimmed reads as fastq.gz at compression level 1-9 (default: plain fastq)\n\
+--gzip-threads N: threads (or pigz processes) compressing each output file (default: all cores)\n\
+--compressor auto|pigz|threads|bgzf: compress with pigz or with Python threads (default auto: pigz if installed), \
+or write BGZF with a <file>.idx record index and a <file>.names.gz read name index next to each file\n\
+--index-every N: with bgzf, index where every Nth read starts (default 10000)\n\
+--windows: learn where primers sit from the first reads of each file and search there first, \
+falling back to the whole read when nothing is found there\n\
+--metrics: write the time each sample spends in each stage, reads/sec and peak memory to \
+<dir>TrimMetrics.json and <dir>TrimMetrics.tsv\n\
+--profile SAMPLE: trim SAMPLE under cProfile and save the profile to <dir>SAMPLE.prof\n\
+--force: trim every sample again, even those <dir>TrimManifest.json lists as already trimmed with the \
+same settings\n\
+--hash: tell changed input files apart by their contents instead of their size and modification time\n\
+--derep mean|max|first: also write each sample's unique read pairs once, named with their abundance, to \
+<dir>DerepFastqs, combining the quality scores of copies by their mean, their maximum or the first copy\n\
+--derep-max N: count at most N unique pairs in memory before spilling the counts to disk (default 250000)\n\
+--pipeline: read, trim and write each sample at the same time, reading each input file and writing each \
+output file in a thread of its own, and report how full the queues between them were\n\
+--queue-depth N: with --pipeline, let at most N batches wait between stages (default 4)\n\
+--trunc-q Q: cut each trimmed read before its first base with a quality score below Q\n\
+--max-n N: drop read pairs with more than N Ns in either trimmed read\n\
+--min-qual Q: drop read pairs with a mean quality score below Q in either trimmed read\n\
+--maxee X: drop read pairs with more than X expected errors in either trimmed read\n\
+--samples SHEET: trim the sample pairs listed in SHEET, one forward and reverse file per line, instead of \
+listing the parent directory. If SHEET does not exist it is written from the listing.\n\
+--shard: trim as one of several nodes sharing the parent directory, each trimming the samples it claims \
+in <dir>Shards. The last node to finish writes the run summary.\n\
+--node NAME: name of this node in a sharded run (default: host name and process id)\n\
+--claim-timeout SECONDS: with --shard, take over claims not refreshed for SECONDS, left by nodes that \
+died (default: never)\n\
+--merge: write the run summary of a sharded run from <dir>Shards once every sample is finished\n\
+--calibrate N: count the pairs trimmed from read pairs drawn from each sample at 0 to N errors in each \
+primer, write them with the search time to <dir>ErrorCalibration.txt and recommend the fewest errors that \
+trim nearly all of them, without trimming\n\
+--auto-errors: calibrate as with --calibrate (default N 3), then trim every sample with the most errors \
+recommended for any sample instead of the errors given\n\
+--calibrate-reads N: read pairs drawn from each sample to calibrate on (default 10000)\n\
+--calibrate-loss PERCENT: recommend errors that trim at least 100 - PERCENT % of the most pairs trimmed \
+at any number of errors tried (default 0.5)\n\
+--stream: trim one sample and write its kept pairs to stdout as interleaved fastq for piping into a merger, \
+with the trim summary and all messages on stderr. Reads come from --in1 and --in2, or from one interleaved \
+file or stdin.\n\
+--in1 PATH, --in2 PATH: with --stream, the forward and reverse fastq or fastq.gz files, either of them - \
+for stdin. With --in1 only, PATH is interleaved (default: interleaved reads on stdin).\n\
+--out PATH: with --stream, write the interleaved pairs to PATH instead of stdout\n\
+--summary PATH: with --stream, also write the trim summary to PATH\n\
+--sample NAME: with --stream, the sample name in the trim summary (default: from --in1)\n\
+--cutoff N: with --stream, drop pairs with a read of N bases or fewer instead of asking, as is needed \
+when reads come from stdin and the marker length is 0\n\
+--preview: estimate the trim summary of every sample, with 95% intervals, from a few thousand read pairs \
+read from places spread through its files, and write it to <dir>TrimPreview.txt with histograms of primer \
+start and trimmed length in <dir>TrimPreviewHistograms.txt, without trimming. Samples are previewed in \
+parallel, on every core unless --jobs is given.\n\
+--preview-reads N: read pairs to preview each sample from (default 2000)\n\
+--preview-seconds SECONDS: gzip files of one gzip member cannot be read from the middle, so they are read \
+from their start for at most SECONDS (default 5)"
 
 if __name__ == "__main__":
     try: 
@@ -488,7 +1699,8 @@ if __name__ == "__main__":
         print("To use input the following argument variables:\n\
 1. primer set name or 'other' if it is not in the common primer set list. \
 If a primer set name is entered, argument variables 2 & 3 will \
-be ignored, but a value must be entered.\n\
+be ignored, but a value must be entered. Several primer sets separated by commas (e.g. \
+CYPPART,GOBIPART) are demultiplexed in one pass into a results directory for each.\n\
 2. Last N bases of forward primer (recomended >= 8)\n\
 3. Last N bases of reverse primer (recomended >= 8)\n\
 4. N errors allowed in forward primer (recomended >=1)\n\
@@ -515,10 +1727,93 @@ It is recommended that you input >8 bases of each primer. the sequence should en
 3' base of the primer.\n\n\
 To remove a primer set from the list input the following argument variables: \n\
 1. Remove. \n\
-2. Primer_Set_Name")
+2. Primer_Set_Name\n\n"+OptionsHelp)
     else:
 	#Get start time of script
         start = datetime.now().time()
+        Jobs = PopOption(sys.argv, '--jobs')
+        Preview = PopFlag(sys.argv, '--preview')
+        #Previews run every sample at once unless told otherwise, since each one takes a second or two
+        if Jobs is not None:
+            Jobs = int(Jobs)
+        else:
+            Jobs = (os.cpu_count() or 1) if Preview else 1
+        PreviewReads = int(PopOption(sys.argv, '--preview-reads', 2000))
+        PreviewSeconds = float(PopOption(sys.argv, '--preview-seconds', 5))
+        Workers = int(PopOption(sys.argv, '--workers', 1))
+        Decompress = PopOption(sys.argv, '--decompress', 'auto').lower()
+        if Decompress not in Decompressors:
+            print ('--decompress must be one of', ', '.join(Decompressors))
+            exit()
+        Windows = PopFlag(sys.argv, '--windows')
+        Metrics = PopFlag(sys.argv, '--metrics')
+        Profile = PopOption(sys.argv, '--profile')
+        Force = PopFlag(sys.argv, '--force')
+        Hash = PopFlag(sys.argv, '--hash')
+        Derep = PopOption(sys.argv, '--derep')
+        if Derep is not None:
+            Derep = Derep.lower()
+            if Derep not in Qualities:
+                print ('--derep must be one of', ', '.join(Qualities))
+                exit()
+        DerepMax = int(PopOption(sys.argv, '--derep-max', 250000))
+        Compress = int(PopOption(sys.argv, '--gzip', 0))
+        CompressThreads = PopOption(sys.argv, '--gzip-threads')
+        if CompressThreads is not None:
+            CompressThreads = int(CompressThreads)
+        Compressor = PopOption(sys.argv, '--compressor', 'auto').lower()
+        if Compressor not in Compressors or not 0 <= Compress <= 9:
+            print ('--gzip must be 1-9 and --compressor one of', ', '.join(Compressors))
+            exit()
+        if Compressor == 'bgzf' and not Compress:
+            print ('--compressor bgzf needs a --gzip level')
+            exit()
+        IndexEvery = int(PopOption(sys.argv, '--index-every', 10000))
+        SampleSheet = PopOption(sys.argv, '--samples')
+        Shard = PopFlag(sys.argv, '--shard')
+        Node = PopOption(sys.argv, '--node')
+        ClaimTimeout = float(PopOption(sys.argv, '--claim-timeout', 0))
+        Merge = PopFlag(sys.argv, '--merge')
+        Stream = PopFlag(sys.argv, '--stream')
+        StreamIn1 = PopOption(sys.argv, '--in1', '-')
+        StreamIn2 = PopOption(sys.argv, '--in2')
+        StreamOut = PopOption(sys.argv, '--out', '-')
+        StreamSummary = PopOption(sys.argv, '--summary')
+        StreamSample = PopOption(sys.argv, '--sample')
+        Cutoff = PopOption(sys.argv, '--cutoff')
+        Cutoff = None if Cutoff is None else float(Cutoff)
+        AutoErrors = PopFlag(sys.argv, '--auto-errors')
+        Calibrate = PopOption(sys.argv, '--calibrate', 3 if AutoErrors else None)
+        Calibrate = None if Calibrate is None else int(Calibrate)
+        CalibrateReads = int(PopOption(sys.argv, '--calibrate-reads', 10000))
+        CalibrateLoss = float(PopOption(sys.argv, '--calibrate-loss', 0.5)) / 100
+        if CalibrateReads < 1 or (Calibrate is not None and Calibrate < 0):
+            print ('--calibrate must be at least 0 and --calibrate-reads at least 1')
+            exit()
+        Pipeline = PopFlag(sys.argv, '--pipeline')
+        QueueDepth = int(PopOption(sys.argv, '--queue-depth', 4))
+        MaxEE = PopOption(sys.argv, '--maxee')
+        MinQual = PopOption(sys.argv, '--min-qual')
+        TruncQ = PopOption(sys.argv, '--trunc-q')
+        MaxN = PopOption(sys.argv, '--max-n')
+        try:
+            MaxEE = None if MaxEE is None else float(MaxEE)
+            MinQual = None if MinQual is None else float(MinQual)
+            TruncQ = None if TruncQ is None else int(TruncQ)
+            MaxN = None if MaxN is None else int(MaxN)
+        except ValueError:
+            print ('--maxee and --min-qual must be numbers and --trunc-q and --max-n whole numbers')
+            exit()
+        if QueueDepth < 1:
+            print ('--queue-depth must be at least 1')
+            exit()
+        try:
+            FindDecompressor(Decompress)
+            if Compress:
+                FindCompressor(Compressor)
+        except OSError as Error:
+            print (Error)
+            exit()
         #Add a new primer to the primer set list
         if sys.argv[1].upper() == 'PRIMERSETS':
             PrintPrimerSets()
@@ -580,7 +1875,7 @@ It is recommended that you input >8 bases of each primer. the sequence should en
 base of the primer.\n\n\
 To remove a primer set from the list input the following argument variables: \n\
 1. 'Remove'. \n\
-2. Primer_Set_Name")
+2. Primer_Set_Name\n\n"+OptionsHelp)
             exit()
         else:
             if sys.argv[6].isnumeric():
@@ -590,48 +1885,27 @@ To remove a primer set from the list input the following argument variables: \n\
                 if LengthMarker not in PrimerSets:
                     print("Length ", LengthMarker," is not in the primer sets list!")
                     exit()
-        cwd = os.getcwd()
-    # def MetaTrimAll(Dir, PrimerSetAll, PFAll, PRAll, ErrFAll, ErrRAll, TargetLenAll, SpacersAll)
-        #Create output directory and summary files
-        
-        basenm = os.path.basename(cwd)
-        outsumname = basenm+'TrimSummary.txt'
-        outsum = open(outsumname, "w")
-        if sys.argv[7].upper() == 'Y':
-            outsum.write('Sample\tReads\tF Seqs Trimmed\tR Seqs Trimmed\tSeqs F & R Trimmed\tShort Seqs\t\
-Seqs w/ Correct Spacer Combo\tSeqs w/o Correct Spacer Combo\n')
-            outsum.close()
-        else:
-            outsum.write('Sample\tReads\tF Seqs Trimmed\tR Seqs Trimmed\tSeqs F & R Trimmed\tShort Seqs\n')
-            outsum.close()
-        
-        #Create results directory
-        ResDirName = basenm+'TrimmedFastqs'
-        try:
-            os.mkdir(ResDirName)
-            print("Directory " , ResDirName ,  " Created ") 
-        except FileExistsError:
-            pass
-
-        #Read in items in parent directory
-        ItemsInParentDir = os.listdir(".")
-
-        for x in ItemsInParentDir:
-            #Open all subdirectories in parent directory
-            if os.path.isdir(x):
-                ItemsInSubDirs = sorted(os.listdir(x))
-                #Find fastq files
-                for y in ItemsInSubDirs:
-                    if re.search('fastq\.gz$', y):
-                        sample = x[0:re.search('_', y).start()]
-                        #Find forward fastq file
-                        if re.search('R1_001\.fastq\.gz', y):
-                            InF = x+'/'+y
-                        elif re.search('R2_001\.fastq\.gz', y):
-                            InR = x+'/'+y
-                            MetaTrim(InF, InR, sys.argv[1].upper(), sys.argv[3].upper(), sys.argv[4].upper(), \
-                                sys.argv[4], sys.argv[5], LengthMarker, sys.argv[7].upper())
-        outsum.close()
+            if Stream:
+                if Cutoff is None and MarkerLength(sys.argv[1], LengthMarker) == 0 \
+                    and '-' not in (StreamIn1, StreamIn2):
+                    #Asked on stderr, as stdout is the stream
+                    with contextlib.redirect_stdout(sys.stderr):
+                        Cutoff = TrimCutoff(0)
+                MetaTrimStream(StreamIn1, StreamIn2, sys.argv[1].upper(), sys.argv[2].upper(), sys.argv[3].upper(), \
+                    sys.argv[4], sys.argv[5], LengthMarker, sys.argv[7].upper(), Cutoff, StreamOut, StreamSummary, \
+                    StreamSample, Workers, Decompress=Decompress, Compress=Compress, CompressThreads=CompressThreads, \
+                    Compressor=Compressor, Windows=Windows, Pipeline=Pipeline, QueueDepth=QueueDepth, MaxEE=MaxEE, \
+                    MinQual=MinQual, TruncQ=TruncQ, MaxN=MaxN)
+                exit()
+            MetaTrimAll(sys.argv[1].upper(), sys.argv[2].upper(), sys.argv[3].upper(), sys.argv[4], \
+                sys.argv[5], LengthMarker, sys.argv[7].upper(), Jobs, Workers=Workers, \
+                Decompress=Decompress, Compress=Compress, CompressThreads=CompressThreads, Compressor=Compressor, \
+                Windows=Windows, Metrics=Metrics, Profile=Profile, Force=Force, Hash=Hash, Derep=Derep, \
+                DerepMax=DerepMax, IndexEvery=IndexEvery, Pipeline=Pipeline, QueueDepth=QueueDepth, MaxEE=MaxEE, \
+                MinQual=MinQual, TruncQ=TruncQ, MaxN=MaxN, SampleSheet=SampleSheet, Shard=Shard, Node=Node, \
+                ClaimTimeout=ClaimTimeout, Merge=Merge, Calibrate=Calibrate, CalibrateReads=CalibrateReads, \
+                CalibrateLoss=CalibrateLoss, AutoErrors=AutoErrors, Preview=Preview, PreviewReads=PreviewReads, \
+                PreviewSeconds=PreviewSeconds)
         #Get time script finishes and print start and end time
         end = datetime.now().time()
         print ('MetaTrim start:', start, '\n', 'MetaTrim end:', end)
@@ -0,0 +1,101 @@
+"""
+metrics
+
+by M. R. Snyder 2018.
+Written for Python 3
+
+Stage timing for MetaTrim. With metrics turned on, MetaTrim adds up the seconds each sample spends:
+
+decompression: reading fastq or fastq.gz files and splitting them into records
+spacer check: classifying the spacer insert at the start of each read
+primer match: searching for the first primer
+opposite primer search: searching for the opposite primer when the marker length is 0
+quality filter: truncating trimmed reads and finding their expected errors (--maxee and the like)
+worker wait: waiting for batches trimmed in worker processes (--workers)
+write: joining, compressing and writing trimmed reads
+dereplication: counting unique read pairs and writing them (--derep)
+pairing: the rest of the trimming loop, mostly pairing forward and reverse reads
+
+With worker processes, spacer check, both primer searches and the quality filter are added up over every worker, so
+together they can be longer than the sample took. WriteMetrics saves one row per sample, with reads
+per second and the peak memory of the process that trimmed it, as JSON and as TSV.
+"""
+
+import sys
+import json
+import time
+try:
+    import resource
+except ImportError:
+    resource = None
+
+Stages = ('decompression', 'spacer check', 'primer match', 'opposite primer search', 'quality filter', \
+    'worker wait', 'write', 'dereplication', 'pairing')
+
+def StageTimes():
+    return dict.fromkeys(Stages, 0.0)
+
+class TimedSearch:
+    """A PrimerMatcher or PrimerIndex whose searches add their time to a stage."""
+
+    def __init__(self, Matcher, Times, Stage):
+        self.Matcher = Matcher
+        self.Times = Times
+        self.Stage = Stage
+        self.Length = getattr(Matcher, 'Length', None)
+        if hasattr(Matcher, 'Matchers'):
+            self.Matchers = [TimedSearch(m, Times, Stage) for m in Matcher.Matchers]
+
+    def search(self, Seq, *Args):
+        Start = time.perf_counter()
+        Hit = self.Matcher.search(Seq, *Args)
+        self.Times[self.Stage] += time.perf_counter() - Start
+        return Hit
+
+#Pass batches through, adding the time spent producing each one to Stage
+def TimedBatches(Batches, Times, Stage):
+    Batches = iter(Batches)
+    while True:
+        Start = time.perf_counter()
+        Batch = next(Batches, None)
+        Times[Stage] += time.perf_counter() - Start
+        if Batch is None:
+            return
+        yield Batch
+
+#Start counting peak memory again from the current memory use, where Linux allows it
+def ResetPeakMemory():
+    try:
+        with open('/proc/self/clear_refs', 'w') as outfile:
+            outfile.write('5')
+    except OSError:
+        pass
+
+#Peak resident memory of this process in kilobytes, since the last ResetPeakMemory on Linux
+def PeakMemory():
+    try:
+        with open('/proc/self/status') as infile:
+            for line in infile:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    Peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #macOS counts in bytes
+    if sys.platform == 'darwin':
+        return Peak // 1024
+    return Peak
+
+#Write sample metrics to Name+'TrimMetrics.json' and Name+'TrimMetrics.tsv'. Run holds settings and
+#times for the whole run.
+def WriteMetrics(Name, Samples, Run=None):
+    with open(Name+'TrimMetrics.json', 'w') as outfile:
+        json.dump({'Run': Run or {}, 'Samples': Samples}, outfile, indent=2)
+    with open(Name+'TrimMetrics.tsv', 'w') as outfile:
+        outfile.write('\t'.join(['Sample', 'Reads', 'Seconds', 'Reads/sec', 'Peak Memory (KB)'] + \
+            [Stage+' (s)' for Stage in Stages]) + '\n')
+        for Sample in Samples:
+            outfile.write('\t'.join([str(Sample[Field]) for Field in ('Sample', 'Reads', 'Seconds', 'ReadsPerSec', \
+                'PeakMemoryKB')] + ['%.3f' % Sample['Stages'][Stage] for Stage in Stages]) + '\n')
@@ -0,0 +1,28 @@
+"""
+options
+
+by M. R. Snyder 2018.
+Written for Python 3
+
+Command line option helpers shared by metatrim.py and the scripts next to it, so that a script
+only parsing its own options does not load the trimmer to do so.
+"""
+
+#Pull '--Option Value' or '--Option=Value' out of an argument list
+def PopOption(Args, Option, Default=None):
+    for indx, val in enumerate(Args):
+        if val == Option and indx + 1 < len(Args):
+            Value = Args[indx + 1]
+            del Args[indx:indx + 2]
+            return Value
+        elif val.startswith(Option + '='):
+            del Args[indx]
+            return val[len(Option) + 1:]
+    return Default
+
+#Pull a '--Flag' with no value out of an argument list
+def PopFlag(Args, Flag):
+    if Flag in Args:
+        Args.remove(Flag)
+        return True
+    return False
@@ -0,0 +1,137 @@
+"""
+pipeline
+
+by M. R. Snyder 2018.
+Written for Python 3
+
+Threads and bounded queues for running MetaTrim as a pipeline. In pipelined mode each input file is
+decompressed and split into batches by a Prefetch thread, the main thread (or the --workers
+processes) trims and pairs, and each FastqWriter compresses and writes in its own thread. zlib,
+pigz pipes and file writes release the GIL, so reading and writing overlap with primer matching.
+
+Every queue holds at most Depth items, so a fast stage waits for a slow one instead of filling
+memory. Each StageQueue counts how full it was when items were taken and how often and how long
+each side waited:
+
+a reader queue that is usually empty, with the trimming side waiting, means decompression is the
+bottleneck
+a writer queue that is usually full, with the trimming side waiting, means writing is the bottleneck
+otherwise trimming is the bottleneck
+
+An error in a thread is handed to the main thread, and closing a stage stops its thread.
+"""
+
+import time
+import queue
+import threading
+
+class StageQueue:
+    """A bounded queue between two pipeline stages that keeps depth and wait statistics."""
+
+    def __init__(self, Name, Depth=4, Producer='reader', Consumer='trimming'):
+        self.Name = Name
+        self.Depth = Depth
+        self.Producer = Producer
+        self.Consumer = Consumer
+        self.Queue = queue.Queue(Depth)
+        self.Items = 0
+        self.DepthSum = 0
+        self.PutWaits = 0
+        self.PutSeconds = 0.0
+        self.GetWaits = 0
+        self.GetSeconds = 0.0
+
+    #Add an item, waiting while the queue is full. Returns False without adding it if Stop is set.
+    def put(self, Item, Stop=None):
+        try:
+            self.Queue.put_nowait(Item)
+            return True
+        except queue.Full:
+            pass
+        self.PutWaits += 1
+        Start = time.perf_counter()
+        try:
+            while True:
+                try:
+                    self.Queue.put(Item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    if Stop is not None and Stop.is_set():
+                        return False
+        finally:
+            self.PutSeconds += time.perf_counter() - Start
+
+    #Take the next item, waiting while the queue is empty
+    def get(self):
+        self.Items += 1
+        self.DepthSum += self.Queue.qsize()
+        try:
+            return self.Queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.GetWaits += 1
+        Start = time.perf_counter()
+        Item = self.Queue.get()
+        self.GetSeconds += time.perf_counter() - Start
+        return Item
+
+    #Throw away waiting items so a blocked producer can finish
+    def drain(self):
+        while True:
+            try:
+                self.Queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        return {'Queue': self.Name, 'Producer': self.Producer, 'Consumer': self.Consumer, 'Depth': self.Depth, \
+            'Items': self.Items, \
+            'MeanDepth': round(self.DepthSum / self.Items, 2) if self.Items else 0.0, \
+            'ProducerWaits': self.PutWaits, 'ProducerWaitSeconds': round(self.PutSeconds, 3), \
+            'ConsumerWaits': self.GetWaits, 'ConsumerWaitSeconds': round(self.GetSeconds, 3)}
+
+class Prefetch:
+    """Iterate over Items in a thread, at most Depth items ahead of the consumer."""
+
+    def __init__(self, Items, Name, Depth=4):
+        self.Queue = StageQueue(Name, Depth)
+        self.Stop = threading.Event()
+        self.Thread = threading.Thread(target=self._run, args=(Items,), name=Name, daemon=True)
+        self.Thread.start()
+
+    def _run(self, Items):
+        try:
+            for Item in Items:
+                if not self.Queue.put((True, Item), self.Stop):
+                    return
+            self.Queue.put((False, None), self.Stop)
+        except BaseException as Error:
+            self.Queue.put((False, Error), self.Stop)
+        finally:
+            if hasattr(Items, 'close'):
+                Items.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        More, Item = self.Queue.get()
+        if More:
+            return Item
+        #Keep the end (or the error) in the queue for any later call
+        self.Queue.Queue.put((False, Item))
+        if Item is not None:
+            raise Item
+        raise StopIteration
+
+    #Stop the thread, even if the consumer did not read to the end
+    def close(self):
+        self.Stop.set()
+        self.Queue.drain()
+        self.Thread.join()
+
+#One line per queue on how full it was and how long each side waited
+def QueueReport(Stats):
+    return ['%s: mean depth %.1f of %d, %s waited %.2fs (%d times), %s waited %.2fs (%d times)' % (Stat['Queue'], \
+        Stat['MeanDepth'], Stat['Depth'], Stat['Producer'], Stat['ProducerWaitSeconds'], Stat['ProducerWaits'], \
+        Stat['Consumer'], Stat['ConsumerWaitSeconds'], Stat['ConsumerWaits']) for Stat in Stats]
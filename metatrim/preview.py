@@ -0,0 +1,127 @@
+"""
+preview
+
+by M. R. Snyder 2018.
+Written for Python 3
+
+Trim previews for MetaTrim. Before a plate is trimmed, a preview trims a small sample of read pairs
+from each sample and estimates what its trim summary will say, so a wrong primer set, error
+tolerance, cutoff or spacer setting shows up in seconds instead of after a full run.
+
+Each column of the trim summary is estimated as the share of sampled pairs it counts, with a 95%
+Wilson score interval, times the estimated reads of the sample. Sampled pairs are taken to be
+independent, which the places read in a file only roughly are, so the intervals are a little narrow.
+The positions where primers were found and the lengths of the trimmed targets are counted too,
+which shows whether primers sit where they should and whether the cutoff falls between primer dimer
+and full length targets.
+"""
+
+import math
+import collections
+
+#95% Wilson score interval of the share of Total that Hits are
+def Wilson(Hits, Total, Z=1.96):
+    if not Total:
+        return 0.0, 1.0
+    Share = Hits / Total
+    Centre = Share + Z * Z / (2 * Total)
+    Spread = Z * math.sqrt(Share * (1 - Share) / Total + Z * Z / (4 * Total * Total))
+    Scale = 1 + Z * Z / Total
+    return max(0.0, (Centre - Spread) / Scale), min(1.0, (Centre + Spread) / Scale)
+
+#Counts of the trim summary columns after Reads for each primer set, from the Trimmer.trim_batch
+#results of the forward and reverse reads of the sampled pairs, as MetaTrim counts them
+def PreviewCounts(F, R, Markers, Spacers=False, Quality=False):
+    Counts = []
+    FStarts, FEnds, FMarkers, FStatus = F[:4]
+    RStarts, REnds, RMarkers, RStatus = R[:4]
+    Pairs = len(FStatus)
+    for Marker in range(Markers):
+        FTrimmed = RTrimmed = Final = Short = Correct = Assigned = 0
+        Rejects = [0, 0, 0]
+        for n in range(Pairs):
+            if RStatus[n] not in (1, 2, 3) and RMarkers[n] == Marker:
+                RTrimmed += 1
+            if FStatus[n] in (1, 2, 3) or FMarkers[n] != Marker:
+                continue
+            FTrimmed += 1
+            #Only pairs with a long forward target count towards the pair columns
+            if FStatus[n] == 4:
+                continue
+            Assigned += 1
+            Correct += RStatus[n] != 2
+            if RStatus[n] in (1, 2, 3) or RMarkers[n] != Marker:
+                continue
+            if RStatus[n] == 4:
+                Short += 1
+            elif FStatus[n] or RStatus[n]:
+                Rejects[(FStatus[n] or RStatus[n]) - 5] += 1
+            else:
+                Final += 1
+        Row = [FTrimmed, RTrimmed, Final, Short]
+        if Spacers:
+            Row += [Correct, (Assigned if Markers > 1 else Pairs) - Correct]
+        if Quality:
+            Row += Rejects
+        Counts.append(Row)
+    return Counts
+
+#Histograms of the primer start and trimmed target length of the trimmed reads of a trim_batch
+#result, given the length of each primer set's primer
+def PreviewHistograms(Result, PrimerLengths):
+    Starts, Ends, Markers, Status = Result[:4]
+    Positions = collections.Counter()
+    Lengths = collections.Counter()
+    for n in range(len(Status)):
+        if Status[n] not in (1, 2, 3):
+            Positions[Starts[n] - PrimerLengths[Markers[n]]] += 1
+            Lengths[Ends[n] - Starts[n]] += 1
+    return Positions, Lengths
+
+#Estimated count, percent and 95% interval of the percent of a summary column
+def Estimate(Hits, Total, Reads):
+    Low, High = Wilson(Hits, Total)
+    Share = Hits / Total if Total else 0.0
+    return [str(int(round(Share * Reads))), '%.1f' % (100 * Share), '%.1f-%.1f' % (100 * Low, 100 * High)]
+
+#Write the estimated trim summary of every sample. Columns are the trim summary columns after Reads,
+#and Samples are (sample, primer set, estimated reads, sampled pairs, share of the files read,
+#counts of each column).
+def WritePreview(Path, Columns, Samples):
+    with open(Path, 'w') as outfile:
+        Header = ['Sample', 'Primer Set', 'Reads (est.)', 'Sampled Pairs', '% of Files Read']
+        for Column in Columns:
+            Header += [Column + ' (est.)', Column + ' %', Column + ' % 95% CI']
+        outfile.write('\t'.join(Header) + '\n')
+        for Sample, Marker, Reads, Pairs, Read, Counts in Samples:
+            Row = [Sample, Marker, str(Reads), str(Pairs), '%.1f' % (100 * Read)]
+            for Hits in Counts:
+                Row += Estimate(Hits, Pairs, Reads)
+            outfile.write('\t'.join(Row) + '\n')
+
+#Write the histograms of every sample, one row per value. Samples are (sample, {(read, measure):
+#histogram}).
+def WriteHistograms(Path, Samples):
+    with open(Path, 'w') as outfile:
+        outfile.write('Sample\tRead\tMeasure\tValue\tReads\n')
+        for Sample, Histograms in Samples:
+            for (Read, Measure), Histogram in sorted(Histograms.items()):
+                for Value in sorted(Histogram):
+                    outfile.write('%s\t%s\t%s\t%d\t%d\n' % (Sample, Read, Measure, Value, Histogram[Value]))
+
+#Lines of a text histogram of Histogram in at most Bins bins of equal width
+def TextHistogram(Histogram, Bins=12, Width=40):
+    if not Histogram:
+        return ['  (no trimmed reads)']
+    Low, High = min(Histogram), max(Histogram)
+    Step = max(1, -(-(High - Low + 1) // Bins))
+    Counts = collections.Counter()
+    for Value, Count in Histogram.items():
+        Counts[(Value - Low) // Step] += Count
+    Most = max(Counts.values())
+    Lines = []
+    for Bin in range((High - Low) // Step + 1):
+        First = Low + Bin * Step
+        Label = str(First) if Step == 1 else '%d-%d' % (First, First + Step - 1)
+        Lines.append('  %9s %s %d' % (Label, '#' * int(round(Width * Counts[Bin] / Most)), Counts[Bin]))
+    return Lines
@@ -0,0 +1,180 @@
+"""
+primermatch
+
+by M. R. Snyder 2018.
+Written for Python 3
+
+Approximate primer matching for MetaTrim. A PrimerMatcher finds the leftmost occurrence of a
+degenerate (IUPAC) primer in a read allowing up to N substitutions. It gives the same hits as the
+degenerate primer regexes MetaTrim used to build: the fewest errors found anywhere in the read wins,
+and among those the leftmost position wins.
+
+Each read is first searched with a single exact IUPAC regex. Reads without an exact hit are scored
+at every position at once: every base of the read gets one byte lane in a Python integer, the
+mismatch lanes for each primer position are shifted onto the primer start and added, and the lane
+with the fewest mismatches is the hit. Lanes are widened to two or more bytes when a long primer
+with many allowed errors could score past 255. Building a matcher and scoring a read both grow with
+primer length only, not with the number of allowed errors.
+
+WindowSearch and LearnWindow narrow the search to the band of read positions where primers were
+found in an initial batch of reads, falling back to the whole read when the band has no hit.
+
+A PrimerIndex searches a read for several primers at once, for libraries that pool more than one
+marker. Exact hits of every primer are found by one combined regex. Otherwise each primer is scored
+and the hit with the fewest errors wins, then the leftmost, then the primer listed first.
+"""
+
+import re
+
+#IUPAC ambiguity codes and the bases each one matches
+IUPACAmb = {'R' : 'AG',
+            'Y' : 'CT',
+            'S' : 'GC',
+            'W' : 'AT',
+            'K' : 'GT',
+            'M' : 'AC',
+            'B' : 'CGT',
+            'D' : 'AGT',
+            'H' : 'ACT',
+            'V' : 'ACG',
+            'N' : 'ATCG'
+            }
+
+#Bases that may stand in for a primer base counted as an error
+ErrorBases = 'ACTGN'
+
+class PrimerMatcher:
+    """Leftmost, fewest-error search for one degenerate primer."""
+
+    def __init__(self, Primer, Errors=0):
+        self.Primer = Primer.upper()
+        self.Errors = int(Errors)
+        self.Length = len(self.Primer)
+        Classes = []
+        for n in self.Primer:
+            if n in IUPACAmb:
+                Classes.append('['+IUPACAmb[n]+']')
+            else:
+                Classes.append(re.escape(n))
+        self.Regex = ''.join(Classes)
+        self._Exact = re.compile(self.Regex.encode('ascii'))
+        self._ExactStr = re.compile(self.Regex)
+        #A base outside ErrorBases can never be an error, so it costs more than the allowed errors.
+        #Lanes are as many bytes wide as a full primer of these needs, so sums never carry into the next.
+        Bad = self.Errors + 1
+        self._Bytes = 1
+        while self.Length * Bad >= 256 ** self._Bytes:
+            self._Bytes += 1
+        Tables = {}
+        self._Lanes = []
+        for n in self.Primer:
+            if n not in Tables:
+                Allowed = IUPACAmb.get(n, n)
+                Costs = bytearray([Bad]) * 256
+                for b in ErrorBases:
+                    Costs[ord(b)] = 1
+                for b in Allowed:
+                    Costs[ord(b)] = 0
+                Tables[n] = bytes(Costs)
+            self._Lanes.append(Tables[n])
+        self._Tables = list(Tables.values())
+
+    def __repr__(self):
+        return 'PrimerMatcher(%r, %d)' % (self.Primer, self.Errors)
+
+    def search(self, Seq, Pos=0, EndPos=None):
+        """Return (start, end, errors) of the best hit in Seq[Pos:EndPos], or None."""
+        if EndPos is None or EndPos > len(Seq):
+            EndPos = len(Seq)
+        if isinstance(Seq, str):
+            Hit = self._ExactStr.search(Seq, Pos, EndPos)
+        else:
+            Hit = self._Exact.search(Seq, Pos, EndPos)
+        if Hit:
+            return Hit.start(), Hit.end(), 0
+        if self.Errors == 0 or EndPos - Pos < self.Length:
+            return None
+        if isinstance(Seq, str):
+            Window = Seq[Pos:EndPos].encode('ascii', 'replace')
+        elif Pos == 0 and EndPos == len(Seq) and isinstance(Seq, bytes):
+            Window = Seq
+        else:
+            Window = bytes(Seq[Pos:EndPos])
+        Width = len(Window)
+        Bytes = self._Bytes
+        Mismatch = {}
+        for Table in self._Tables:
+            Costs = Window.translate(Table)
+            if Bytes > 1:
+                Lanes = bytearray(Width * Bytes)
+                Lanes[::Bytes] = Costs
+                Costs = Lanes
+            Mismatch[Table] = int.from_bytes(Costs, 'little')
+        Total = 0
+        Shift = 0
+        for Table in self._Lanes:
+            Total += Mismatch[Table] >> Shift
+            Shift += 8 * Bytes
+        Counts = Total.to_bytes(Width * Bytes, 'little')[:(Width - self.Length + 1) * Bytes]
+        if Bytes > 1:
+            Counts = [int.from_bytes(Counts[n:n + Bytes], 'little') for n in range(0, len(Counts), Bytes)]
+        Best = min(Counts)
+        if Best > self.Errors:
+            return None
+        Start = Pos + Counts.index(Best)
+        return Start, Start + self.Length, Best
+
+    def end(self, Seq, Pos=0, EndPos=None):
+        """Return the end offset of the best hit in Seq, or -1."""
+        Hit = self.search(Seq, Pos, EndPos)
+        if Hit is None:
+            return -1
+        return Hit[1]
+
+class PrimerIndex:
+    """Best hit among several primers, searched together."""
+
+    def __init__(self, Matchers):
+        self.Matchers = list(Matchers)
+        #Each primer regex is only character classes, so the group that matched is the primer number
+        Regex = '|'.join(['(' + m.Regex + ')' for m in self.Matchers])
+        self._Exact = re.compile(Regex.encode('ascii'))
+        self._ExactStr = re.compile(Regex)
+
+    def __repr__(self):
+        return 'PrimerIndex(%r)' % self.Matchers
+
+    def search(self, Seq):
+        """Return (primer number, (start, end, errors)) of the best hit in Seq, or None."""
+        if isinstance(Seq, str):
+            Hit = self._ExactStr.search(Seq)
+        else:
+            Hit = self._Exact.search(Seq)
+        if Hit:
+            return Hit.lastindex - 1, (Hit.start(), Hit.end(), 0)
+        Best = None
+        for n, Matcher in enumerate(self.Matchers):
+            Hit = Matcher.search(Seq)
+            if Hit is not None and (Best is None or (Hit[2], Hit[0]) < (Best[1][2], Best[1][0])):
+                Best = n, Hit
+        return Best
+
+#Search Seq for hits starting inside Window = (first start, last start) and over the whole read if
+#that misses. Returns the hit and whether the whole read had to be searched.
+def WindowSearch(Matcher, Seq, Window):
+    if Window is None:
+        return Matcher.search(Seq), False
+    Hit = Matcher.search(Seq, Window[0], Window[1] + Matcher.Length)
+    if Hit is not None:
+        return Hit, False
+    return Matcher.search(Seq), True
+
+#Learn a search window from the hit starts of an initial batch of reads. The window covers all but
+#the Trim fraction of hits at each end, widened by Pad bases. Returns None if there are too few hits.
+def LearnWindow(Starts, Trim=0.005, Pad=2, MinHits=50):
+    if len(Starts) < MinHits:
+        return None
+    Starts = sorted(Starts)
+    Lo = Starts[int(len(Starts) * Trim)]
+    Hi = Starts[len(Starts) - 1 - int(len(Starts) * Trim)]
+    return max(0, Lo - Pad), Hi + Pad
@@ -0,0 +1,99 @@
+"""
+quality
+
+by M. R. Snyder 2018.
+Written for Python 3
+
+Quality filtering of trimmed reads for MetaTrim, in the same pass as trimming. Each trimmed read is:
+
+cut before the first base with a quality score below TruncQ
+rejected for max N if it then has more than MaxN N bases
+rejected for min quality if its mean quality score is below MinQual
+rejected for max EE if its expected errors, the sum of 10^(-Q/10) over its bases, are more than MaxEE
+
+A read pair is kept only if both reads pass, as with filterAndTrim in DADA2. Filters left as None are
+not applied.
+
+QualityFilter checks a whole batch of trimmed reads at once. With NumPy the quality strings of the
+batch are joined and decoded into one uint8 array, and the cut, the N count, the mean quality and
+the expected errors of every read are found with array operations. Without NumPy each read is
+checked in turn.
+"""
+
+from spacers import LoadNumpy
+
+#Reasons a read is rejected, as numbered in QualityFilter results (0 is kept)
+Rejections = ('max N', 'min quality', 'max EE')
+
+class QualityFilter:
+    """Truncation and expected error filtering of batches of trimmed reads."""
+
+    def __init__(self, MaxEE=None, MinQual=None, TruncQ=None, MaxN=None, Offset=33):
+        self.MaxEE = MaxEE
+        self.MinQual = MinQual
+        self.TruncQ = TruncQ
+        self.MaxN = MaxN
+        self.Offset = Offset
+        #Error probability of every quality character
+        self.Errors = [10 ** (-max(n - Offset, 0) / 10) for n in range(256)]
+        numpy = LoadNumpy()
+        if numpy is not None:
+            self.ErrorArray = numpy.array(self.Errors)
+
+    #Length each read of Seqs and Quals (bytes) keeps and its rejection number, 0 if it passes
+    def check(self, Seqs, Quals):
+        if not Quals:
+            return [], []
+        numpy = LoadNumpy()
+        if numpy is None:
+            Results = [self._check(Seq, Qual) for Seq, Qual in zip(Seqs, Quals)]
+            return [Result[0] for Result in Results], [Result[1] for Result in Results]
+        Lengths = numpy.fromiter(map(len, Quals), dtype=numpy.int64, count=len(Quals))
+        Starts = numpy.zeros(len(Quals), dtype=numpy.int64)
+        numpy.cumsum(Lengths[:-1], out=Starts[1:])
+        Qual = numpy.frombuffer(b''.join(Quals), dtype=numpy.uint8)
+        #Read number and position in its read of every base
+        Read = numpy.repeat(numpy.arange(len(Quals)), Lengths)
+        Position = numpy.arange(len(Qual)) - Starts[Read]
+        if self.TruncQ is not None:
+            Low = Qual < self.TruncQ + self.Offset
+            First = numpy.full(len(Quals), numpy.iinfo(numpy.int64).max)
+            numpy.minimum.at(First, Read[Low], Position[Low])
+            Lengths = numpy.minimum(Lengths, First)
+            Kept = Position < Lengths[Read]
+            Read = Read[Kept]
+            Qual = Qual[Kept]
+        else:
+            Kept = None
+        Fails = numpy.zeros(len(Quals), dtype=numpy.int64)
+        if self.MaxEE is not None:
+            EE = numpy.bincount(Read, weights=self.ErrorArray[Qual], minlength=len(Quals))
+            Fails[EE > self.MaxEE] = 3
+        if self.MinQual is not None:
+            Sums = numpy.bincount(Read, weights=Qual, minlength=len(Quals)) - self.Offset * Lengths
+            Fails[Sums < self.MinQual * Lengths] = 2
+        if self.MaxN is not None:
+            Seq = numpy.frombuffer(b''.join(Seqs), dtype=numpy.uint8)
+            if Kept is not None:
+                Seq = Seq[Kept]
+            Ns = numpy.bincount(Read[Seq == ord('N')], minlength=len(Quals))
+            Fails[Ns > self.MaxN] = 1
+        return Lengths.tolist(), Fails.tolist()
+
+    #Length kept and rejection number of one read
+    def _check(self, Seq, Qual):
+        Length = len(Qual)
+        if self.TruncQ is not None:
+            for n, q in enumerate(Qual):
+                if q < self.TruncQ + self.Offset:
+                    Length = n
+                    break
+            Seq = Seq[:Length]
+            Qual = Qual[:Length]
+        if self.MaxN is not None and Seq.count(b'N') > self.MaxN:
+            return Length, 1
+        if self.MinQual is not None and sum(Qual) - self.Offset * Length < self.MinQual * Length:
+            return Length, 2
+        if self.MaxEE is not None and sum([self.Errors[q] for q in Qual]) > self.MaxEE:
+            return Length, 3
+        return Length, 0
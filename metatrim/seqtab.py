@@ -0,0 +1,136 @@
+"""
+seqtab
+
+by M. R. Snyder 2018.
+Written for Python 3
+
+DADA2 sequence tables to fasta files, the Python counterpart of SeqTabToFasta.pl. The first row of
+SeqTab.txt is every ASV sequence in quotes, and every following row is a quoted sample name and the
+number of reads of each ASV in that sample. SeqTabToFasta writes each sample's ASVs with reads to
+<dir>Dada2ASVs/<sample>OTUs.fasta, named 1 to the number of ASVs and the read count separated by
+"|", and writes the reads and ASVs of every sample to Dada2OTUSummary.txt, as the Perl script does.
+
+Sample rows are read one at a time and handed to Jobs worker processes, which hold the ASV
+sequences. With NumPy a row's counts are parsed into an integer array in one call and the ASVs
+without reads are dropped in one step, so a row only costs Python work for the ASVs the sample
+has. Without NumPy the counts are parsed and checked one by one.
+
+With Combined, every ASV with reads in any sample is also written once to <dir>Dada2ASVs.fasta,
+named with its number, its total reads and the reads in each sample that has it:
+>n|total;sample=count;sample=count
+
+Usage:
+python seqtab.py [--in SeqTab.txt] [--jobs N] [--combined]
+"""
+
+import os
+import sys
+from spacers import LoadNumpy
+from options import PopOption, PopFlag
+
+#ASV sequences of the header row, without their quotes
+def ReadHeader(Line):
+    return [Col[1:-1] for Col in Line.rstrip('\r\n').split('\t')]
+
+#Sample name and the read count of each of Width ASVs in a sample row. Counts past the last ASV are
+#ignored and missing counts are 0.
+def ReadRow(Line, Width):
+    Line = Line.rstrip('\r\n')
+    Tab = Line.find('\t')
+    if Tab < 0:
+        Sample, Text = Line, ''
+    else:
+        Sample, Text = Line[:Tab], Line[Tab + 1:]
+    numpy = LoadNumpy()
+    if numpy is not None:
+        Counts = numpy.array(Text.split('\t'), dtype=numpy.int64) if Text else numpy.zeros(0, numpy.int64)
+        if len(Counts) >= Width:
+            return Sample[1:-1], Counts[:Width]
+        return Sample[1:-1], numpy.concatenate((Counts, numpy.zeros(Width - len(Counts), numpy.int64)))
+    Counts = [int(n) for n in Text.split('\t')[:Width]] if Text else []
+    return Sample[1:-1], Counts + [0] * (Width - len(Counts))
+
+#Total reads of a row of counts, and the columns and counts of the ASVs with reads
+def Present(Counts):
+    numpy = LoadNumpy()
+    if numpy is not None:
+        Columns = numpy.flatnonzero(Counts > 0)
+        return int(Counts.sum()), Columns.tolist(), Counts[Columns].tolist()
+    Columns = [n for n, Count in enumerate(Counts) if Count > 0]
+    return sum(Counts), Columns, [Counts[n] for n in Columns]
+
+#ASV sequences and output directory for each worker process
+SeqTabSettings = {}
+
+def InitSeqTabWorker(Seqs, OutDir, Combined):
+    SeqTabSettings['Seqs'] = Seqs
+    SeqTabSettings['OutDir'] = OutDir
+    SeqTabSettings['Combined'] = Combined
+
+#Write one sample row's fasta file. Returns the sample, its total reads and number of ASVs, and with
+#Combined the columns and counts of its ASVs.
+def SampleFasta(Line):
+    Seqs = SeqTabSettings['Seqs']
+    Sample, Counts = ReadRow(Line, len(Seqs))
+    Total, Columns, Reads = Present(Counts)
+    with open(os.path.join(SeqTabSettings['OutDir'], Sample+'OTUs.fasta'), 'w') as outfile:
+        outfile.write(''.join(['>%d|%d\n%s\n' % (d, Count, Seqs[n]) \
+            for d, (n, Count) in enumerate(zip(Columns, Reads), 1)]))
+    if SeqTabSettings['Combined']:
+        return Sample, Total, len(Columns), Columns, Reads
+    return Sample, Total, len(Columns), None, None
+
+#Write every ASV with reads once, with its reads in each sample. Samples is a list of (sample, columns,
+#counts).
+def WriteCombined(Path, Seqs, Samples):
+    Totals = {}
+    Found = {}
+    for Sample, Columns, Counts in Samples:
+        for n, Count in zip(Columns, Counts):
+            Totals[n] = Totals.get(n, 0) + Count
+            Found.setdefault(n, []).append('%s=%d' % (Sample, Count))
+    with open(Path, 'w') as outfile:
+        for d, n in enumerate(sorted(Found), 1):
+            outfile.write('>%d|%d;%s\n%s\n' % (d, Totals[n], ';'.join(Found[n]), Seqs[n]))
+
+#Write a fasta file for every sample in a DADA2 sequence table, Jobs samples at a time
+def SeqTabToFasta(Infile='SeqTab.txt', Jobs=1, Combined=False):
+    basenm = os.path.basename(os.getcwd())
+    OTUsDir = basenm+'Dada2ASVs'
+    os.makedirs(OTUsDir, exist_ok=True)
+    Samples = []
+    nsamples = 0
+    with open(Infile) as infile, open('Dada2OTUSummary.txt', 'w') as outsum:
+        outsum.write('Sample\tN reads\tN ASVs\n')
+        Seqs = ReadHeader(next(infile, ''))
+        if Jobs > 1:
+            import multiprocessing
+            Pool = multiprocessing.Pool(Jobs, InitSeqTabWorker, (Seqs, OTUsDir, Combined))
+            Rows = Pool.imap(SampleFasta, infile)
+        else:
+            Pool = None
+            InitSeqTabWorker(Seqs, OTUsDir, Combined)
+            Rows = map(SampleFasta, infile)
+        try:
+            #Summary rows are written in table order whichever worker finishes first
+            for Sample, Total, NASVs, Columns, Counts in Rows:
+                outsum.write('%s\t%d\t%d\n' % (Sample, Total, NASVs))
+                if Combined:
+                    Samples.append((Sample, Columns, Counts))
+                nsamples += 1
+        finally:
+            if Pool is not None:
+                Pool.terminate()
+    if Combined:
+        WriteCombined(OTUsDir+'.fasta', Seqs, Samples)
+        print ('All samples written to', OTUsDir+'.fasta')
+    print (len(Seqs), 'unique sequences in', nsamples, 'samples processed.')
+
+if __name__ == "__main__":
+    Infile = PopOption(sys.argv, '--in', 'SeqTab.txt')
+    Jobs = int(PopOption(sys.argv, '--jobs', 1))
+    Combined = PopFlag(sys.argv, '--combined')
+    if len(sys.argv) != 1:
+        print (__doc__)
+        exit()
+    SeqTabToFasta(Infile, Jobs, Combined)
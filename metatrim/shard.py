@@ -0,0 +1,170 @@
+"""
+shard
+
+by M. R. Snyder 2018.
+Written for Python 3
+
+Sample claims for sharded MetaTrim runs, where several nodes sharing a filesystem trim one parent
+directory together. Every node works through the same list of samples. A node trims a sample only
+after claiming it by creating <dir>Shards/<sample>.<key>.claim, which succeeds for exactly one node
+because the file is created with O_EXCL. When the sample is finished the node writes its summary
+rows, spacer counts and metrics to a fragment, <dir>Shards/<sample>.<key>.json, which is written to
+a temporary file and renamed into place so no node ever reads half of one. The key is a hash of the
+trim parameters, so a run with other settings claims and trims every sample again.
+
+Claims are touched by their node while it works. With a Timeout, a claim nobody has touched for that
+many seconds, and whose sample has no fragment, is taken to belong to a node that died: it is
+renamed out of the way, which only one node can do, and claimed again. Without a Timeout claims
+never go stale and a dead node's claims have to be removed by hand.
+
+A sample sheet lists the forward and reverse files of each sample, one pair per line separated by a
+tab, comma or spaces, so nodes need not list a large parent directory again.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+#Short hash of the trim parameters
+def ParameterKey(Parameters):
+    return hashlib.md5(json.dumps(Parameters, sort_keys=True).encode('ascii')).hexdigest()[:12]
+
+#(forward, reverse) file pairs of a sample sheet
+def ReadSampleSheet(Path):
+    Pairs = []
+    with open(Path) as infile:
+        for line in infile:
+            Fields = line.replace(',', ' ').split()
+            if len(Fields) >= 2 and not Fields[0].startswith('#'):
+                Pairs.append((Fields[0], Fields[1]))
+    return Pairs
+
+#Write a sample sheet of (forward, reverse) file pairs in one step
+def WriteSampleSheet(Path, Pairs):
+    with open(Path + '.%d.tmp' % os.getpid(), 'w') as outfile:
+        outfile.write(''.join('%s\t%s\n' % Pair for Pair in Pairs))
+    os.replace(Path + '.%d.tmp' % os.getpid(), Path)
+
+class ShardClaims:
+    """Claims and summary fragments of the samples of one sharded run."""
+
+    def __init__(self, Dir, Parameters, Node=None, Timeout=0):
+        self.Dir = Dir
+        self.Key = ParameterKey(Parameters)
+        self.Node = Node or '%s.%d' % (os.uname().nodename if hasattr(os, 'uname') else 'node', os.getpid())
+        self.Timeout = Timeout
+        self.Held = set()
+        self.Lock = threading.Lock()
+        self.Stop = threading.Event()
+        self.Heartbeat = None
+        os.makedirs(Dir, exist_ok=True)
+
+    def _path(self, Sample, Ext):
+        return os.path.join(self.Dir, '%s.%s.%s' % (Sample, self.Key, Ext))
+
+    def _read(self, Path):
+        try:
+            with open(Path) as infile:
+                return infile.read()
+        except OSError:
+            return None
+
+    #True if Sample has a fragment
+    def done(self, Sample):
+        return os.path.exists(self._path(Sample, 'json'))
+
+    #Claim Sample for this node. Returns False if another node holds it or it is already done.
+    def claim(self, Sample):
+        Path = self._path(Sample, 'claim')
+        try:
+            Claim = os.open(Path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not self._steal(Path):
+                return False
+            return self.claim(Sample)
+        with os.fdopen(Claim, 'w') as outfile:
+            outfile.write('%s\t%f\n' % (self.Node, time.time()))
+        #A sample finished just before it was claimed is not trimmed again
+        if self.done(Sample):
+            os.remove(Path)
+            return False
+        with self.Lock:
+            self.Held.add(Path)
+        self._beat()
+        return True
+
+    #Move a stale claim out of the way. Only the node whose rename succeeds goes on to claim again.
+    def _steal(self, Path):
+        if not self.Timeout:
+            return False
+        try:
+            Age = time.time() - os.path.getmtime(Path)
+        except OSError:
+            return True
+        if Age < self.Timeout:
+            return False
+        Seen = self._read(Path)
+        Stale = '%s.%s.stale' % (Path, self.Node)
+        try:
+            os.rename(Path, Stale)
+        except OSError:
+            return False
+        if self._read(Stale) != Seen:
+            #Another node claimed the sample again first, so its claim is put back
+            try:
+                os.link(Stale, Path)
+            except OSError:
+                pass
+            os.remove(Stale)
+            return False
+        os.remove(Stale)
+        print ('Taking over the claim', os.path.basename(Path), 'left by', (Seen or '?').split('\t')[0])
+        return True
+
+    #Give up a claim, as when trimming the sample failed, so another node can take it
+    def release(self, Sample):
+        Path = self._path(Sample, 'claim')
+        with self.Lock:
+            self.Held.discard(Path)
+        try:
+            os.remove(Path)
+        except OSError:
+            pass
+
+    #Touch every claim held, every quarter of the Timeout, until close
+    def _beat(self):
+        if not self.Timeout or self.Heartbeat is not None:
+            return
+        def Beat():
+            while not self.Stop.wait(self.Timeout / 4):
+                with self.Lock:
+                    Held = list(self.Held)
+                for Path in Held:
+                    try:
+                        os.utime(Path)
+                    except OSError:
+                        pass
+        self.Heartbeat = threading.Thread(target=Beat, daemon=True)
+        self.Heartbeat.start()
+
+    #Save the results of a claimed sample. The claim is kept as a record of the node that trimmed it.
+    def finish(self, Sample, Fragment):
+        Fragment = dict(Fragment, Node=self.Node, Key=self.Key)
+        Path = self._path(Sample, 'json')
+        with open(Path + '.%s.tmp' % self.Node, 'w') as outfile:
+            json.dump(Fragment, outfile)
+        os.replace(Path + '.%s.tmp' % self.Node, Path)
+        with self.Lock:
+            self.Held.discard(self._path(Sample, 'claim'))
+
+    #Fragment of a finished sample, or None
+    def fragment(self, Sample):
+        Text = self._read(self._path(Sample, 'json'))
+        return None if Text is None else json.loads(Text)
+
+    def close(self):
+        self.Stop.set()
+        if self.Heartbeat is not None:
+            self.Heartbeat.join()
@@ -0,0 +1,105 @@
+"""
+simfastq
+
+by M. R. Snyder 2018.
+Written for Python 3
+
+Synthetic paired eDNA metabarcoding reads for benchmarking MetaTrim. SimulateSample writes a
+sample subdirectory with [...]_R1_001.fastq.gz and [...]_R2_001.fastq.gz files laid out the way
+metatrim.py expects to find them. Each forward read is a spacer insert, the forward primer, the
+marker, the reverse complement of the reverse primer and random bases to the read length. Reverse
+reads are built the same way from the other strand.
+
+Degenerate primer bases are filled with a random base they stand for, and each primer base is
+substituted with another base at the given rate. With spacers, every read of a sample starts with
+the sample's forward or reverse spacer, except the index hop fraction of pairs, which carry the
+spacers of another sample in the forward read.
+
+Usage:
+python simfastq.py Dir [--samples N] [--reads N] [--primer-set NAME] [--length N] [--read-length N]
+[--substitutions RATE] [--spacers Y/N] [--index-hops FRACTION] [--seed N]
+"""
+
+import os
+import sys
+import random
+from fastqio import FastqWriter
+from spacers import FSpacers, RSpacers
+from primermatch import IUPACAmb
+from metatrim import PrimerSets, RevComp
+from options import PopOption
+
+#A primer with each degenerate base replaced by a base it stands for and each base substituted at Rate
+def PrimerCopy(Primer, Rate, Random):
+    Bases = []
+    for n in Primer:
+        Base = Random.choice(IUPACAmb.get(n, n))
+        if Rate and Random.random() < Rate:
+            Base = Random.choice([b for b in 'ACGT' if b != Base])
+        Bases.append(Base)
+    return ''.join(Bases)
+
+def RandomBases(Count, Random):
+    return ''.join(Random.choices('ACGT', k=Count))
+
+#Write one synthetic sample to Dir/Sample_L001-ds.sim/. Length 0 or None uses the primer set's
+#length, or markers of 100-180 bases if that is 0. Spacer is the spacer label ('e'-'h') the sample
+#was prepared with. Returns the paths of the forward and reverse files.
+def SimulateSample(Dir, Sample, Reads=10000, PrimerSet='CYPPART', Length=None, ReadLength=250, \
+    Substitutions=0.0, Spacer='e', IndexHops=0.0, Level=6, Seed=0):
+    Random = random.Random('%s%s' % (Seed, Sample))
+    PF, PR, SetLength = PrimerSets[PrimerSet.upper()]
+    if not Length:
+        Length = int(SetLength)
+    SubDir = os.path.join(Dir, Sample+'_L001-ds.sim')
+    os.makedirs(SubDir, exist_ok=True)
+    InForward = os.path.join(SubDir, Sample+'_S1_L001_R1_001.fastq.gz')
+    InReverse = os.path.join(SubDir, Sample+'_S1_L001_R2_001.fastq.gz')
+    Labels = sorted(FSpacers)
+    Quality = b'I' * ReadLength
+    with FastqWriter(InForward, Level) as Foutfile, FastqWriter(InReverse, Level) as Routfile:
+        for n in range(Reads):
+            Marker = RandomBases(Length or Random.randint(100, 180), Random)
+            Amplicon = PrimerCopy(PF, Substitutions, Random) + Marker + RevComp(PrimerCopy(PR, Substitutions, \
+                Random))
+            FLead = RLead = ''
+            if Spacer:
+                FLabel = RLabel = Spacer
+                if IndexHops and Random.random() < IndexHops:
+                    FLabel = Random.choice([l for l in Labels if l != Spacer])
+                FLead = FSpacers[FLabel]
+                RLead = RSpacers[RLabel]
+            FSeq = FLead + Amplicon
+            RSeq = RLead + RevComp(Amplicon)
+            FSeq = (FSeq + RandomBases(ReadLength - len(FSeq), Random))[:ReadLength]
+            RSeq = (RSeq + RandomBases(ReadLength - len(RSeq), Random))[:ReadLength]
+            Name = '@SIM:1:FC:1:1:%d:%d' % (n // 1000, n % 1000)
+            Foutfile.write(((Name+' 1:N:0:1').encode('ascii'), FSeq.encode('ascii'), Quality))
+            Routfile.write(((Name+' 2:N:0:1').encode('ascii'), RSeq.encode('ascii'), Quality))
+    return InForward, InReverse
+
+#Write Samples synthetic samples to Dir. With Spacers each sample gets the next spacer label.
+#Returns the forward and reverse file of each sample.
+def SimulateRun(Dir, Samples=2, Spacers=True, **Settings):
+    Labels = sorted(FSpacers)
+    Pairs = []
+    for n in range(Samples):
+        Spacer = Labels[n % len(Labels)] if Spacers else None
+        Pairs.append(SimulateSample(Dir, 'sim%02d' % (n + 1), Spacer=Spacer, **Settings))
+    return Pairs
+
+if __name__ == "__main__":
+    Samples = int(PopOption(sys.argv, '--samples', 2))
+    Settings = {'Reads': int(PopOption(sys.argv, '--reads', 10000)), \
+        'PrimerSet': PopOption(sys.argv, '--primer-set', 'CYPPART'), \
+        'Length': int(PopOption(sys.argv, '--length', 0)), \
+        'ReadLength': int(PopOption(sys.argv, '--read-length', 250)), \
+        'Substitutions': float(PopOption(sys.argv, '--substitutions', 0.0)), \
+        'IndexHops': float(PopOption(sys.argv, '--index-hops', 0.0)), \
+        'Seed': int(PopOption(sys.argv, '--seed', 0))}
+    Spacers = PopOption(sys.argv, '--spacers', 'Y').upper() == 'Y'
+    if len(sys.argv) != 2:
+        print (__doc__)
+        exit()
+    for InForward, InReverse in SimulateRun(sys.argv[1], Samples, Spacers, **Settings):
+        print (InForward, InReverse)
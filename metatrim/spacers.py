@@ -0,0 +1,124 @@
+"""
+spacers
+
+by M. R. Snyder 2018.
+Written for Python 3
+
+Spacer insert classification for MetaTrim. The spacer inserts published in Klymus et al. 2017
+are the first four bases of each read. A read has a spacer if its first four bases are within one
+error of it, where the error base is one of ATCGN. The spacers of each direction differ at three or
+more bases, so a read can have at most one of them.
+
+SpacerClassifier classifies a whole batch of reads at once. With NumPy the leading bases of the
+batch are loaded into a uint8 array and compared with every spacer in one step. Without NumPy each
+read is looked up in a table of every four base sequence within one error of a spacer. NumPy is
+only imported when the first classifier is built, so importing spacers stays fast.
+"""
+
+numpy = None
+NumpyChecked = False
+
+#Import NumPy the first time it is needed. Returns None if it is not installed
+def LoadNumpy():
+    global numpy, NumpyChecked
+    if not NumpyChecked:
+        NumpyChecked = True
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
+#Spacer inserts from Klymus et al. 2017 at the start of forward and reverse reads
+FSpacers = {'e': 'TCCT',
+            'f': 'ATGC',
+            'g': 'CGAG',
+            'h': 'GATA'
+            }
+RSpacers = {'e': 'CGTA',
+            'f': 'TCAC',
+            'g': 'GAGT',
+            'h': 'ATCG'
+            }
+
+#Bases that can stand in for a spacer base as its one error
+SpacerBases = 'ATCGN'
+
+class SpacerClassifier:
+    """Batch classification of reads by the spacer they start with."""
+
+    def __init__(self, Spacers, Errors=1):
+        self.Labels = list(Spacers)
+        self.Spacers = [Spacers[l] for l in self.Labels]
+        self.Width = len(self.Spacers[0])
+        self.Errors = Errors
+        #Every sequence within Errors of a spacer, as str and bytes, for classifying without NumPy
+        self.Table = {}
+        Variants = [(s, n) for n, s in enumerate(self.Spacers)]
+        for e in range(Errors + 1):
+            for Variant, n in Variants:
+                self.Table.setdefault(Variant, n)
+            if e < Errors:
+                Variants = [(v[:i] + b + v[i + 1:], n) for v, n in Variants for i in range(self.Width) \
+                    for b in SpacerBases]
+        for Variant, n in list(self.Table.items()):
+            self.Table[Variant.encode('ascii')] = n
+        if LoadNumpy() is not None:
+            self.Array = numpy.frombuffer(''.join(self.Spacers).encode('ascii'), \
+                dtype=numpy.uint8).reshape(len(self.Spacers), self.Width)
+            self.Allowed = numpy.zeros(256, dtype=bool)
+            self.Allowed[list(SpacerBases.encode('ascii'))] = True
+
+    #Spacer index of each read in Seqs (all str or all bytes), or -1 for reads without a spacer
+    def classify(self, Seqs):
+        if not Seqs:
+            return []
+        Width = self.Width
+        Lead = [s[:Width] for s in Seqs]
+        if numpy is None:
+            Table = self.Table
+            return [Table.get(s, -1) for s in Lead]
+        if isinstance(Lead[0], str):
+            Lead = ''.join([s.ljust(Width, '\0') for s in Lead]).encode('ascii', 'replace')
+        else:
+            Lead = b''.join([s.ljust(Width, b'\0') for s in Lead])
+        Bases = numpy.frombuffer(Lead, dtype=numpy.uint8).reshape(len(Seqs), Width)
+        Mismatch = Bases[:, None, :] != self.Array[None, :, :]
+        #A mismatch at a base outside SpacerBases can never be one of the allowed errors
+        Bad = (Mismatch & ~self.Allowed[Bases][:, None, :]).any(axis=2)
+        Hit = (Mismatch.sum(axis=2) <= self.Errors) & ~Bad
+        Labels = numpy.where(Hit.any(axis=1), Hit.argmax(axis=1), -1)
+        return Labels.tolist()
+
+    #True for each read in Seqs that starts with the spacer labelled Label
+    def matches(self, Seqs, Label):
+        Index = self.Labels.index(Label)
+        return [n == Index for n in self.classify(Seqs)]
+
+    #Number of reads in Seqs starting with each spacer
+    def tally(self, Seqs):
+        Count = dict.fromkeys(self.Labels, 0)
+        for n in self.classify(Seqs):
+            if n >= 0:
+                Count[self.Labels[n]] += 1
+        return Count
+
+#Write the spacer counts of every sample, one row each: the sample's forward and reverse spacers, the
+#reads of each direction starting with each spacer or none, and the read pairs with each forward and
+#reverse spacer combination. Pairs w/ Other Spacer Combo have a spacer at both ends, but not the
+#sample's, as when an index hops.
+def WriteSpacerCounts(Path, Samples):
+    FLabels = list(FSpacers) + ['none']
+    RLabels = list(RSpacers) + ['none']
+    with open(Path, 'w') as outfile:
+        outfile.write('\t'.join(['Sample', 'F Spacer', 'R Spacer'] + ['F '+l for l in FLabels] + \
+            ['R '+l for l in RLabels] + [f+'/'+r for f in FLabels for r in RLabels] + \
+            ['Pairs w/ Other Spacer Combo']) + '\n')
+        for Sample in Samples:
+            Pairs = Sample['Pairs']
+            F = FLabels.index(Sample['Forward'])
+            R = RLabels.index(Sample['Reverse'])
+            Others = sum(Pairs[f][r] for f in range(len(FSpacers)) for r in range(len(RSpacers))) - Pairs[F][R]
+            outfile.write('\t'.join([Sample['Sample'], Sample['Forward'], Sample['Reverse']] + \
+                [str(n) for n in Sample['ForwardReads'] + Sample['ReverseReads']] + \
+                [str(n) for Row in Pairs for n in Row] + [str(Others)]) + '\n')
@@ -0,0 +1,10 @@
+"""
+conftest
+
+Tests import MetaTrim's modules the way metatrim.py does, from the metatrim folder.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,44 @@
+"""
+Reservoir sampling and the calibration table worked out from primer hits.
+"""
+
+import collections
+
+from calibrate import ReservoirSample, TargetLength, CalibrationTable, Recommend
+
+def test_reservoir_sample():
+    Batches = [list(range(n, n + 1000)) for n in range(0, 100000, 1000)]
+    Sample = ReservoirSample(Batches, 500, Seed=1)
+    assert len(Sample) == len(set(Sample)) == 500
+    assert Sample == ReservoirSample(Batches, 500, Seed=1)
+    #Every tenth of the items gives about a tenth of the sample
+    Tenths = collections.Counter(n // 10000 for n in Sample)
+    assert all(20 <= Tenths[n] <= 80 for n in range(10))
+    assert sorted(ReservoirSample([[1, 2], [3]], 10)) == [1, 2, 3]
+
+def test_target_length():
+    Lengths = [100, 0]
+    #(primer set, target start, errors, opposite end, opposite errors, read length, starts with a base)
+    assert TargetLength((0, 20, 1, None, 0, 250, True), 1, 0, Lengths) == (0, 100)
+    assert TargetLength((0, 20, 2, None, 0, 250, True), 1, 0, Lengths) is None
+    assert TargetLength((0, 20, 0, None, 0, 250, False), 1, 0, Lengths) is None
+    assert TargetLength((0, 200, 0, None, 0, 250, True), 0, 0, Lengths) == (0, 50)
+    assert TargetLength((1, 20, 0, 180, 2, 250, True), 0, 2, Lengths) == (1, 160)
+    assert TargetLength((1, 20, 0, 180, 2, 250, True), 0, 1, Lengths) == (1, 230)
+    assert TargetLength(None, 3, 3, Lengths) is None
+
+def test_calibration_table():
+    Lengths = [100]
+    Cutoffs = [75]
+    #Forward hits with 0, 1 and 2 errors, reverse hits with 0 errors, and one pair of other reads
+    FHits = [(0, 20, Errors, None, 0, 250, True) for Errors in (0, 1, 2)] + [(0, 20, 0, None, 0, 250, True)]
+    RHits = [(0, 20, 0, None, 0, 250, True)] * 4
+    Paired = [True, True, True, False]
+    Seconds = {'F': [(0.001, 0.0)] * 3, 'R': [(0.001, 0.0)] * 3}
+    Rows = CalibrationTable(FHits, RHits, Paired, Seconds, Lengths, Cutoffs, 2)
+    assert [(Row['ErrF'], Row['ErrR'], Row['Pairs']) for Row in Rows if Row['ErrR'] == 0] == \
+        [(0, 0, 1), (1, 0, 2), (2, 0, 3)]
+    assert [Row['FTrimmed'] for Row in Rows if Row['ErrR'] == 0] == [2, 3, 4]
+    Best = Recommend(Rows)
+    assert (Best['ErrF'], Best['ErrR'], Best['Share']) == (2, 0, 1.0)
+    assert (Recommend(Rows, Loss=0.5)['ErrF'], Recommend(Rows, Loss=0.5)['ErrR']) == (1, 0)
@@ -0,0 +1,53 @@
+"""
+PairDereplicator counts, names and qualities, and output that is the same after spilling to disk.
+"""
+
+import random
+
+import pytest
+
+from derep import PairDereplicator
+
+#Collects what PairDereplicator.write writes
+class Records(list):
+    def write(self, Record):
+        self.append(Record)
+
+def Dereplicate(Dir, Pairs, Quality='mean', MaxUnique=250000):
+    Derep = PairDereplicator(str(Dir), Quality, MaxUnique, Partitions=4, Fold=3)
+    for FRecord, RRecord in Pairs:
+        Derep.add(FRecord, RRecord)
+    F, R = Records(), Records()
+    Stats = Derep.write(F, R)
+    return Stats, F, R
+
+def test_counts_names_and_qualities(tmp_path):
+    Pairs = [((b'@r1 1:N', b'AAAA', b'IIII'), (b'@r1 2:N', b'CCCC', b'5555')),
+             ((b'@r2 1:N', b'GGGG', b'IIII'), (b'@r2 2:N', b'TTTT', b'IIII')),
+             ((b'@r3 1:N', b'AAAA', b'5555'), (b'@r3 2:N', b'CCCC', b'IIII')),
+             ((b'@r4 1:N', b'AAAA', b'IIII'), (b'@r4 2:N', b'CCCG', b'IIII'))]
+    Stats, F, R = Dereplicate(tmp_path, Pairs, 'max')
+    assert Stats == [4, 3, 2, 2]
+    assert [Record[0] for Record in F] == [b'@r1;size=2', b'@r4;size=1', b'@r2;size=1']
+    assert [Record[1] for Record in R] == [b'CCCC', b'CCCG', b'TTTT']
+    assert F[0][2] == b'IIII' and R[0][2] == b'IIII'
+    Stats, F, R = Dereplicate(tmp_path, Pairs, 'first')
+    assert F[0][2] == b'IIII' and R[0][2] == b'5555'
+    #'I' is 40 and '5' is 20, so the mean is 30, '?'
+    Stats, F, R = Dereplicate(tmp_path, Pairs, 'mean')
+    assert F[0][2] == b'????' and R[0][2] == b'????'
+    with pytest.raises(ValueError):
+        PairDereplicator(str(tmp_path), 'median')
+
+@pytest.mark.parametrize('Quality', ['mean', 'max', 'first'])
+def test_spilled_is_the_same(tmp_path, Quality):
+    Random = random.Random(0)
+    Pairs = []
+    for n in range(3000):
+        FSeq = bytes(Random.choice(b'ACGT') for m in range(3))
+        RSeq = bytes(Random.choice(b'ACGT') for m in range(3))
+        Pairs.append(((b'@r%d 1:N' % n, FSeq, bytes(Random.randint(35, 74) for m in FSeq)),
+                      (b'@r%d 2:N' % n, RSeq, bytes(Random.randint(35, 74) for m in RSeq))))
+    InMemory = Dereplicate(tmp_path, Pairs, Quality)
+    assert InMemory[0][:2] == [3000, len(set((F[1], R[1]) for F, R in Pairs))]
+    assert Dereplicate(tmp_path, Pairs, Quality, MaxUnique=50) == InMemory
@@ -0,0 +1,68 @@
+"""
+Trim summaries and trimmed reads of the example data, pinned to what the first MetaTrim wrote for
+them. metatrimExampleDataTrimSummary.txt and metatrimExampleDataTrimmedFastqs were written by an
+earlier version for other reads, so the expected rows and checksums here are from the first MetaTrim
+of this repository run on the example samples. cBKW05 has no reverse reads, so only cBKW02b is
+trimmed.
+"""
+
+import builtins
+import hashlib
+import os
+import shutil
+
+import pytest
+
+import metatrim
+
+Example = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'metatrimExampleData')
+
+#Arguments after the primer sets, the summary row of cBKW02b and the checksums of its trimmed reads
+Runs = [((2, 2, 'CYPPART', 'Y'), 'cBKW02b\t25000\t24901\t24865\t22113\t57\t22192\t2808',
+         ('6ca7810f49d37545068f21db60a3d17d', '5c6836851f5a6728f9e338d3364edf73')),
+        ((2, 2, 'CYPPART', 'N'), 'cBKW02b\t25000\t24973\t24945\t22244\t61',
+         ('e6886af60d75b36005dd1b52cb9da22f', '44bcf071bf53aa97e75443c8c00d26b1')),
+        ((1, 1, 0, 'Y'), 'cBKW02b\t25000\t23957\t23907\t22068\t1\t22144\t2856',
+         ('38003b9eb855e341898c8c459e3789b1', '3cb0fa92c4a39b645eb41985b6f2bb16')),
+        ((3, 3, 0, 'N'), 'cBKW02b\t25000\t24084\t24065\t22307\t9',
+         ('f2578a886f51d3d57f1b44075ac25305', '778cbeabbece507da7653513948c4c8c'))]
+
+#Copy the example samples to Dir/ex and work there
+@pytest.fixture
+def ExampleDir(tmp_path, monkeypatch):
+    Dir = tmp_path / 'ex'
+    Dir.mkdir()
+    for Name in os.listdir(Example):
+        if os.path.isdir(os.path.join(Example, Name)) and not Name.endswith('TrimmedFastqs'):
+            shutil.copytree(os.path.join(Example, Name), str(Dir / Name))
+    monkeypatch.chdir(str(Dir))
+    #A length of 0 asks for the primer dimer cutoff
+    monkeypatch.setattr(builtins, 'input', lambda Prompt='': '50')
+    return Dir
+
+def MD5(Path):
+    with open(str(Path), 'rb') as infile:
+        return hashlib.md5(infile.read()).hexdigest()
+
+@pytest.mark.parametrize('Args, Row, Checksums', Runs)
+def test_example_data(ExampleDir, Args, Row, Checksums):
+    metatrim.MetaTrimAll('CYPPART', 'x', 'x', *Args)
+    with open(str(ExampleDir / 'exTrimSummary.txt')) as infile:
+        Rows = infile.read().splitlines()
+    assert Rows[1:] == [Row]
+    assert tuple(MD5(ExampleDir / 'exTrimmedFastqs' / ('cBKW02b_R%d_001.fastq' % n)) for n in (1, 2)) == Checksums
+
+@pytest.mark.parametrize('Options', [{'Workers': 2}, {'Pipeline': True}, {'Jobs': 2, 'Shard': True}])
+def test_example_data_in_parallel(ExampleDir, Options):
+    Args, Row, Checksums = Runs[0]
+    metatrim.MetaTrimAll('CYPPART', 'x', 'x', *Args, **Options)
+    with open(str(ExampleDir / 'exTrimSummary.txt')) as infile:
+        assert infile.read().splitlines()[1:] == [Row]
+    assert tuple(MD5(ExampleDir / 'exTrimmedFastqs' / ('cBKW02b_R%d_001.fastq' % n)) for n in (1, 2)) == Checksums
+
+def test_example_calibration(ExampleDir):
+    #Every read is sampled, so the pairs at 2 and 2 errors are those trimmed without spacers
+    metatrim.MetaTrimAll('CYPPART', 'x', 'x', 2, 2, 'CYPPART', 'N', Calibrate=2, CalibrateReads=30000)
+    with open(str(ExampleDir / 'exErrorCalibration.txt')) as infile:
+        Rows = [line.split('\t') for line in infile]
+    assert [Row[3:7] for Row in Rows if Row[1:3] == ['2', '2']] == [['25000', '24973', '24945', '22244']]
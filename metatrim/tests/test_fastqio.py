@@ -0,0 +1,66 @@
+"""
+Fastq reading and writing, and reading indexed BGZF output by record range and by read name.
+"""
+
+import gzip
+import random
+
+import pytest
+
+from fastqio import FastqWriter, FastqIndex, ReadFastq, ReadRange, FetchReads, IndexPaths, ZlibReader
+
+Reads = 2000
+
+#Write Reads records of random length to Path, returning them
+def WriteReads(Path, *Args, **Kwargs):
+    Random = random.Random(0)
+    Records = []
+    with FastqWriter(str(Path), *Args, **Kwargs) as outfile:
+        for n in range(Reads):
+            Seq = bytes(Random.choice(b'ACGTN') for m in range(Random.randint(1, 300)))
+            Record = (b'@read%d 1:N:0:1' % n, Seq, bytes(Random.randint(35, 74) for m in Seq))
+            outfile.write(Record)
+            Records.append(Record)
+    return Records
+
+@pytest.mark.parametrize('Level, Compressor', [(0, 'auto'), (1, 'auto'), (1, 'threads'), (6, 'bgzf')])
+def test_round_trip(tmp_path, Level, Compressor):
+    Path = tmp_path / ('t.fastq.gz' if Level else 't.fastq')
+    Records = WriteReads(Path, Level, 2, Compressor)
+    if Level:
+        with gzip.open(str(Path), 'rb') as infile:
+            assert infile.read().count(b'\n') == 4 * Reads
+    Read = [tuple(Record) for Batch in ReadFastq(str(Path), 700, 'zlib', Decode=False) for Record in Batch]
+    assert Read == Records
+
+def test_bgzf_index(tmp_path):
+    Path = str(tmp_path / 't.fastq.gz')
+    Records = WriteReads(Path, 1, 2, 'bgzf', IndexEvery=100)
+    Index = FastqIndex(Path)
+    assert Index.Records == Reads
+    for Start, Stop in ((0, 10), (99, 101), (1234, 1789), (1990, 3000), (Reads, Reads + 1)):
+        Read = [tuple(Record) for Batch in ReadRange(Path, Start, Stop, 64, False, Index) for Record in Batch]
+        assert Read == Records[Start:Stop]
+    Ranges = Index.ranges(7)
+    assert Ranges[0][0] == 0 and Ranges[-1][1] == Reads
+    assert all(Range[1] == Next[0] for Range, Next in zip(Ranges, Ranges[1:]))
+    Names = ['read%d' % n for n in (1999, 3, 1500, 17)]
+    Fetched = [tuple(Record) for Record in FetchReads(Path, Names, False, Index)]
+    assert Fetched == [Records[n] for n in (3, 17, 1500, 1999)]
+    assert list(FetchReads(Path, ['missing'], False, Index)) == []
+
+def test_index_is_checked(tmp_path):
+    Path = str(tmp_path / 't.fastq.gz')
+    with open(IndexPaths(Path)[0], 'w') as outfile:
+        outfile.write('not an index\n')
+    with pytest.raises(ValueError):
+        FastqIndex(Path)
+
+def test_zlib_reader_reads_every_member(tmp_path):
+    Path = str(tmp_path / 't.gz')
+    with open(Path, 'wb') as outfile:
+        for n in range(50):
+            outfile.write(gzip.compress(b'member %d\n' % n))
+    with ZlibReader(Path, 100) as infile:
+        Data = b''.join(iter(infile.read, b''))
+    assert Data == b''.join(b'member %d\n' % n for n in range(50))
@@ -0,0 +1,70 @@
+"""
+Preview sampling of multi-member gzip files, where several places can lead to the same member, and
+the trim summary counts of sampled pairs.
+"""
+
+import random
+
+import fastqio
+from fastqio import FastqWriter, SampleFastq
+from metatrim import PreviewPairs, PreviewChunk, ReadName
+from preview import PreviewCounts
+
+Reads = 10000
+
+#Write a pair of fastq.gz files of Reads pairs with unique names, as the threads compressor does,
+#with a gzip member for about every MemberSize decompressed bytes
+def WritePair(Dir, MemberSize, monkeypatch):
+    monkeypatch.setattr(fastqio, 'WriteSize', MemberSize)
+    Random = random.Random(0)
+    Paths = [str(Dir / ('t_S1_L001_R%d_001.fastq.gz' % n)) for n in (1, 2)]
+    with FastqWriter(Paths[0], 1, 2, 'threads') as Foutfile, FastqWriter(Paths[1], 1, 2, 'threads') as Routfile:
+        for n in range(Reads):
+            Name = '@SIM:1:FC:1:1:%d:%d' % (n // 1000, n % 1000)
+            for Direction, outfile in ((1, Foutfile), (2, Routfile)):
+                Seq = ''.join(Random.choices('ACGT', k=150)).encode('ascii')
+                outfile.write(((Name + ' %d:N:0:1' % Direction).encode('ascii'), Seq, b'I' * 150))
+    return Paths
+
+def test_sample_fastq_many_members_unique(tmp_path, monkeypatch):
+    F, R = WritePair(tmp_path, 1 << 14, monkeypatch)
+    Sample = SampleFastq(F, [n / 20 for n in range(20)], PreviewChunk)
+    assert Sample is not None
+    Names = [ReadName(Read[0]) for Place in Sample[0] for Read in Place]
+    assert Names
+    assert len(set(Names)) == len(Names)
+
+def test_sample_fastq_same_member_read_once(tmp_path, monkeypatch):
+    F, R = WritePair(tmp_path, 1 << 14, monkeypatch)
+    #Each pair of places leads to the same gzip member
+    Fractions = [Fraction + Step for Fraction in (0.1, 0.3, 0.5, 0.7, 0.9) for Step in (0.0, 0.0001)]
+    Sample = SampleFastq(F, Fractions, PreviewChunk)
+    assert Sample is not None
+    Names = [ReadName(Read[0]) for Place in Sample[0] for Read in Place]
+    assert len(Names) == 5 * PreviewChunk
+    assert len(set(Names)) == len(Names)
+
+def test_sample_fastq_few_members_gives_up(tmp_path, monkeypatch):
+    F, R = WritePair(tmp_path, 1 << 20, monkeypatch)
+    #Most of 20 places lead to the same few members, which are read once at most
+    assert SampleFastq(F, [n / 20 for n in range(20)], PreviewChunk) is None
+
+def test_preview_pairs_unique(tmp_path, monkeypatch):
+    for MemberSize in (1 << 14, 1 << 20):
+        F, R = WritePair(tmp_path, MemberSize, monkeypatch)
+        FReads, RReads, Total, Share = PreviewPairs(F, R, 2000, 5.0, 'test')
+        Names = [ReadName(Read[0]) for Read in FReads]
+        assert Names
+        assert len(set(Names)) == len(Names)
+        assert Names == [ReadName(Read[0]) for Read in RReads]
+        assert 0 < Share <= 1.0
+        assert abs(Total - Reads) < 0.2 * Reads
+
+def test_preview_counts_per_primer_set():
+    #Forward and reverse (marker, status) of each pair: 0 is trimmed, 2 has no spacer and 4 is short
+    Pairs = [((0, 0), (0, 0)), ((0, 0), (0, 2)), ((1, 0), (1, 0)), ((0, 2), (0, 0)), ((0, 0), (1, 0)),
+             ((1, 4), (1, 0)), ((0, 0), (0, 4))]
+    F = ([0] * len(Pairs), [0] * len(Pairs), [Pair[0][0] for Pair in Pairs], [Pair[0][1] for Pair in Pairs])
+    R = ([0] * len(Pairs), [0] * len(Pairs), [Pair[1][0] for Pair in Pairs], [Pair[1][1] for Pair in Pairs])
+    #Spacer failures of each primer set only count the pairs its forward reads were kept for
+    assert PreviewCounts(F, R, 2, Spacers=True) == [[4, 3, 1, 1, 3, 1], [2, 3, 1, 0, 1, 0]]
@@ -0,0 +1,117 @@
+"""
+PrimerMatcher against the permutation regexes MetaTrim used to build with sympy, and against a plain
+search where those regexes would be too large to build.
+"""
+
+import random
+import re
+
+import pytest
+
+from primermatch import PrimerMatcher, PrimerIndex, WindowSearch, LearnWindow, IUPACAmb, ErrorBases
+
+Primers = ['CYCTHCTAGG', 'CYCCRTTRGC', 'TWAAAATYGC', 'ACRTCWCGRC', 'TNACNTTCCGN']
+
+#The degenerate primer regexes of the first MetaTrim, one per number of errors, each matching every
+#primer with up to that many errors
+def OldRegexes(Primer, Errors):
+    multiset_permutations = pytest.importorskip('sympy.utilities.iterables').multiset_permutations
+    Classes = dict((Code, '[' + Bases + ']') for Code, Bases in IUPACAmb.items())
+    DegPrimers = []
+    Perms = []
+    Regexes = []
+    for err in range(Errors + 1):
+        Perms.extend(multiset_permutations([0 if bp < err else 1 for bp in range(len(Primer))]))
+        for i in Perms:
+            for n in range(len(i)):
+                if i[n] == 0:
+                    i[n] = '[ACTGN]'
+                elif not isinstance(i[n], str):
+                    i[n] = Classes.get(Primer[n], Primer[n])
+            DegPrimers.append(''.join(i))
+        Regexes.append(re.compile('(' + '|'.join(DegPrimers) + ')'))
+    return Regexes
+
+#End of the first MetaTrim's hit, trying the regexes of fewer errors first, or -1
+def OldEnd(Regexes, Seq):
+    for Regex in Regexes:
+        Hit = Regex.search(Seq)
+        if Hit:
+            return Hit.end()
+    return -1
+
+#The best hit found by trying each start, as (start, end, errors)
+def PlainSearch(Primer, Errors, Seq):
+    Best = None
+    for Start in range(len(Seq) - len(Primer) + 1):
+        Count = 0
+        for p, b in zip(Primer, Seq[Start:Start + len(Primer)]):
+            if b in IUPACAmb.get(p, p):
+                continue
+            Count += 1 if b in ErrorBases else Errors + 1
+        if Count <= Errors and (Best is None or Count < Best[2]):
+            Best = Start, Start + len(Primer), Count
+    return Best
+
+#A read of random bases, often holding a copy of Primer with up to Errors + 1 substitutions, some of
+#them by a base that can never be an error
+def RandomRead(Random, Primer, Errors, Length):
+    Seq = ''.join(Random.choice('ACGT' * 8 + 'N' + 'X') for n in range(Length))
+    if Random.random() < 0.7 and Length > len(Primer):
+        Copy = [Random.choice(IUPACAmb.get(p, p)) for p in Primer]
+        for n in range(Random.randint(0, Errors + 1)):
+            Copy[Random.randrange(len(Copy))] = Random.choice('ACGTNX')
+        Start = Random.randrange(Length - len(Primer))
+        Seq = Seq[:Start] + ''.join(Copy) + Seq[Start + len(Primer):]
+    return Seq
+
+@pytest.mark.parametrize('Errors', [0, 1, 2, 3])
+def test_matches_old_regexes(Errors):
+    Random = random.Random(Errors)
+    for Primer in Primers:
+        Regexes = OldRegexes(Primer, Errors)
+        Matcher = PrimerMatcher(Primer, Errors)
+        for n in range(500):
+            Seq = RandomRead(Random, Primer, Errors, Random.randint(0, 60))
+            Expected = OldEnd(Regexes, Seq)
+            assert Matcher.end(Seq) == Expected, (Primer, Errors, Seq)
+            assert Matcher.end(Seq.encode('ascii')) == Expected, (Primer, Errors, Seq)
+
+def test_long_primers_and_many_errors():
+    Random = random.Random(1)
+    #Scores of these pass 255, so lanes are more than one byte wide
+    for Length, Errors in ((60, 5), (130, 2), (90, 40)):
+        Primer = ''.join(Random.choice('ACGTRYN') for n in range(Length))
+        Matcher = PrimerMatcher(Primer, Errors)
+        for n in range(200):
+            Seq = RandomRead(Random, Primer, Errors, Random.randint(Length, Length + 80))
+            assert Matcher.search(Seq) == PlainSearch(Primer, Errors, Seq)
+            assert Matcher.search(Seq.encode('ascii')) == PlainSearch(Primer, Errors, Seq)
+
+def test_search_range():
+    Matcher = PrimerMatcher('CYCTHCTAGG', 2)
+    Seq = 'AAAACTCTACTAGGAAAACCCTACTAGGAAAA'
+    assert Matcher.search(Seq) == (4, 14, 0)
+    assert Matcher.search(Seq, 5) == (18, 28, 0)
+    assert Matcher.search(Seq, 5, 27) is None
+
+def test_primer_index():
+    Random = random.Random(2)
+    Matchers = [PrimerMatcher(Primer, 2) for Primer in Primers[:4]]
+    Index = PrimerIndex(Matchers)
+    for n in range(1000):
+        Seq = RandomRead(Random, Random.choice(Primers[:4]), 2, 60)
+        Best = None
+        for m, Matcher in enumerate(Matchers):
+            Hit = Matcher.search(Seq)
+            if Hit is not None and (Best is None or (Hit[2], Hit[0]) < (Best[1][2], Best[1][0])):
+                Best = m, Hit
+        assert Index.search(Seq) == Best
+
+def test_window_search():
+    Matcher = PrimerMatcher('CYCTHCTAGG', 1)
+    Window = LearnWindow([4] * 100)
+    assert Window == (2, 6)
+    assert WindowSearch(Matcher, 'AAAACTCTACTAGGAAAA', Window) == ((4, 14, 0), False)
+    assert WindowSearch(Matcher, 'A' * 20 + 'CTCTACTAGG', Window) == ((20, 30, 0), True)
+    assert LearnWindow([4] * 10) is None
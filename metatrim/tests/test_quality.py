@@ -0,0 +1,47 @@
+"""
+QualityFilter on reads worked out by hand, and with NumPy against without it.
+"""
+
+import random
+
+import pytest
+
+import spacers
+from quality import QualityFilter
+
+#Quality string of Phred+33 scores
+def Qual(*Scores):
+    return bytes(Score + 33 for Score in Scores)
+
+def WithoutNumpy(monkeypatch):
+    monkeypatch.setattr(spacers, 'numpy', None, raising=False)
+    monkeypatch.setattr(spacers, 'NumpyChecked', True)
+
+@pytest.mark.parametrize('Numpy', [True, False])
+def test_by_hand(Numpy, monkeypatch):
+    if not Numpy:
+        WithoutNumpy(monkeypatch)
+    Seqs = [b'ACGTACGT', b'ACNNACGT', b'ACGTACGT', b'ACGTACGT', b'ACGTACGT']
+    Quals = [Qual(*[40] * 8), Qual(*[40] * 8), Qual(*[20] * 8), Qual(*[10] * 8), Qual(40, 40, 40, 40, 2, 40, 40, 40)]
+    #Expected errors are 8 * 0.01 for the third read, 8 * 0.1 for the fourth and about 0.63 for the last
+    Lengths, Fails = QualityFilter(MaxEE=1, MinQual=15, MaxN=1).check(Seqs, Quals)
+    assert Lengths == [8] * 5
+    assert Fails == [0, 1, 0, 2, 0]
+    Lengths, Fails = QualityFilter(MaxEE=0.05).check(Seqs, Quals)
+    assert Fails == [0, 0, 3, 3, 3]
+    #The last read is cut before its score of 2, which leaves it no expected error to speak of
+    Lengths, Fails = QualityFilter(MaxEE=0.05, TruncQ=3).check(Seqs, Quals)
+    assert Lengths == [8, 8, 8, 8, 4]
+    assert Fails == [0, 0, 3, 3, 0]
+    assert QualityFilter(MaxEE=1).check([], []) == ([], [])
+
+def test_numpy_agrees(monkeypatch):
+    pytest.importorskip('numpy')
+    Random = random.Random(0)
+    Seqs = [bytes(Random.choice(b'ACGTN') for n in range(Length)) for Length in range(1, 200)]
+    Quals = [bytes(Random.randint(35, 74) for n in Seq) for Seq in Seqs]
+    Filters = [QualityFilter(MaxEE=2), QualityFilter(MinQual=25, TruncQ=5), QualityFilter(MaxN=1, TruncQ=10), \
+        QualityFilter(MaxEE=1, MinQual=20, TruncQ=8, MaxN=0)]
+    Results = [Filter.check(Seqs, Quals) for Filter in Filters]
+    WithoutNumpy(monkeypatch)
+    assert Results == [Filter.check(Seqs, Quals) for Filter in Filters]
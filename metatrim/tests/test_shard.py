@@ -0,0 +1,46 @@
+"""
+Claims of sharded runs, and how a node carries on when a sample it claimed fails.
+"""
+
+import metatrim
+from metatrim import TrimShard
+from shard import ShardClaims
+
+Parameters = {'PrimerSets': [['CYPPART', ['A', 'C'], 150]], 'ErrF': 2, 'ErrR': 2}
+
+#Tasks as MetaTrimAll makes them, for samples named s0, s1, ...
+def Tasks(Count):
+    return [((('s%d_S1_L001_R1_001.fastq' % n, 's%d_S1_L001_R2_001.fastq' % n), {}, None)) for n in range(Count)]
+
+#Stands in for TrimSample, failing on sample s1
+def FailOne(Task):
+    InF = Task[0][0]
+    if InF.startswith('s1_'):
+        raise OSError('cannot read ' + InF)
+    return ['%s\t1' % InF.split('_')[0]], [], []
+
+def test_claims(tmp_path):
+    First = ShardClaims(str(tmp_path), Parameters, 'a')
+    Second = ShardClaims(str(tmp_path), Parameters, 'b')
+    assert First.claim('s0')
+    assert not Second.claim('s0')
+    First.release('s0')
+    assert Second.claim('s0')
+    Second.finish('s0', {'Rows': ['s0\t1']})
+    assert First.done('s0') and not First.claim('s0')
+    assert First.fragment('s0')['Node'] == 'b'
+    #Other settings make other claims
+    assert ShardClaims(str(tmp_path), dict(Parameters, ErrF=3), 'c').claim('s0')
+
+def test_failed_sample_is_released(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(metatrim, 'TrimSample', FailOne)
+    for Jobs in (1, 2):
+        Claims = ShardClaims(str(tmp_path / str(Jobs)), Parameters, 'a')
+        TrimShard(Claims, Tasks(4), Jobs)
+        Claims.close()
+        assert [Claims.done('s%d' % n) for n in range(4)] == [True, False, True, True]
+        #Another node can claim the failed sample
+        assert ShardClaims(Claims.Dir, Parameters, 'b').claim('s1')
+        Out = capsys.readouterr().out
+        assert 'could not trim s1' in Out
+        assert 'trimmed 3 samples' in Out
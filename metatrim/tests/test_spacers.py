@@ -0,0 +1,50 @@
+"""
+SpacerClassifier, with and without NumPy, against the spacer regexes of the first MetaTrim.
+"""
+
+import random
+import re
+
+import pytest
+
+import spacers
+from spacers import SpacerClassifier, FSpacers, RSpacers
+
+#The first MetaTrim's regex of a spacer, matching it with up to one base replaced
+def OldRegex(Spacer):
+    Variants = [Spacer] + [Spacer[:n] + '[ATCGN]' + Spacer[n + 1:] for n in range(len(Spacer))]
+    return re.compile('(' + '|'.join(Variants) + ')')
+
+#Reads starting with a spacer or a spacer with one or two bases replaced, and a few reads too short
+#to hold a spacer
+def RandomReads(Random, Spacers, Count):
+    Reads = []
+    for n in range(Count):
+        Lead = list(Random.choice(list(Spacers.values())))
+        for m in range(Random.choice((0, 0, 1, 1, 2))):
+            Lead[Random.randrange(len(Lead))] = Random.choice('ACGTNX.')
+        Read = ''.join(Lead) + 'ACGT' * 5
+        Reads.append(Read[:Random.randint(0, 3)] if Random.random() < 0.05 else Read)
+    return Reads
+
+@pytest.mark.parametrize('Numpy', [True, False])
+def test_matches_old_regexes(Numpy, monkeypatch):
+    if Numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(spacers, 'numpy', None, raising=False)
+        monkeypatch.setattr(spacers, 'NumpyChecked', True)
+    Random = random.Random(0)
+    for Spacers in (FSpacers, RSpacers):
+        Labels = list(Spacers)
+        Regexes = [OldRegex(Spacers[Label]) for Label in Labels]
+        Classifier = SpacerClassifier(Spacers)
+        Reads = RandomReads(Random, Spacers, 2000)
+        Expected = [next((n for n, Regex in enumerate(Regexes) if Regex.match(Read)), -1) for Read in Reads]
+        assert Classifier.classify(Reads) == Expected
+        assert Classifier.classify([Read.encode('ascii') for Read in Reads]) == Expected
+        for Label in Labels:
+            assert Classifier.matches(Reads, Label) == [bool(Regexes[Labels.index(Label)].match(Read)) \
+                for Read in Reads]
+        Tally = Classifier.tally(Reads)
+        assert [Tally[Label] for Label in Labels] == [Expected.count(n) for n in range(len(Labels))]